@@ -0,0 +1,56 @@
+"""
+Throughput degli embedding dello step 3: frasi/s con model.encode a batch
+fissi (comportamento precedente) e con BatchEmbedder (batch per lunghezza
+con budget di token). Stampa anche la differenza massima tra i due risultati.
+
+Uso (dalla root del repository, su CPU):
+    python -m benchmarks.bench_batch_embedder cartella/transcript_2_raw_aligned.csv --limit 2000
+"""
+import argparse
+import time
+import numpy as np
+import torch
+from sentence_transformers import SentenceTransformer
+import config
+from transcript_pipeline.modules.batch_embedder import BatchEmbedder
+from transcript_pipeline.modules.chunkers import TokenAwareSemanticChunker
+from transcript_pipeline.utils.file_utils import load_text
+from transcript_pipeline.utils.text_utils import sentences_divider
+
+
+def main(args):
+    torch.set_num_threads(args.threads or torch.get_num_threads())
+    model = SentenceTransformer(args.model, device="cpu")
+
+    # Frasi contestuali come in split(), segmentate con la regex per non dipendere da spaCy
+    sentences = sentences_divider(load_text(args.raw_csv))[:args.limit]
+    chunker = TokenAwareSemanticChunker(model)
+    texts = chunker._create_contextual_sentences(sentences)
+    print(f"Frasi: {len(texts)}, modello: {args.model}, thread: {torch.get_num_threads()}")
+
+    start = time.perf_counter()
+    baseline = model.encode(texts, batch_size=args.batch_size, normalize_embeddings=True)
+    t_baseline = time.perf_counter() - start
+
+    embedder = BatchEmbedder(model, args.token_budget, args.max_batch_size)
+    start = time.perf_counter()
+    bucketed = embedder.encode(texts)
+    t_bucketed = time.perf_counter() - start
+
+    print(f"{'metodo':>28} {'tempo (s)':>10} {'frasi/s':>9}")
+    print(f"{f'encode(batch_size={args.batch_size})':>28} {t_baseline:>10.1f} {len(texts) / t_baseline:>9.1f}")
+    print(f"{f'BatchEmbedder({args.token_budget} tok)':>28} {t_bucketed:>10.1f} {len(texts) / t_bucketed:>9.1f}")
+    print(f"Differenza massima tra gli embedding: {np.abs(baseline - bucketed).max():.2e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Frasi/s degli embedding con e senza batch per lunghezza.")
+    parser.add_argument("raw_csv", type=str, help="CSV dello step 2 (colonna text).")
+    parser.add_argument("--model", type=str, default=config.EMBEDDING_MODEL)
+    parser.add_argument("--limit", type=int, default=2000, help="Numero massimo di frasi.")
+    parser.add_argument("--batch_size", type=int, default=32, help="Batch fisso del confronto (default di encode).")
+    parser.add_argument("--token_budget", type=int, default=config.EMBEDDING_TOKEN_BUDGET)
+    parser.add_argument("--max_batch_size", type=int, default=config.EMBEDDING_MAX_BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=None, help="Thread CPU di torch.")
+
+    main(parser.parse_args())
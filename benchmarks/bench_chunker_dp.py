@@ -0,0 +1,113 @@
+"""
+Benchmark della programmazione dinamica di TokenAwareSemanticChunker.
+
+Confronta, su trascrizioni sintetiche di dimensione crescente, l'implementazione
+originale (doppio ciclo Python + diagonale di cosine_distances) con quella
+attuale (gap riga per riga + finestre trovate con searchsorted) e verifica che
+i confini dei chunk coincidano. Non servono modelli: token ed embedding sono
+generati casualmente.
+
+Uso (dalla root del repository):
+    python -m benchmarks.bench_chunker_dp --sizes 1000 5000 10000
+"""
+import argparse
+import time
+import numpy as np
+from sklearn.metrics.pairwise import cosine_distances
+from transcript_pipeline.modules.chunkers import TokenAwareSemanticChunker
+
+
+def legacy_gaps(embeddings):
+    return np.diag(cosine_distances(embeddings[:-1], embeddings[1:]))
+
+
+def legacy_boundaries(token_counts, gaps, min_tokens, max_tokens):
+    """Copia del ciclo originale di split(), usata come riferimento."""
+    n = len(token_counts)
+    P = np.cumsum(token_counts)
+
+    def get_chunk_len(start_idx, end_idx):
+        upper = P[end_idx]
+        lower = P[start_idx - 1] if start_idx > 0 else 0
+        return upper - lower
+
+    dp = np.full(n, -1.0)
+    parent = np.full(n, -1, dtype=int)
+
+    for i in range(n):
+        len_0_to_i = get_chunk_len(0, i)
+        if (min_tokens <= len_0_to_i <= max_tokens) or (i == 0 and len_0_to_i > max_tokens):
+            dp[i] = 0
+            parent[i] = -1
+
+        for j in range(i - 1, -1, -1):
+            current_len = get_chunk_len(j + 1, i)
+            if current_len > max_tokens and (j + 1) != i:
+                break
+            if current_len < min_tokens and current_len <= max_tokens:
+                continue
+            if dp[j] != -1.0:
+                score = dp[j] + gaps[j]
+                if current_len > max_tokens:
+                    score -= 0.1
+                if score > dp[i]:
+                    dp[i] = score
+                    parent[i] = j
+
+    if dp[n - 1] == -1.0:
+        return None
+    return parent
+
+
+def synthetic_transcript(num_sentences, dim, rng):
+    # Lunghezze tipiche delle frasi raggruppate (10-80 token) con qualche frase molto lunga
+    token_counts = rng.integers(10, 80, size=num_sentences)
+    token_counts[rng.random(num_sentences) < 0.002] = 3000
+    embeddings = rng.standard_normal((num_sentences, dim)).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return token_counts, embeddings
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+    chunker = TokenAwareSemanticChunker.__new__(TokenAwareSemanticChunker)
+    chunker.min_tokens = args.min_tokens
+    chunker.max_tokens = args.max_tokens
+
+    print(f"{'frasi':>7} {'gap legacy (s)':>15} {'gap nuovo (s)':>14} {'DP legacy (s)':>14} {'DP nuovo (s)':>13} {'uguali':>7}")
+    for size in args.sizes:
+        token_counts, embeddings = synthetic_transcript(size, args.dim, rng)
+
+        start = time.perf_counter()
+        old_gaps = legacy_gaps(embeddings)
+        t_old_gaps = time.perf_counter() - start
+
+        start = time.perf_counter()
+        new_gaps = chunker._adjacent_gaps(embeddings)
+        t_new_gaps = time.perf_counter() - start
+
+        # Stessi gap per entrambe le DP: il confronto riguarda solo la ricerca dei confini
+        start = time.perf_counter()
+        old_parent = legacy_boundaries(token_counts, new_gaps, args.min_tokens, args.max_tokens)
+        t_old_dp = time.perf_counter() - start
+
+        start = time.perf_counter()
+        new_parent = chunker._best_boundaries(token_counts, new_gaps)
+        t_new_dp = time.perf_counter() - start
+
+        same = (old_parent is None and new_parent is None) or (
+            old_parent is not None and new_parent is not None and np.array_equal(old_parent, new_parent)
+        )
+        assert np.allclose(old_gaps, new_gaps, atol=1e-5)
+        print(f"{size:>7} {t_old_gaps:>15.3f} {t_new_gaps:>14.3f} {t_old_dp:>14.3f} {t_new_dp:>13.3f} {str(same):>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark della DP di TokenAwareSemanticChunker.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 5000, 10000], help="Numeri di frasi da provare.")
+    parser.add_argument("--dim", type=int, default=768, help="Dimensione degli embedding sintetici.")
+    parser.add_argument("--min_tokens", type=int, default=1024, help="Come config.MIN_CHUNK_SIZE.")
+    parser.add_argument("--max_tokens", type=int, default=2048, help="Come config.MAX_CHUNK_SIZE.")
+    parser.add_argument("--seed", type=int, default=0)
+
+    main(parser.parse_args())
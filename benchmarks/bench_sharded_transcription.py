@@ -0,0 +1,44 @@
+"""
+Benchmark della trascrizione a shard: real-time factor al variare del numero di processi.
+
+Uso (dalla root del repository):
+    python -m benchmarks.bench_sharded_transcription percorso/audio.wav --shards 1 2 4 --model openai/whisper-tiny
+"""
+import argparse
+import os
+import time
+import config
+from transcript_pipeline.modules.transcriber import transcribe_parallel
+from transcript_pipeline.utils.audio_utils import open_wav_pcm, split_at_silence
+
+
+def main(args):
+    pcm, sample_rate = open_wav_pcm(args.audio_file)
+    duration = len(pcm) / sample_rate
+    total_threads = args.threads or os.cpu_count() or 1
+    overrides = {"TRANSCRIBER_MODEL": args.model} if args.model else None
+
+    print(f"Audio: {duration:.0f} s, thread totali: {total_threads}")
+    print(f"{'shard':>6} {'thread/shard':>13} {'tempo (s)':>10} {'RTF':>7} {'chunk':>7}")
+
+    for num_shards in args.shards:
+        shards = split_at_silence(pcm, sample_rate, num_shards, config.STREAM_SPLIT_SEARCH_S)
+        threads = max(1, total_threads // num_shards)
+
+        start = time.perf_counter()
+        results = transcribe_parallel(args.audio_file, shards, num_shards, threads, overrides=overrides)
+        num_chunks = sum(len(chunks) for chunks in results)
+        elapsed = time.perf_counter() - start
+
+        # RTF < 1: più veloce del tempo reale (include il caricamento dei modelli nei worker)
+        print(f"{num_shards:>6} {threads:>13} {elapsed:>10.1f} {elapsed / duration:>7.3f} {num_chunks:>7}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Real-time factor della trascrizione a shard.")
+    parser.add_argument("audio_file", type=str, help="WAV 16 kHz mono (es. extracted_audio.wav).")
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4], help="Numeri di shard da provare.")
+    parser.add_argument("--threads", type=int, default=None, help="Thread CPU totali da dividere tra gli shard.")
+    parser.add_argument("--model", type=str, default=None, help="Checkpoint Whisper alternativo (es. openai/whisper-tiny).")
+
+    main(parser.parse_args())
@@ -0,0 +1,81 @@
+"""
+Confronto dei backend del Transcriber: throughput (RTF) e WER.
+
+Il WER è calcolato rispetto a una trascrizione di riferimento (--reference)
+oppure, se assente, rispetto all'output del backend "torch". Con un
+checkpoint piccolo (es. openai/whisper-tiny) gira in pochi minuti su CPU.
+
+Uso (dalla root del repository):
+    python -m benchmarks.bench_transcriber_backends audio.wav --model openai/whisper-tiny --backends torch int8 onnx
+"""
+import argparse
+import re
+import time
+import config
+from transcript_pipeline.modules.transcriber import Transcriber
+from transcript_pipeline.utils.audio_utils import load_wav_waveform
+
+
+def _words(text):
+    return re.findall(r"\w+", text.lower())
+
+
+def word_error_rate(reference, hypothesis):
+    """WER = distanza di Levenshtein a livello di parola / parole del riferimento."""
+    ref, hyp = _words(reference), _words(hypothesis)
+    if not ref:
+        return float(len(hyp) > 0)
+
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, start=1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, start=1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word)
+            )
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def main(args):
+    waveform, sample_rate = load_wav_waveform(args.audio_file)
+    duration = len(waveform) / sample_rate
+    if args.model:
+        config.TRANSCRIBER_MODEL = args.model
+
+    reference = None
+    if args.reference:
+        with open(args.reference, "r", encoding="utf-8") as f:
+            reference = f.read()
+
+    print(f"Audio: {duration:.0f} s, modello: {config.TRANSCRIBER_MODEL}")
+    print(f"{'backend':>8} {'load (s)':>9} {'tempo (s)':>10} {'RTF':>7} {'WER':>7}")
+
+    for backend in args.backends:
+        config.TRANSCRIBER_BACKEND = backend
+
+        start = time.perf_counter()
+        transcriber = Transcriber(config)
+        load_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        text = transcriber.transcribe(waveform, sample_rate)["text"]
+        elapsed = time.perf_counter() - start
+
+        if reference is None:
+            # Senza riferimento il primo backend fa da baseline per gli altri
+            reference = text
+        wer = word_error_rate(reference, text)
+        print(f"{backend:>8} {load_time:>9.1f} {elapsed:>10.1f} {elapsed / duration:>7.3f} {wer:>7.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput e WER dei backend del Transcriber.")
+    parser.add_argument("audio_file", type=str, help="WAV 16 kHz mono.")
+    parser.add_argument("--backends", type=str, nargs="+", default=["torch", "int8", "onnx"], help="Backend da confrontare.")
+    parser.add_argument("--model", type=str, default=None, help="Checkpoint Whisper (es. openai/whisper-tiny).")
+    parser.add_argument("--reference", type=str, default=None, help="File di testo con la trascrizione di riferimento.")
+
+    main(parser.parse_args())
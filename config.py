@@ -9,8 +9,36 @@ YDL_OPT = {
     'outtmpl': '%(title)s.%(ext)s',
     
     'cookiefile': COOKIES_FILE,
-    'noplaylist': True
+    'noplaylist': True,
+    # Riprende i file .part lasciati da un download interrotto
+    'continuedl': True
 }
+# Se True lo step 0 scarica solo la migliore traccia audio (niente stream video né merge in MP4)
+DOWNLOAD_AUDIO_ONLY = False
+YDL_OPT_AUDIO = {
+    'format': 'bestaudio/best',
+
+    'outtmpl': '%(title)s.%(ext)s',
+
+    'cookiefile': COOKIES_FILE,
+    'noplaylist': True,
+    'continuedl': True
+}
+# Download contemporanei con --manifest (ogni worker riusa la propria sessione yt-dlp)
+DOWNLOAD_CONCURRENCY = 3
+# Nomi dei file (e quindi delle cartelle) con --manifest: l'id evita collisioni tra lezioni con lo stesso titolo
+DOWNLOAD_MANIFEST_OUTTMPL = '%(title)s [%(id)s].%(ext)s'
+# File scritto nella cartella della lezione a download completato (contiene l'id del video)
+DOWNLOAD_MARKER_FILE = ".download_complete.json"
+
+# Impostazioni Audio
+AUDIO_SAMPLE_RATE = 16000
+# Se True lo step 1 non scrive il WAV: lo step 2 legge il PCM direttamente dallo stdout di ffmpeg
+AUDIO_STREAMING = False
+# In modalità streaming salva comunque una copia FLAC compressa dell'audio (riusabile come cache)
+AUDIO_STREAM_FLAC_COPY = True
+# Processi ffmpeg in parallelo per l'estrazione del WAV (1 = un solo processo)
+AUDIO_EXTRACTION_WORKERS = 1
 
 # Impostazioni Modelli
 TOKENIZER_MODEL = "google/gemma-3-12b-it"
@@ -18,22 +46,113 @@ models_tested = ["ollama_chat/gemma3:12b-it-qat", "ollama_chat/gemma3:4b", "gemi
 CLEANER_MODEL_OLLAMA = "ollama_chat/gemma3:12b-it-qat"
 API_KEY = "fake-key"
 OLLAMA_API_BASE = "http://localhost:11434"
+# Più istanze Ollama per lo step 4: lista di {"api_base": ..., "model": ...} ("model" facoltativo,
+# default CLEANER_MODEL_OLLAMA; es. uno dei models_tested). Vuota = solo OLLAMA_API_BASE
+CLEANER_ENDPOINTS = []
+# Errori consecutivi dopo cui un endpoint esce dalla rotazione e per quanti secondi
+CLEANER_ENDPOINT_MAX_FAILURES = 2
+CLEANER_ENDPOINT_COOLDOWN_S = 60
 
 # Modelli per la trascrizione e diarizzazione
 TRANSCRIBER_MODEL = "openai/whisper-large-v3"
 FORCED_LANGUAGE = "it"
 DIARIZATION_MODEL = "pyannote/speaker-diarization"
+# Numero di speaker: "diarize" (diarizzazione completa, come in origine), "auto" (stima rapida con
+# embedding, salta pyannote se c'è un solo speaker) o "single" (forza speaker unico)
+SPEAKER_COUNT_MODE = "diarize"
+SPEAKER_EMBEDDING_MODEL = "pyannote/wespeaker-voxceleb-resnet34-LM"
+# Finestre campionate (numero e durata in s) e distanza coseno massima per dichiarare un solo speaker
+SINGLE_SPEAKER_SAMPLES = 20
+SINGLE_SPEAKER_WINDOW_S = 3.0
+SINGLE_SPEAKER_MAX_DISTANCE = 0.5
+SINGLE_SPEAKER_LABEL = "SPEAKER_00"
+# Backend di inferenza Whisper: "torch", "int8" (quantizzazione dinamica, solo CPU) o "onnx" (richiede optimum[onnxruntime])
+TRANSCRIBER_BACKEND = "torch"
+# Cartella in cui il modello viene esportato in ONNX una sola volta (riusata da tutti i Transcriber)
+ONNX_EXPORT_DIR = ".cache/onnx"
+# True = timestamp per segmento, "word" = timestamp per parola (attribuzione speaker più fine)
+TRANSCRIBER_TIMESTAMPS = True
+# Pausa massima (s) tra parole consecutive dello stesso speaker per unirle in una riga
+WORD_MERGE_MAX_GAP_S = 1.0
+
+# Guard contro i loop di ripetizione di Whisper: interrompe la decodifica quando lo stesso
+# n-gramma (fino a REPETITION_MAX_NGRAM token) si ripete almeno REPETITION_MIN_REPEATS volte
+REPETITION_GUARD_ENABLED = True
+REPETITION_MAX_NGRAM = 6
+REPETITION_MIN_REPEATS = 4
+REPETITION_MIN_SPAN_TOKENS = 16
+# Fallback di temperatura: ridecodifica se il rapporto di compressione supera la soglia (None = disattivo)
+REPETITION_FALLBACK_TEMPERATURES = (0.0, 0.2, 0.4, 0.6)
+REPETITION_COMPRESSION_RATIO = 2.4
+
+# Pre-passaggio VAD a energia: rimuove i silenzi lunghi prima di Whisper
+# (cambia trascrizioni e timestamp rispetto al default, va attivato esplicitamente)
+VAD_ENABLED = False
+# Un frame è silenzio se sotto questa soglia (dBFS) e almeno VAD_SPEECH_MARGIN_DB sotto il livello del parlato
+VAD_THRESHOLD_DB = -40.0
+VAD_SPEECH_MARGIN_DB = 30.0
+# Durata minima (s) di un silenzio da rimuovere e margine (s) lasciato attorno al parlato
+VAD_MIN_SILENCE_S = 2.0
+VAD_PADDING_S = 0.3
+
+# Esecuzione step 2: diarizzazione in un processo separato, in parallelo alla trascrizione
+STEP2_CONCURRENT = False
+# Thread torch del processo di diarizzazione e della trascrizione (None = metà dei core a testa)
+DIARIZATION_NUM_THREADS = None
+TRANSCRIPTION_NUM_THREADS = None
+# Numero di processi Whisper paralleli (shard tagliati nei silenzi); 1 = un solo processo
+TRANSCRIBER_NUM_SHARDS = 1
+# Thread torch per processo (None = thread disponibili divisi per il numero di shard)
+TRANSCRIBER_SHARD_THREADS = None
+# Trascrizione a finestre con scrittura incrementale del CSV (memoria costante)
+TRANSCRIPTION_STREAMING = False
+# Durata massima (s) di una finestra e margine (s) in cui cercare il silenzio per tagliarla
+STREAM_WINDOW_S = 300
+STREAM_SPLIT_SEARCH_S = 10
+# Salva per finestra trascrizione e diarizzazione accanto al WAV per riprendere uno step 2 interrotto
+# (attiva automaticamente la modalità a finestre)
+STEP2_CHECKPOINTS = False
+# Cache dei risultati dello step 2 indicizzata per hash dell'audio e modelli (eviction LRU)
+TRANSCRIPTION_CACHE_ENABLED = True
+TRANSCRIPTION_CACHE_DIR = ".cache/transcriptions"
+TRANSCRIPTION_CACHE_MAX_MB = 512
 
 # Modello Spacy
 SPACY_MODEL = "it_core_news_lg"
+# Step 3: carica solo la segmentazione in frasi (senter) e legge il CSV a blocchi con nlp.pipe
+SPACY_SEGMENTATION_ONLY = True
+SPACY_BATCH_SIZE = 64
+SPACY_N_PROCESS = 1
 
 # Modello Embedding
 EMBEDDING_MODEL = "intfloat/multilingual-e5-large-instruct"
+# Cache persistente degli embedding delle frasi (step 3): i rerun ricalcolano solo le frasi nuove
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_DIR = ".cache/embeddings"
+# Batch degli embedding raggruppati per lunghezza: token (padding incluso) per batch e righe massime
+EMBEDDING_TOKEN_BUDGET = 16384
+EMBEDDING_MAX_BATCH_SIZE = 256
 
 # Parametri Semantic Chunking
 MIN_CHUNK_SIZE = 1024
 MAX_CHUNK_SIZE = 2048
+# Tokenizer con cui misurare i chunk: "embedder" (EMBEDDING_MODEL) oppure "cleaner" (TOKENIZER_MODEL,
+# così i chunk sono dimensionati sui token reali del LLM e confrontabili con MAX_TOKENS_CLEANER)
+CHUNK_TOKENIZER = "embedder"
 
 # Parametri Chimate al Modello
 MAX_TOKENS_CLEANER = 7000
-TEMPERATURE_CLEANER = 0.0
\ No newline at end of file
+TEMPERATURE_CLEANER = 0.0
+# Richieste al cleaner contemporanee (per endpoint), timeout per richiesta (s) e retry con backoff esponenziale
+CLEANER_CONCURRENCY = 4
+CLEANER_TIMEOUT_S = 300
+CLEANER_MAX_RETRIES = 3
+CLEANER_RETRY_BACKOFF_S = 2.0
+# Cache su disco (SQLite) delle risposte del cleaner: limite di spazio (MB, LRU) ed età massima (giorni)
+LLM_CACHE_ENABLED = True
+LLM_CACHE_PATH = ".cache/llm_responses.sqlite"
+LLM_CACHE_MAX_MB = 256
+LLM_CACHE_MAX_AGE_DAYS = 90
+# Step 4: unisce i chunk sotto CLEANER_PACK_MIN_TOKENS e spezza quelli oltre MAX_TOKENS_CLEANER (prompt incluso)
+CLEANER_PACKING = True
+CLEANER_PACK_MIN_TOKENS = 512
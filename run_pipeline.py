@@ -1,8 +1,10 @@
 import os
 import argparse
 import torch
+import config
 from pathlib import Path
 from transcript_pipeline.utils.text_utils import count_tokens_with_tiktoken
+from transcript_pipeline.modules.download_manager import read_manifest
 from transcript_pipeline.steps import (
     step_0_download,
     step_1_audio_extraction,
@@ -24,21 +26,26 @@ class PipelineContext:
         self._raw_csv = None
         self._chunked_csv = None
 
-    def _resolve(self, value, glob_pattern: str, desc: str) -> str:
+    # Il "video" può essere anche la sola traccia audio (DOWNLOAD_AUDIO_ONLY)
+    MEDIA_PATTERNS = ("*.mp4", "*.m4a", "*.webm", "*.opus", "*.mp3")
+
+    def _resolve(self, value, glob_pattern, desc: str) -> str:
         """Logica centrale: se il valore c'è, usalo. Se no, cercalo su disco."""
         if value:
             return value
         
-        found = list(self.folder.glob(glob_pattern))
-        if found:
-            print(f"   [Context] Recuperato {desc} da disco: {found[0].name}")
-            return str(found[0])
+        patterns = (glob_pattern,) if isinstance(glob_pattern, str) else glob_pattern
+        for pattern in patterns:
+            found = list(self.folder.glob(pattern))
+            if found:
+                print(f"   [Context] Recuperato {desc} da disco: {found[0].name}")
+                return str(found[0])
         
-        raise FileNotFoundError(f"Impossibile trovare {desc} (pattern: {glob_pattern}) in {self.folder}")
+        raise FileNotFoundError(f"Impossibile trovare {desc} (pattern: {', '.join(patterns)}) in {self.folder}")
 
     @property
     def video_file(self) -> str:
-        return self._resolve(self._video_file, "*.mp4", "Video File")
+        return self._resolve(self._video_file, self.MEDIA_PATTERNS, "Video File")
 
     @video_file.setter
     def video_file(self, value):
@@ -70,8 +77,8 @@ class PipelineContext:
 
 
 def main(args):
-    if not args.url and not args.folder_name:
-        raise ValueError("ERRORE: Serve --folder_name o --url.")
+    if not args.url and not args.folder_name and not args.manifest:
+        raise ValueError("ERRORE: Serve --folder_name, --url o --manifest.")
 
     base_folder = Path('.') / args.folder_name if args.folder_name else Path('.')
     ctx = PipelineContext(base_folder)
@@ -89,9 +96,13 @@ def main(args):
 
     def run_step_2(ctx):
         print("--- Step 2: Trascrizione ---")
-        csv_path = step_2_transcription.run(ctx.audio_file)
+        if config.AUDIO_STREAMING:
+            csv_path = step_2_transcription.run_from_video(ctx.video_file)
+        else:
+            csv_path = step_2_transcription.run(ctx.audio_file)
         ctx.raw_csv = csv_path
-        count_tokens_with_tiktoken(ctx.raw_csv)
+        num_tokens = count_tokens_with_tiktoken(ctx.raw_csv)
+        print(f"   Token nella trascrizione (tiktoken): {num_tokens}")
         torch.cuda.empty_cache()
 
     def run_step_3(ctx):
@@ -113,6 +124,24 @@ def main(args):
         run_step_4
     ]
 
+    if args.manifest:
+        # Download concorrente di tutto il catalogo, poi gli step successivi lezione per lezione
+        print("--- Step 0: Download (manifest) ---")
+        urls = read_manifest(args.manifest)
+        video_paths, duplicates = step_0_download.run_many(urls)
+        for url, video_path in zip(urls, video_paths):
+            if video_path is None:
+                if url in duplicates:
+                    print(f"URL duplicato (video {duplicates[url]} già nel manifest), saltato: {url}")
+                else:
+                    print(f"Download non riuscito, lezione saltata: {url}")
+                continue
+            lecture_ctx = PipelineContext(Path(os.path.dirname(video_path)))
+            lecture_ctx.video_file = video_path
+            for step_func in pipeline_steps[max(args.step, 1):]:
+                step_func(lecture_ctx)
+        return
+
     steps_to_run = pipeline_steps[args.step:]
 
     if not steps_to_run:
@@ -126,6 +155,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Esegue la pipeline di trascrizione.")
     parser.add_argument("--folder_name", type=str, default=None, help="Cartella dei file di input (necessaria se non si parte con un URL).")
     parser.add_argument("--url", type=str, default=None, help="URL del video da scaricare (solo per step 0).")
+    parser.add_argument("--manifest", type=str, default=None, help="File con un URL per riga da scaricare in parallelo (sostituisce --url).")
     parser.add_argument("--step", type=int, default=0, help="Step da cui iniziare la pipeline.")
 
     args = parser.parse_args()
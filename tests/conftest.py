@@ -0,0 +1,113 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+# I test importano `config` e `transcript_pipeline` dalla radice del repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    """
+    Server LLM locale compatibile con l'API OpenAI (/v1/chat/completions),
+    usato al posto di Ollama nei test dello step 4.
+
+    `reply(testo)` riceve il campo di input della signature e restituisce il
+    campo di output, None per rispondere con un errore HTTP 500 oppure
+    UNPARSABLE per una risposta senza i campi attesi da dspy. `delay(testo)`
+    (secondi) rallenta la risposta; le prime `fail_first` richieste
+    ricevono un 503.
+    """
+
+    UNPARSABLE = object()
+    INPUT_PATTERN = re.compile(r"\[\[ ## testo_colloquiale ## \]\]\n(.*?)(?:\n\n\S.*)?$", re.DOTALL)
+
+    daemon_threads = True
+
+    def __init__(self, reply=str.upper, delay=None, fail_first=0):
+        super().__init__(("127.0.0.1", 0), _StubLLMHandler)
+        self.reply = reply
+        self.delay = delay
+        self.fail_first = fail_first
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def api_base(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def respond(self, prompt):
+        match = self.INPUT_PATTERN.search(prompt)
+        text = match.group(1) if match else prompt
+        with self._lock:
+            self.requests.append(text)
+            failing = len(self.requests) <= self.fail_first
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.delay is not None:
+                time.sleep(self.delay(text))
+            if failing:
+                return 503, None
+            output = self.reply(text)
+            if output is None:
+                return 500, None
+            if output is self.UNPARSABLE:
+                return 200, "Risposta senza alcun campo."
+            return 200, f"[[ ## testo_nozionistico ## ]]\n{output}\n\n[[ ## completed ## ]]"
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+class _StubLLMHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["messages"][-1]["content"]
+        status, content = self.server.respond(prompt)
+        if content is None:
+            payload = {"error": {"message": "errore del server di test", "type": "server_error"}}
+        else:
+            payload = {
+                "id": "stub", "object": "chat.completion", "created": int(time.time()), "model": body["model"],
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            }
+        data = json.dumps(payload).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            # Il client ha già chiuso la connessione (timeout)
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def llm_server():
+    """Avvia server LLM di test in thread locali; vengono chiusi a fine test."""
+    servers = []
+
+    def start(**kwargs):
+        server = StubLLMServer(**kwargs)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return server
+
+    start.UNPARSABLE = StubLLMServer.UNPARSABLE
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,87 @@
+import random
+from transcript_pipeline.modules.aligner import SpeakerAligner
+
+
+def legacy_align(diarization_segments, transcription_chunks):
+    """Allineamento originale dello step 2: ogni chunk confrontato con ogni turno."""
+    speakers = []
+    for chunk in transcription_chunks:
+        chunk_start, chunk_end = chunk["timestamp"]
+        if not chunk["text"].strip():
+            continue
+        overlaps = {}
+        for turn_start, turn_end, speaker in diarization_segments:
+            overlap_duration = min(chunk_end, turn_end) - max(chunk_start, turn_start)
+            if overlap_duration > 0:
+                overlaps[speaker] = overlaps.get(speaker, 0) + overlap_duration
+        speakers.append((max(overlaps, key=overlaps.get) if overlaps else "UNKNOWN", overlaps))
+    return speakers
+
+
+def random_case(seed):
+    # Tempi arrotondati al decimo di secondo, come i timestamp di Whisper:
+    # produce molti pareggi esatti o quasi tra speaker
+    rng = random.Random(seed)
+    segments = []
+    t = 0.0
+    for _ in range(rng.randint(0, 30)):
+        start = round(rng.uniform(0, 100), 1) if rng.random() < 0.3 else t
+        end = start + round(rng.uniform(0, 10), 1)
+        segments.append((start, end, rng.choice("ABC")))
+        t = end + round(rng.uniform(-2, 3), 1)
+    if rng.random() < 0.5:
+        segments.sort()
+    chunks = []
+    for _ in range(rng.randint(0, 20)):
+        start = round(rng.uniform(0, 110), 1)
+        chunks.append({"text": "x", "timestamp": (start, start + round(rng.uniform(0, 8), 1))})
+    return segments, chunks
+
+
+def test_matches_legacy_alignment():
+    """
+    SpeakerAligner deve scegliere uno speaker con la stessa sovrapposizione
+    massima dell'implementazione originale, a meno di TIE_TOLERANCE.
+
+    Le scelte possono differire solo nei quasi-pareggi: il vecchio `max`
+    confronta le somme in virgola mobile in modo stretto (0.30000000000000004
+    batte 0.3), mentre l'indice considera pari sovrapposizioni entro
+    TIE_TOLERANCE e sceglie lo speaker del primo turno sovrapposto. Su questi
+    3000 casi succede in poche decine di chunk (35 con questi seed).
+    """
+    near_ties = 0
+    for seed in range(3000):
+        segments, chunks = random_case(seed)
+        rows = SpeakerAligner(segments).align(chunks)
+        legacy = legacy_align(segments, chunks)
+        assert len(rows) == len(legacy)
+
+        for row, (legacy_speaker, overlaps) in zip(rows, legacy):
+            if not overlaps:
+                assert row["speaker"] == "UNKNOWN"
+                continue
+            assert max(overlaps.values()) - overlaps[row["speaker"]] <= SpeakerAligner.TIE_TOLERANCE
+            if row["speaker"] != legacy_speaker:
+                near_ties += 1
+
+    assert near_ties < 100
+
+
+def test_tie_goes_to_first_overlapping_turn():
+    segments = [(0.0, 1.0, "B"), (1.0, 2.0, "A")]
+    rows = SpeakerAligner(segments).align([{"text": "ciao", "timestamp": (0.5, 1.5)}])
+    assert rows[0]["speaker"] == "B"
+
+
+def test_open_ended_chunk_and_word_merge():
+    segments = [(0.0, 5.0, "A"), (5.0, 9.0, "B")]
+    chunks = [
+        {"text": " buon", "timestamp": (0.0, 0.4)},
+        {"text": " giorno", "timestamp": (0.5, 1.0)},
+        {"text": " a tutti", "timestamp": (6.0, None)},
+    ]
+    rows = SpeakerAligner(segments).align(chunks, merge_words=True, max_word_gap=1.0)
+    assert [(r["speaker"], r["text"], r["end_time"]) for r in rows] == [
+        ("A", "buon giorno", 1.0),
+        ("B", "a tutti", 9.0),
+    ]
@@ -0,0 +1,30 @@
+import pytest
+from transcript_pipeline.utils.audio_utils import build_cmd
+
+
+def template(start_time, end_time):
+    return {
+        'video_path': "lezione.mp4",
+        'output_path': "extracted_audio.wav",
+        'start_time': start_time,
+        'end_time': end_time,
+    }
+
+
+@pytest.mark.parametrize("start_time, end_time", [
+    (90, 150.5),
+    ("00:01:30", "00:02:30.5"),
+    ("01:30", 150.5),
+])
+def test_segment_is_seeked_on_input_with_duration(start_time, end_time):
+    cmd = build_cmd(template(start_time, end_time))
+    # -ss prima di -i e fine espressa come durata
+    assert cmd.index('-ss') < cmd.index('-i')
+    assert cmd[cmd.index('-ss') + 1] == str(start_time)
+    assert cmd[cmd.index('-t') + 1] == "60.500"
+
+
+def test_whole_file_without_times():
+    cmd = build_cmd(template(None, None))
+    assert '-ss' not in cmd and '-t' not in cmd
+    assert cmd[-2:] == ["extracted_audio.wav", '-y']
@@ -0,0 +1,29 @@
+from transcript_pipeline.modules.chunk_journal import ChunkJournal
+
+
+def test_resume_after_truncated_last_line(tmp_path):
+    path = tmp_path / "cleaned.csv.journal.jsonl"
+    sources = {1: "primo chunk", 2: "secondo chunk", 3: "terzo chunk"}
+
+    journal = ChunkJournal(str(path))
+    journal.append(1, sources[1], "Primo.")
+    journal.append(2, sources[2], "Secondo.")
+    journal.close()
+    # Crash durante la scrittura della seconda voce
+    path.write_bytes(path.read_bytes()[:-10])
+
+    journal = ChunkJournal(str(path))
+    assert journal.load(sources) == {1: "Primo."}
+    journal.append(2, sources[2], "Secondo.")
+    journal.append(3, sources[3], "Terzo.")
+    journal.close()
+
+    assert ChunkJournal(str(path)).load(sources) == {1: "Primo.", 2: "Secondo.", 3: "Terzo."}
+
+
+def test_entries_for_changed_sources_are_ignored(tmp_path):
+    path = tmp_path / "cleaned.csv.journal.jsonl"
+    journal = ChunkJournal(str(path))
+    journal.append(1, "testo originale", "Pulito.")
+    journal.close()
+    assert ChunkJournal(str(path)).load({1: "testo cambiato"}) == {}
@@ -0,0 +1,97 @@
+import os
+import pytest
+
+for module in ("dspy", "pandas", "tqdm", "spacy", "tiktoken"):
+    pytest.importorskip(module)
+
+import dspy
+import pandas as pd
+import config
+from transcript_pipeline.modules.cleaner import Cleaner
+from transcript_pipeline.modules.endpoint_pool import EndpointPool
+
+CHUNKS = ["uno", "due", "tre", "quattro", "cinque", "sei"]
+
+
+@pytest.fixture
+def cleaner_config(monkeypatch):
+    for name, value in {
+        "CLEANER_CONCURRENCY": 4,
+        "CLEANER_MAX_RETRIES": 3,
+        "CLEANER_RETRY_BACKOFF_S": 0.01,
+    }.items():
+        monkeypatch.setattr(config, name, value)
+    yield config
+    dspy.configure(lm=None)
+
+
+def use_server(server, monkeypatch):
+    # LM costruito come nello step 4: dalla config, con un solo endpoint
+    monkeypatch.setattr(config, "CLEANER_MODEL_OLLAMA", "openai/stub")
+    monkeypatch.setattr(config, "OLLAMA_API_BASE", server.api_base)
+    monkeypatch.setattr(config, "CLEANER_ENDPOINTS", [])
+    dspy.configure(lm=EndpointPool(config).endpoints[0].lm)
+
+
+def write_chunks(tmp_path):
+    input_csv = str(tmp_path / "chunks.csv")
+    pd.DataFrame({"chunk_id": range(1, len(CHUNKS) + 1), "text": CHUNKS}).to_csv(input_csv, index=False)
+    return input_csv, str(tmp_path / "cleaned.csv")
+
+
+def test_concurrent_results_keep_chunk_order(cleaner_config, llm_server, tmp_path, monkeypatch):
+    # Il primo chunk è il più lento: le risposte arrivano fuori ordine
+    server = llm_server(delay=lambda text: 0.5 if text == "uno" else 0.05)
+    use_server(server, monkeypatch)
+    input_csv, output_csv = write_chunks(tmp_path)
+
+    Cleaner(cleaner_config).clean_transcript(input_csv, output_csv)
+
+    assert pd.read_csv(output_csv)["text"].tolist() == [text.upper() for text in CHUNKS]
+    assert server.max_in_flight > 1
+    assert not os.path.exists(output_csv + ".journal.jsonl")
+
+
+def test_transient_errors_are_retried(cleaner_config, llm_server, tmp_path, monkeypatch):
+    server = llm_server(fail_first=2)
+    use_server(server, monkeypatch)
+    input_csv, output_csv = write_chunks(tmp_path)
+
+    Cleaner(cleaner_config).clean_transcript(input_csv, output_csv)
+
+    assert pd.read_csv(output_csv)["text"].tolist() == [text.upper() for text in CHUNKS]
+    assert len(server.requests) == len(CHUNKS) + 2
+
+
+# Errore del server oppure output vuoto: in entrambi i casi il chunk non va perso
+@pytest.mark.parametrize("failure", [None, ""])
+def test_failed_chunk_keeps_original_text(cleaner_config, llm_server, tmp_path, monkeypatch, failure):
+    monkeypatch.setattr(config, "CLEANER_MAX_RETRIES", 1)
+    server = llm_server(reply=lambda text: failure if text == "tre" else text.upper())
+    use_server(server, monkeypatch)
+    input_csv, output_csv = write_chunks(tmp_path)
+
+    Cleaner(cleaner_config).clean_transcript(input_csv, output_csv)
+
+    expected = [text if text == "tre" else text.upper() for text in CHUNKS]
+    assert pd.read_csv(output_csv)["text"].tolist() == expected
+    assert server.requests.count("tre") == 2
+    # Il journal resta per ritentare il chunk fallito al prossimo run
+    assert os.path.exists(output_csv + ".journal.jsonl")
+
+
+def test_retry_after_empty_output_reaches_the_server(cleaner_config, llm_server, tmp_path, monkeypatch):
+    seen = []
+
+    def reply(text):
+        seen.append(text)
+        return "" if text == "tre" and seen.count(text) == 1 else text.upper()
+
+    server = llm_server(reply=reply)
+    use_server(server, monkeypatch)
+    input_csv, output_csv = write_chunks(tmp_path)
+
+    Cleaner(cleaner_config).clean_transcript(input_csv, output_csv)
+
+    assert pd.read_csv(output_csv)["text"].tolist() == [text.upper() for text in CHUNKS]
+    assert server.requests.count("tre") == 2
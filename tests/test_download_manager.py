@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+import pytest
+
+for module in ("yt_dlp", "unidecode"):
+    pytest.importorskip(module)
+
+import config
+from transcript_pipeline.modules import download_manager as download_manager_module
+from transcript_pipeline.modules.download_manager import DownloadManager
+from transcript_pipeline.steps import step_0_download
+
+
+class FakeDownloader:
+    """VimeoDownloader senza rete: l'id è l'ultima parte dell'URL prima di '?'."""
+
+    instances = []
+    base_folder = None
+
+    def __init__(self, config, outtmpl=None):
+        self.threads = set()
+        self.downloads = []
+        FakeDownloader.instances.append(self)
+
+    def fetch_info(self, url, audio_only=False):
+        self.threads.add(threading.get_ident())
+        time.sleep(0.01)
+        return {"id": url.rsplit("/", 1)[-1].split("?")[0]}
+
+    def download(self, info_dict, audio_only=False):
+        self.threads.add(threading.get_ident())
+        self.downloads.append(info_dict["id"])
+        folder = os.path.join(self.base_folder, f"lezione [{info_dict['id']}]")
+        os.makedirs(folder, exist_ok=True)
+        file_path = os.path.join(folder, f"lezione [{info_dict['id']}].mp4")
+        with open(file_path, "wb") as f:
+            f.write(b"video")
+        return file_path
+
+
+@pytest.fixture
+def manager_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(download_manager_module, "VimeoDownloader", FakeDownloader)
+    monkeypatch.setattr(FakeDownloader, "instances", [])
+    monkeypatch.setattr(FakeDownloader, "base_folder", str(tmp_path))
+    monkeypatch.setattr(config, "DOWNLOAD_CONCURRENCY", 2)
+    monkeypatch.setattr(config, "DOWNLOAD_AUDIO_ONLY", False)
+    return config
+
+
+def downloads():
+    return [video_id for downloader in FakeDownloader.instances for video_id in downloader.downloads]
+
+
+def test_completed_ids_are_skipped_on_rerun(manager_config, tmp_path):
+    urls = ["https://vimeo.com/1", "https://vimeo.com/2"]
+    first = DownloadManager(manager_config, base_folder=str(tmp_path)).download_all(urls)
+    assert all(os.path.isfile(path) for path in first)
+    assert sorted(downloads()) == ["1", "2"]
+
+    FakeDownloader.instances = []
+    assert DownloadManager(manager_config, base_folder=str(tmp_path)).download_all(urls) == first
+    assert downloads() == []
+
+
+def test_duplicate_ids_are_reported_separately(manager_config, tmp_path):
+    urls = ["https://vimeo.com/1", "https://vimeo.com/2", "https://vimeo.com/1?autoplay=1"]
+    manager = DownloadManager(manager_config, base_folder=str(tmp_path))
+    paths = manager.download_all(urls)
+
+    assert paths[0] is not None and paths[1] is not None
+    assert paths[2] is None
+    assert manager.duplicates == {"https://vimeo.com/1?autoplay=1": "1"}
+    assert sorted(downloads()) == ["1", "2"]
+
+
+def test_one_downloader_per_thread(manager_config, tmp_path):
+    urls = [f"https://vimeo.com/{i}" for i in range(8)]
+    paths = DownloadManager(manager_config, base_folder=str(tmp_path)).download_all(urls)
+
+    assert all(path is not None for path in paths)
+    assert 1 <= len(FakeDownloader.instances) <= manager_config.DOWNLOAD_CONCURRENCY
+    # Ogni VimeoDownloader (e quindi ogni YoutubeDL) è usato da un solo thread
+    assert all(len(downloader.threads) == 1 for downloader in FakeDownloader.instances)
+    assert len({thread for downloader in FakeDownloader.instances for thread in downloader.threads}) == len(FakeDownloader.instances)
+
+
+def test_single_url_run_writes_marker(manager_config, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    file_path = step_0_download.run("https://vimeo.com/7")
+    assert os.path.isfile(os.path.join(os.path.dirname(file_path), config.DOWNLOAD_MARKER_FILE))
+
+    # Rerun senza --manifest: nessun nuovo download
+    FakeDownloader.instances = []
+    assert step_0_download.run("https://vimeo.com/7") == file_path
+    assert downloads() == []
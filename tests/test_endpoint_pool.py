@@ -0,0 +1,125 @@
+import time
+import pytest
+
+for module in ("dspy", "pandas", "tqdm", "spacy", "tiktoken"):
+    pytest.importorskip(module)
+
+import config
+from transcript_pipeline.modules.cleaner import Cleaner
+from transcript_pipeline.modules.endpoint_pool import EndpointPool
+
+CHUNKS = [f"chunk numero {i}" for i in range(1, 13)]
+
+
+@pytest.fixture
+def pool_config(monkeypatch):
+    for name, value in {
+        "CLEANER_MODEL_OLLAMA": "openai/stub",
+        "CLEANER_CONCURRENCY": 1,
+        "CLEANER_TIMEOUT_S": 10,
+        "CLEANER_MAX_RETRIES": 2,
+        "CLEANER_RETRY_BACKOFF_S": 0.01,
+        "CLEANER_ENDPOINT_MAX_FAILURES": 1,
+        "CLEANER_ENDPOINT_COOLDOWN_S": 60,
+    }.items():
+        monkeypatch.setattr(config, name, value)
+    return config
+
+
+def make_pool(pool_config, monkeypatch, api_bases):
+    monkeypatch.setattr(pool_config, "CLEANER_ENDPOINTS", [{"api_base": api_base} for api_base in api_bases])
+    return EndpointPool(pool_config)
+
+
+def clean(pool_config, pool):
+    return Cleaner(pool_config, pool=pool).clean_chunks(list(range(1, len(CHUNKS) + 1)), CHUNKS)
+
+
+def test_chunks_spread_across_endpoints(pool_config, llm_server, monkeypatch):
+    servers = [llm_server(delay=lambda text: 0.05) for _ in range(3)]
+    pool = make_pool(pool_config, monkeypatch, [server.api_base for server in servers])
+
+    cleaned, failed = clean(pool_config, pool)
+
+    assert failed == []
+    assert [cleaned[i] for i in range(1, len(CHUNKS) + 1)] == [text.upper() for text in CHUNKS]
+    assert all(server.requests for server in servers)
+    assert sum(len(server.requests) for server in servers) == len(CHUNKS)
+
+
+def test_faster_endpoint_gets_more_chunks(pool_config, llm_server, monkeypatch):
+    fast = llm_server(delay=lambda text: 0.02)
+    slow = llm_server(delay=lambda text: 0.4)
+    pool = make_pool(pool_config, monkeypatch, [fast.api_base, slow.api_base])
+
+    cleaned, failed = clean(pool_config, pool)
+
+    assert failed == []
+    assert len(fast.requests) > len(slow.requests)
+
+
+def test_unreachable_endpoint_leaves_rotation(pool_config, llm_server, monkeypatch):
+    server = llm_server()
+    # Porta chiusa: connessione rifiutata
+    down = llm_server()
+    down_api_base = down.api_base
+    down.shutdown()
+    down.server_close()
+    pool = make_pool(pool_config, monkeypatch, [down_api_base, server.api_base])
+
+    cleaned, failed = clean(pool_config, pool)
+
+    assert failed == []
+    assert len(cleaned) == len(CHUNKS)
+    assert len(server.requests) == len(CHUNKS)
+    assert pool.endpoints[0].cooldown_until > time.monotonic()
+
+
+def test_server_errors_and_timeouts_leave_rotation(pool_config, llm_server, monkeypatch):
+    monkeypatch.setattr(pool_config, "CLEANER_TIMEOUT_S", 0.5)
+    broken = llm_server(reply=lambda text: None)
+    hanging = llm_server(delay=lambda text: 2.0)
+    server = llm_server()
+    pool = make_pool(pool_config, monkeypatch, [broken.api_base, hanging.api_base, server.api_base])
+
+    cleaned, failed = clean(pool_config, pool)
+
+    assert failed == []
+    assert len(cleaned) == len(CHUNKS)
+    assert pool.endpoints[0].cooldown_until > time.monotonic()
+    assert pool.endpoints[1].cooldown_until > time.monotonic()
+    assert pool.endpoints[2].cooldown_until == 0.0
+
+
+def test_unparsable_output_keeps_endpoint_in_rotation(pool_config, llm_server, monkeypatch):
+    def reply(text):
+        return llm_server.UNPARSABLE if text == CHUNKS[0] else text.upper()
+
+    servers = [llm_server(reply=reply) for _ in range(2)]
+    pool = make_pool(pool_config, monkeypatch, [server.api_base for server in servers])
+
+    cleaned, failed = clean(pool_config, pool)
+
+    # Il chunk illeggibile fallisce, ma nessun endpoint esce dalla rotazione
+    assert failed == [1]
+    assert len(cleaned) == len(CHUNKS) - 1
+    assert all(endpoint.cooldown_until == 0.0 for endpoint in pool.endpoints)
+
+
+
+def test_retry_after_unparsable_reply_reaches_a_server(pool_config, llm_server, monkeypatch):
+    seen = []
+
+    def reply(text):
+        # Prima risposta illeggibile (con il fallback JSON di dspy), poi corretta
+        seen.append(text)
+        return llm_server.UNPARSABLE if seen.count(text) <= 2 else text.upper()
+
+    servers = [llm_server(reply=reply) for _ in range(2)]
+    pool = make_pool(pool_config, monkeypatch, [server.api_base for server in servers])
+
+    cleaned, failed = clean(pool_config, pool)
+
+    assert failed == []
+    assert [cleaned[i] for i in range(1, len(CHUNKS) + 1)] == [text.upper() for text in CHUNKS]
+    assert sum(len(server.requests) for server in servers) > len(CHUNKS)
@@ -0,0 +1,31 @@
+import pytest
+
+pd = pytest.importorskip("pandas")
+pytest.importorskip("tiktoken")
+
+from transcript_pipeline.utils.file_utils import iter_text_blocks
+
+
+def write_csv(path, texts):
+    pd.DataFrame({"speaker": "SPEAKER_00", "text": texts}).to_csv(path, index=False)
+
+
+def test_blocks_end_on_sentence_punctuation(tmp_path):
+    csv_path = tmp_path / "transcript.csv"
+    write_csv(csv_path, ["prima frase che continua", "nella riga dopo.", "seconda frase."])
+    assert list(iter_text_blocks(csv_path, block_chars=10)) == [
+        "prima frase che continua nella riga dopo.",
+        "seconda frase.",
+    ]
+
+
+def test_unpunctuated_transcript_is_capped(tmp_path):
+    # Righe di Whisper senza punteggiatura: senza limite diventerebbero un unico blocco
+    csv_path = tmp_path / "transcript.csv"
+    texts = [f"parola numero {i} senza punto" for i in range(2000)] + ["x" * 250]
+    write_csv(csv_path, texts)
+
+    blocks = list(iter_text_blocks(csv_path, block_chars=100, max_chars=1000))
+    assert len(blocks) > 1
+    assert all(len(block) <= 1000 for block in blocks)
+    assert " ".join(blocks).split() == " ".join(texts).split()
@@ -0,0 +1,114 @@
+import pytest
+
+for module in ("dspy", "pandas", "tqdm", "spacy", "tiktoken"):
+    pytest.importorskip(module)
+
+import dspy
+import pandas as pd
+import config
+from transcript_pipeline.modules.chunk_journal import ChunkJournal
+from transcript_pipeline.modules.cleaner import Cleaner
+from transcript_pipeline.modules.llm_cache import LLMResponseCache
+from transcript_pipeline.modules.request_packer import PackedResults, RequestPacker
+
+CHUNKS = ["primo chunk", "secondo chunk", "terzo chunk"]
+
+
+class WordCounter:
+    """Token counter di test: una parola, un token."""
+
+    def count(self, text):
+        return len(text.split())
+
+
+def make_packer():
+    return RequestPacker(WordCounter(), max_tokens=1000, min_tokens=50)
+
+
+def test_markers_split_the_merged_output():
+    packer = make_packer()
+    [request] = packer.pack([1, 2], CHUNKS[:2])
+    assert request.chunk_ids == [1, 2]
+
+    output = "[[CHUNK 1]]\nPrimo.\n[[CHUNK 2]]\nSecondo."
+    assert PackedResults(packer).add(request, output) == [(1, "Primo."), (2, "Secondo.")]
+
+
+@pytest.mark.parametrize("output", [
+    "testo senza marcatori",
+    "[[CHUNK 1]]\nPrimo.\n[[CHUNK 3]]\nSecondo.",
+    "[[CHUNK 1]]\nPrimo e secondo.\n[[CHUNK 2]]\n",
+])
+def test_unsplittable_output_is_not_assigned(output):
+    packer = make_packer()
+    [request] = packer.pack([1, 2], CHUNKS[:2])
+    assert PackedResults(packer).add(request, output) is None
+    assert request.texts == CHUNKS[:2]
+
+
+@pytest.fixture
+def cleaner_config(monkeypatch):
+    for name, value in {
+        "CLEANER_CONCURRENCY": 2,
+        "CLEANER_MAX_RETRIES": 1,
+        "CLEANER_RETRY_BACKOFF_S": 0.01,
+    }.items():
+        monkeypatch.setattr(config, name, value)
+    yield config
+    dspy.configure(lm=None)
+
+
+def drop_markers(text):
+    # Il modello unisce tutto e perde i marcatori
+    return " ".join(line.upper() for line in text.splitlines() if not line.startswith("[[CHUNK"))
+
+
+def use_server(server):
+    dspy.configure(lm=dspy.LM(
+        model="openai/stub", api_base=server.api_base, api_key=config.API_KEY,
+        cache=False, num_retries=0, timeout=10
+    ))
+
+
+def test_lost_markers_are_cleaned_one_chunk_at_a_time(cleaner_config, llm_server, tmp_path, monkeypatch):
+    server = llm_server(reply=drop_markers)
+    use_server(server)
+    input_csv = str(tmp_path / "chunks.csv")
+    output_csv = str(tmp_path / "cleaned.csv")
+    pd.DataFrame({"chunk_id": [1, 2, 3], "text": CHUNKS}).to_csv(input_csv, index=False)
+
+    journaled = []
+    append = ChunkJournal.append
+
+    def record(self, chunk_id, source, text):
+        journaled.append(text)
+        append(self, chunk_id, source, text)
+
+    monkeypatch.setattr(ChunkJournal, "append", record)
+    Cleaner(cleaner_config, packer=make_packer()).clean_transcript(input_csv, output_csv)
+
+    assert pd.read_csv(output_csv)["text"].tolist() == [text.upper() for text in CHUNKS]
+    assert sorted(journaled) == sorted(text.upper() for text in CHUNKS)
+    # Una richiesta unita, poi un chunk per richiesta
+    assert server.requests[0].count("[[CHUNK") == 3
+    assert sorted(server.requests[1:]) == sorted(CHUNKS)
+
+
+def test_reply_with_lost_markers_is_not_cached(cleaner_config, llm_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "LLM_CACHE_PATH", str(tmp_path / "llm_responses.sqlite"))
+    cache = LLMResponseCache(config)
+    chunk_ids = [1, 2, 3]
+
+    server = llm_server(reply=drop_markers)
+    use_server(server)
+    cleaner = Cleaner(cleaner_config, cache=cache, packer=make_packer())
+    cleaned, failed = cleaner.clean_chunks(chunk_ids, CHUNKS)
+    assert failed == []
+
+    # Nel rerun la richiesta unita torna al modello, i chunk singoli arrivano dalla cache
+    rerun_server = llm_server(reply=drop_markers)
+    use_server(rerun_server)
+    assert cleaner.clean_chunks(chunk_ids, CHUNKS) == (cleaned, [])
+    assert len(rerun_server.requests) == 1
+    assert rerun_server.requests[0].count("[[CHUNK") == 3
+    cache.close()
@@ -0,0 +1,66 @@
+import types
+import numpy as np
+import pytest
+
+for module in ("torch", "pyannote.audio"):
+    pytest.importorskip(module)
+
+import config
+from transcript_pipeline.modules.speaker_detector import SpeakerDetector
+
+SAMPLE_RATE = 16000
+
+
+def tone(frequency, seconds, seed=0):
+    # Volume diverso a ogni secondo, così le finestre più energetiche cadono su entrambe le voci
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    volume = np.random.default_rng(seed).uniform(0.2, 0.6, size=int(np.ceil(seconds)))
+    return (volume[t.astype(np.int64)] * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+
+def stub_embedding(inputs):
+    """Embedding di test: la "voce" è la frequenza del tono (dai passaggi per lo zero)."""
+    waveform = np.asarray(inputs["waveform"]).reshape(-1)
+    crossings = np.count_nonzero(np.diff(np.signbit(waveform)))
+    return np.array([1.0, 0.0]) if crossings / len(waveform) < 0.05 else np.array([0.0, 1.0])
+
+
+@pytest.fixture
+def detector():
+    detector = SpeakerDetector(types.SimpleNamespace(
+        DIARIZATION_MODEL=config.DIARIZATION_MODEL,
+        SPEAKER_EMBEDDING_MODEL=config.SPEAKER_EMBEDDING_MODEL,
+        HF_TOKEN=None,
+        SINGLE_SPEAKER_SAMPLES=10,
+        SINGLE_SPEAKER_WINDOW_S=1.0,
+        SINGLE_SPEAKER_MAX_DISTANCE=config.SINGLE_SPEAKER_MAX_DISTANCE,
+        SINGLE_SPEAKER_LABEL=config.SINGLE_SPEAKER_LABEL,
+    ))
+    # Nessun modello pyannote: l'embedding viene calcolato dal tono
+    detector._embedding = stub_embedding
+    return detector
+
+
+def test_single_speaker_recording(detector):
+    single, spread = detector.is_single_speaker(tone(200, 30), SAMPLE_RATE)
+    assert single
+    assert spread == pytest.approx(0.0, abs=1e-6)
+
+
+def test_two_speakers_recording(detector):
+    samples = np.concatenate([tone(200, 15), tone(1600, 15, seed=1)])
+    single, spread = detector.is_single_speaker(samples, SAMPLE_RATE)
+    assert not single
+    assert spread == pytest.approx(1.0, abs=1e-6)
+
+
+def test_int16_samples_are_converted(detector):
+    samples = (np.concatenate([tone(200, 15), tone(1600, 15, seed=1)]) * 32767).astype(np.int16)
+    assert not detector.is_single_speaker(samples, SAMPLE_RATE)[0]
+
+
+def test_recording_too_short_is_not_single_speaker(detector):
+    single, spread = detector.is_single_speaker(tone(200, 0.5), SAMPLE_RATE)
+    assert not single
+    assert np.isnan(spread)
+
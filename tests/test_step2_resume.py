@@ -0,0 +1,140 @@
+import multiprocessing
+import os
+import signal
+import types
+import wave
+import numpy as np
+import pytest
+
+for module in ("torch", "transformers", "pyannote.audio", "pandas", "tqdm"):
+    pytest.importorskip(module)
+
+import config
+from transcript_pipeline.modules import transcriber as transcriber_module
+from transcript_pipeline.modules import speaker_detector as speaker_detector_module
+from transcript_pipeline.steps import step_2_transcription
+
+SAMPLE_RATE = 16000
+KILL_AT_WINDOW = 3
+
+
+def write_test_wav(path, seconds=40, seed=0):
+    # Raffiche di rumore separate da pause: i tagli delle finestre cadono nei silenzi
+    rng = np.random.default_rng(seed)
+    samples = np.zeros(seconds * SAMPLE_RATE, dtype=np.int16)
+    for start in range(0, seconds, 2):
+        burst = rng.integers(-8000, 8000, size=int(1.5 * SAMPLE_RATE), dtype=np.int16)
+        samples[start * SAMPLE_RATE:start * SAMPLE_RATE + len(burst)] = burst
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(samples.tobytes())
+
+
+class StubTranscriber(transcriber_module.Transcriber):
+    """Transcriber senza modello: un chunk deterministico per finestra."""
+
+    kill_at = None
+    log_path = None
+
+    def __init__(self, config):
+        self.repetition_guard = None
+        self.windows_done = 0
+
+    def transcribe_window(self, window, sample_rate, start):
+        if self.windows_done == self.kill_at:
+            # Processo terminato senza alcuna pulizia, come un OOM kill
+            os.kill(os.getpid(), signal.SIGKILL)
+        self.windows_done += 1
+        if self.log_path:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(f"{start}\n")
+        end = start + len(window)
+        return [{"text": f"finestra {start}-{end}", "timestamp": (start / sample_rate, end / sample_rate)}]
+
+
+class StubSpeakerDetector(speaker_detector_module.SpeakerDetector):
+    """Diarizzazione fissa a due speaker, senza pyannote."""
+
+    def __init__(self, config):
+        self.single_label = config.SINGLE_SPEAKER_LABEL
+
+    def detect_speakers(self, audio, sample_rate=None):
+        turns = [(0.0, 12.0, "SPEAKER_00"), (12.0, 40.0, "SPEAKER_01")]
+        return types.SimpleNamespace(itertracks=lambda yield_label=True: [
+            (types.SimpleNamespace(start=start, end=end), None, speaker) for start, end, speaker in turns
+        ])
+
+
+@pytest.fixture
+def step2(monkeypatch):
+    monkeypatch.setattr(step_2_transcription, "Transcriber", StubTranscriber)
+    monkeypatch.setattr(step_2_transcription, "SpeakerDetector", StubSpeakerDetector)
+    monkeypatch.setattr(StubTranscriber, "kill_at", None)
+    monkeypatch.setattr(StubTranscriber, "log_path", None)
+    for name, value in {
+        "STEP2_CHECKPOINTS": True,
+        "STEP2_CONCURRENT": False,
+        "TRANSCRIPTION_CACHE_ENABLED": False,
+        "TRANSCRIBER_NUM_SHARDS": 1,
+        "SPEAKER_COUNT_MODE": "diarize",
+        "STREAM_WINDOW_S": 5,
+        "STREAM_SPLIT_SEARCH_S": 1,
+    }.items():
+        monkeypatch.setattr(config, name, value)
+    return step_2_transcription
+
+
+def _run_and_kill(audio_file, log_path):
+    StubTranscriber.kill_at = KILL_AT_WINDOW
+    StubTranscriber.log_path = log_path
+    step_2_transcription.run(audio_file)
+
+
+def test_resumed_run_matches_uninterrupted_run(step2, tmp_path):
+    reference_dir = tmp_path / "reference"
+    resumed_dir = tmp_path / "resumed"
+    reference_dir.mkdir()
+    resumed_dir.mkdir()
+    write_test_wav(str(reference_dir / "extracted_audio.wav"))
+    write_test_wav(str(resumed_dir / "extracted_audio.wav"))
+
+    reference_csv = step2.run(str(reference_dir / "extracted_audio.wav"))
+
+    # Primo tentativo terminato con SIGKILL durante la finestra KILL_AT_WINDOW
+    first_log = tmp_path / "first.log"
+    process = multiprocessing.get_context("fork").Process(
+        target=_run_and_kill, args=(str(resumed_dir / "extracted_audio.wav"), str(first_log))
+    )
+    process.start()
+    process.join()
+    assert process.exitcode == -signal.SIGKILL
+    first_windows = first_log.read_text().split()
+    assert len(first_windows) == KILL_AT_WINDOW
+
+    # Il rerun trascrive solo le finestre mancanti
+    resumed_log = tmp_path / "resumed.log"
+    StubTranscriber.kill_at = None
+    StubTranscriber.log_path = str(resumed_log)
+    resumed_csv = step2.run(str(resumed_dir / "extracted_audio.wav"))
+    resumed_windows = resumed_log.read_text().split()
+    assert not set(first_windows) & set(resumed_windows)
+    assert resumed_windows
+
+    with open(reference_csv, encoding="utf-8") as f:
+        expected = f.read()
+    with open(resumed_csv, encoding="utf-8") as f:
+        assert f.read() == expected
+
+
+def test_single_speaker_mode_ignores_diarization_checkpoint(step2, tmp_path, monkeypatch):
+    audio_file = str(tmp_path / "extracted_audio.wav")
+    write_test_wav(audio_file)
+    step2.run(audio_file)
+
+    # Con la diarizzazione completa già nei checkpoint, "single" deve comunque forzare il fast path
+    monkeypatch.setattr(config, "SPEAKER_COUNT_MODE", "single")
+    with open(step2.run(audio_file), encoding="utf-8") as f:
+        speakers = {line.split(",")[0] for line in f.read().splitlines()[1:]}
+    assert speakers == {config.SINGLE_SPEAKER_LABEL}
@@ -0,0 +1,78 @@
+import os
+import time
+import types
+import numpy as np
+import pytest
+import config
+from transcript_pipeline.modules.checkpoint_store import CheckpointStore
+from transcript_pipeline.modules.transcription_cache import (
+    TranscriptionCache, TRANSCRIPTION_SETTINGS, DIARIZATION_SETTINGS, SPEAKER_COUNT_SETTINGS,
+    ALIGNMENT_SETTINGS, WINDOWED_SETTINGS, BATCH_SETTINGS
+)
+
+ALL_SETTINGS = sorted(set(
+    TRANSCRIPTION_SETTINGS + DIARIZATION_SETTINGS + SPEAKER_COUNT_SETTINGS
+    + ALIGNMENT_SETTINGS + WINDOWED_SETTINGS + BATCH_SETTINGS
+))
+
+
+def make_config(tmp_path, **overrides):
+    values = {name: getattr(config, name) for name in ALL_SETTINGS}
+    values.update(TRANSCRIPTION_CACHE_DIR=str(tmp_path / "cache"), TRANSCRIPTION_CACHE_MAX_MB=1)
+    values.update(overrides)
+    return types.SimpleNamespace(**values)
+
+
+def changed(value):
+    if isinstance(value, bool):
+        return not value
+    if isinstance(value, (int, float)):
+        return value + 1
+    if isinstance(value, tuple):
+        return value[:-1]
+    return f"{value}-altro"
+
+
+@pytest.mark.parametrize("name", ALL_SETTINGS)
+def test_every_output_setting_changes_the_cache_key(tmp_path, name):
+    pcm = np.arange(1000, dtype="<i2")
+    base = TranscriptionCache(make_config(tmp_path))
+    other = TranscriptionCache(make_config(tmp_path, **{name: changed(getattr(config, name))}))
+    windowed = name not in BATCH_SETTINGS
+    assert base.key_for(pcm, windowed=windowed) != other.key_for(pcm, windowed=windowed)
+
+
+def test_windowed_and_batch_results_have_different_keys(tmp_path):
+    pcm = np.arange(1000, dtype="<i2")
+    cache = TranscriptionCache(make_config(tmp_path))
+    assert cache.key_for(pcm, windowed=True) != cache.key_for(pcm, windowed=False)
+
+
+@pytest.mark.parametrize("name", TRANSCRIPTION_SETTINGS)
+def test_transcription_settings_invalidate_window_checkpoints(tmp_path, name):
+    audio_file = str(tmp_path / "extracted_audio.wav")
+    store = CheckpointStore(audio_file, make_config(tmp_path))
+    store.save_window(0, 16000, [{"text": "ciao", "timestamp": (0.0, 1.0)}])
+    assert store.load_window(0, 16000) == [{"text": "ciao", "timestamp": (0.0, 1.0)}]
+
+    other = CheckpointStore(audio_file, make_config(tmp_path, **{name: changed(getattr(config, name))}))
+    assert other.load_window(0, 16000) is None
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    # Limite per due risultati da 200 byte: il terzo fa uscire la voce usata meno di recente
+    cache = TranscriptionCache(make_config(tmp_path, TRANSCRIPTION_CACHE_MAX_MB=500 / (1024 * 1024)))
+    result = tmp_path / "raw_aligned.csv"
+    result.write_bytes(b"x" * 200)
+
+    now = time.time()
+    for age, key in ((300, "vecchia"), (200, "recente")):
+        cache.store(key, str(result))
+        os.utime(os.path.join(cache.folder, key), (now - age, now - age))
+    # La voce più vecchia viene letta: diventa la più recente
+    assert cache.restore("vecchia", str(tmp_path / "restored.csv"))
+
+    cache.store("nuova", str(result))
+
+    assert sorted(os.listdir(cache.folder)) == ["nuova", "vecchia"]
+    assert not cache.restore("recente", str(tmp_path / "restored.csv"))
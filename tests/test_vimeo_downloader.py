@@ -0,0 +1,51 @@
+import functools
+import os
+import threading
+import wave
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+
+for module in ("yt_dlp", "unidecode"):
+    pytest.importorskip(module)
+
+import config
+from transcript_pipeline.modules.vimeo_downloader import VimeoDownloader
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def media_server(tmp_path):
+    """Server HTTP locale che espone una breve traccia audio (link diretto)."""
+    root = tmp_path / "server"
+    root.mkdir()
+    with wave.open(str(root / "lezione.wav"), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(b"\0\0" * 16000)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(_QuietHandler, directory=str(root)))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_download_audio_produces_only_the_audio_file(media_server, tmp_path, monkeypatch):
+    downloads = tmp_path / "downloads"
+    downloads.mkdir()
+    monkeypatch.chdir(downloads)
+    # Nessun file di cookie per il server locale
+    monkeypatch.setattr(config, "YDL_OPT", {**config.YDL_OPT, "cookiefile": None, "quiet": True, "noprogress": True})
+    monkeypatch.setattr(config, "YDL_OPT_AUDIO", {**config.YDL_OPT_AUDIO, "cookiefile": None, "quiet": True, "noprogress": True})
+
+    file_path = VimeoDownloader(config).download_audio(f"{media_server}/lezione.wav")
+
+    assert file_path == os.path.join("lezione", "lezione.wav")
+    files = [os.path.join(root, name) for root, _, names in os.walk(".") for name in names]
+    # Solo la traccia audio, nella cartella della lezione: nessun MP4 unito né file .part
+    assert files == [os.path.join(".", "lezione", "lezione.wav")]
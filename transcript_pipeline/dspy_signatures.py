@@ -135,6 +135,9 @@ class RiformulaStileNozionistico(dspy.Signature):
    4. STILE: Riscrivi in terza persona, stile impersonale e oggettivo. 
       Rimuovi meta-commenti, esitazioni e parti colloquiali.
    5. STRUTTURA: Organizza i concetti in paragrafi logici.
+   6. MARCATORI: Se il testo contiene marcatori "[[CHUNK n]]", riportali identici e nello
+      stesso ordine, ognuno seguito dalla riformulazione del solo testo che lo segue nell'input.
+      Non unire, rimuovere o rinumerare i marcatori.
    """
    testo_colloquiale: str = dspy.InputField(
       desc="Il chunk di testo originale trascritto da un discorso."
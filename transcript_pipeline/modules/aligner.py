@@ -0,0 +1,148 @@
+import numpy as np
+
+
+class SpeakerAligner:
+    """
+    Indice a intervalli dei turni di diarizzazione.
+
+    Per ogni speaker costruisce le somme prefisse degli inizi e delle fine
+    dei turni ordinati: la sovrapposizione tra un intervallo [a, b] e tutti
+    i turni di uno speaker si ottiene come F(b) - F(a), dove F(t) è il tempo
+    di parlato cumulato fino a t. Con `searchsorted` l'assegnazione di N chunk
+    a M turni costa O((N + M) log M) invece di O(N * M).
+    """
+
+    UNKNOWN = "UNKNOWN"
+    TIE_TOLERANCE = 1e-6
+
+    def __init__(self, segments):
+        # segments è una lista di (start, end, speaker) nell'ordine della diarizzazione
+        by_speaker = {}
+        for order, (start, end, speaker) in enumerate(segments):
+            if end <= start:
+                continue
+            by_speaker.setdefault(speaker, []).append((start, end, order))
+
+        self.speakers = list(by_speaker)
+        self.end = max((end for _, end, _ in segments), default=0.0)
+        self._index = []
+
+        for speaker in self.speakers:
+            turns = np.asarray(by_speaker[speaker], dtype=np.float64)
+            turns = turns[np.argsort(turns[:, 0], kind="stable")]
+            starts, ends, order = turns[:, 0], turns[:, 1], turns[:, 2]
+            sorted_ends = np.sort(ends)
+            self._index.append({
+                "starts": starts,
+                "order": order,
+                "max_end": np.maximum.accumulate(ends),
+                "sorted_ends": sorted_ends,
+                "cum_starts": np.concatenate(([0.0], np.cumsum(starts))),
+                "cum_ends": np.concatenate(([0.0], np.cumsum(sorted_ends))),
+            })
+
+    @staticmethod
+    def _coverage(index, t):
+        """Tempo di parlato cumulato dello speaker fino agli istanti t."""
+        n_started = np.searchsorted(index["starts"], t, side="right")
+        n_ended = np.searchsorted(index["sorted_ends"], t, side="right")
+        started = n_started * t - index["cum_starts"][n_started]
+        ended = n_ended * t - index["cum_ends"][n_ended]
+        return started - ended
+
+    def assign(self, starts, ends):
+        """
+        Restituisce lo speaker con sovrapposizione massima per ogni intervallo.
+
+        A parità di sovrapposizione vince lo speaker il cui primo turno
+        sovrapposto compare prima nella diarizzazione; gli intervalli senza
+        sovrapposizione ricevono "UNKNOWN".
+        """
+        starts = np.asarray(starts, dtype=np.float64)
+        ends = np.asarray(ends, dtype=np.float64)
+        n = len(starts)
+        if n == 0 or not self.speakers:
+            return [self.UNKNOWN] * n
+
+        overlaps = np.full((len(self.speakers), n), -np.inf)
+        first_order = np.full((len(self.speakers), n), np.inf)
+        positive = ends > starts
+
+        for k, index in enumerate(self._index):
+            # Primo turno (per inizio) che termina dopo l'inizio del chunk
+            first = np.searchsorted(index["max_end"], starts, side="right")
+            valid = first < len(index["starts"])
+            first_start = np.full(n, np.inf)
+            first_start[valid] = index["starts"][first[valid]]
+            has_overlap = positive & valid & (first_start < ends)
+
+            duration = self._coverage(index, ends) - self._coverage(index, starts)
+            overlaps[k, has_overlap] = duration[has_overlap]
+            first_order[k, has_overlap] = index["order"][first[has_overlap]]
+
+        # Le somme prefisse introducono errori di arrotondamento: sovrapposizioni
+        # che differiscono meno di TIE_TOLERANCE secondi sono considerate pari
+        best = overlaps.max(axis=0)
+        candidates = (overlaps >= best - self.TIE_TOLERANCE) & np.isfinite(overlaps)
+        winner = np.where(candidates, first_order, np.inf).argmin(axis=0)
+
+        return [
+            self.speakers[w] if np.isfinite(b) else self.UNKNOWN
+            for w, b in zip(winner, best)
+        ]
+
+    def align(self, transcription_chunks, merge_words=False, max_word_gap=1.0):
+        """
+        Assegna uno speaker a ciascun chunk di Whisper.
+
+        Con `merge_words=True` (timestamp a livello di parola) le parole
+        consecutive dello stesso speaker vengono riunite in un'unica riga,
+        purché la pausa tra di esse non superi `max_word_gap` secondi.
+        """
+        chunks = []
+        for chunk in transcription_chunks:
+            if not chunk["text"].strip():
+                continue
+            start, end = chunk["timestamp"]
+            if end is None:
+                # Whisper può lasciare aperto l'ultimo chunk
+                end = max(start, self.end)
+            chunks.append((start, end, chunk["text"]))
+
+        if not chunks:
+            return []
+
+        speakers = self.assign([c[0] for c in chunks], [c[1] for c in chunks])
+
+        if not merge_words:
+            return [
+                {
+                    "speaker": speaker,
+                    "start_time": round(start, 1),
+                    "end_time": round(end, 1),
+                    "text": text.strip()
+                }
+                for (start, end, text), speaker in zip(chunks, speakers)
+            ]
+
+        aligned_results = []
+        current = None
+        for (start, end, text), speaker in zip(chunks, speakers):
+            if current and current["speaker"] == speaker and start - current["end"] <= max_word_gap:
+                current["end"] = end
+                current["words"].append(text)
+                continue
+            if current:
+                aligned_results.append(current)
+            current = {"speaker": speaker, "start": start, "end": end, "words": [text]}
+        aligned_results.append(current)
+
+        return [
+            {
+                "speaker": row["speaker"],
+                "start_time": round(row["start"], 1),
+                "end_time": round(row["end"], 1),
+                "text": " ".join(word.strip() for word in row["words"])
+            }
+            for row in aligned_results
+        ]
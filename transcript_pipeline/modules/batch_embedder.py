@@ -0,0 +1,75 @@
+import numpy as np
+
+
+class BatchEmbedder:
+    """
+    Calcolo degli embedding a batch raggruppati per lunghezza.
+
+    Gli input vengono ordinati per numero di token e divisi in batch il cui
+    costo (righe x lunghezza massima, cioè i token effettivamente elaborati
+    padding incluso) non supera `token_budget`: le frasi corte viaggiano in
+    batch numerosi, quelle lunghe in batch piccoli, e quasi nessun calcolo
+    va sprecato sul padding. Il risultato torna nell'ordine originale.
+    """
+
+    def __init__(self, model, token_budget=16384, max_batch_size=256):
+        self.model = model
+        self.tokenizer = model.tokenizer
+        self.max_seq_length = model.max_seq_length
+        self.token_budget = token_budget
+        self.max_batch_size = max_batch_size
+
+    def _token_lengths(self, texts):
+        # Un'unica chiamata al tokenizer fast per tutte le frasi, troncate come farà il modello
+        encoded = self.tokenizer(
+            list(texts), add_special_tokens=True, truncation=True, max_length=self.max_seq_length
+        )["input_ids"]
+        return np.array([len(ids) for ids in encoded])
+
+    def _batches(self, lengths):
+        # Ordine decrescente: la prima frase di ogni batch ne fissa la lunghezza (padding)
+        order = np.argsort(-lengths, kind="stable")
+        batch = []
+        batch_len = 0
+        for idx in order:
+            if batch and ((len(batch) + 1) * batch_len > self.token_budget or len(batch) == self.max_batch_size):
+                yield batch
+                batch = []
+            if not batch:
+                batch_len = max(int(lengths[idx]), 1)
+            batch.append(idx)
+        if batch:
+            yield batch
+
+    def encode(self, texts, normalize_embeddings=True):
+        """Embedding di `texts` (float32, stesso ordine dell'input)."""
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, self.model.get_sentence_embedding_dimension()), dtype=np.float32)
+
+        lengths = self._token_lengths(texts)
+        embeddings = None
+        for batch in self._batches(lengths):
+            vectors = self.model.encode(
+                [texts[idx] for idx in batch],
+                batch_size=len(batch),
+                normalize_embeddings=normalize_embeddings,
+                convert_to_numpy=True,
+                show_progress_bar=False
+            )
+            if embeddings is None:
+                embeddings = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            embeddings[batch] = vectors
+        return embeddings
+
+    def encode_many(self, text_lists, normalize_embeddings=True):
+        """
+        Embedding di più liste di frasi (es. più lezioni) in un'unica passata:
+        i bucket per lunghezza si riempiono meglio. Restituisce un array per lista.
+        """
+        if not text_lists:
+            return []
+        sizes = [len(texts) for texts in text_lists]
+        flat = [text for texts in text_lists for text in texts]
+        embeddings = self.encode(flat, normalize_embeddings=normalize_embeddings)
+        return np.split(embeddings, np.cumsum(sizes)[:-1])
@@ -0,0 +1,69 @@
+import json
+import os
+from .transcription_cache import (
+    TRANSCRIPTION_SETTINGS, DIARIZATION_SETTINGS, step2_settings, settings_digest
+)
+
+
+class CheckpointStore:
+    """
+    Salva accanto al file audio i risultati parziali dello step 2
+    (chunk trascritti per finestra e segmenti di diarizzazione), così
+    un'esecuzione interrotta può riprendere dalle finestre mancanti.
+
+    Ogni finestra è un file JSON indicizzato dall'hash dei parametri di
+    trascrizione (TRANSCRIPTION_SETTINGS: modello, backend, lingua, VAD,
+    guard di ripetizione...) e dagli offset in campioni; la diarizzazione
+    dall'hash di DIARIZATION_SETTINGS. Cambiando uno di questi parametri i
+    checkpoint precedenti vengono semplicemente ignorati.
+    """
+
+    def __init__(self, audio_file, config):
+        self.folder = os.path.join(os.path.dirname(audio_file) or ".", "step2_checkpoints")
+        self.transcription_key = settings_digest(step2_settings(config, TRANSCRIPTION_SETTINGS))
+        self.diarization_key = settings_digest(step2_settings(config, DIARIZATION_SETTINGS))
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _read(self, file_name):
+        path = os.path.join(self.folder, file_name)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            # Checkpoint corrotto (es. processo terminato durante la scrittura): si ricalcola
+            return None
+
+    def _write(self, file_name, data):
+        # Scrittura atomica: un kill a metà non lascia mai un JSON troncato
+        path = os.path.join(self.folder, file_name)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _window_file(self, start, end):
+        return f"asr_{self.transcription_key}_{start}_{end}.json"
+
+    def load_window(self, start, end):
+        """Restituisce i chunk salvati per la finestra [start, end) o None."""
+        chunks = self._read(self._window_file(start, end))
+        if chunks is None:
+            return None
+        return [{"text": c["text"], "timestamp": tuple(c["timestamp"])} for c in chunks]
+
+    def save_window(self, start, end, chunks):
+        self._write(self._window_file(start, end), chunks)
+
+    def load_diarization(self, num_samples):
+        """Restituisce i segmenti (start, end, speaker) salvati o None."""
+        segments = self._read(f"diarization_{self.diarization_key}_{num_samples}.json")
+        if segments is None:
+            return None
+        return [tuple(segment) for segment in segments]
+
+    def save_diarization(self, num_samples, segments):
+        self._write(f"diarization_{self.diarization_key}_{num_samples}.json", [list(s) for s in segments])
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import os
+
+
+class ChunkJournal:
+    """
+    Journal in sola aggiunta (JSON lines) dei chunk già puliti dallo step 4.
+
+    Ogni riga contiene chunk_id, hash del testo in input e testo pulito ed è
+    scritta con fsync appena il chunk termina: dopo un'interruzione il rerun
+    riprende dai chunk mancanti. L'hash evita di riusare risultati di un
+    chunking diverso (step 3 rieseguito con altri parametri).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    @staticmethod
+    def _source_hash(text):
+        return hashlib.blake2b(str(text).encode("utf-8"), digest_size=16).hexdigest()
+
+    def load(self, sources):
+        """
+        Restituisce chunk_id -> testo pulito per i chunk del journal il cui
+        testo in input coincide con `sources` (dizionario chunk_id -> testo).
+        """
+        done = {}
+        if not os.path.isfile(self.path):
+            return done
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Ultima riga troncata da un'interruzione: il chunk verrà ripulito
+                    continue
+                chunk_id = entry.get("chunk_id")
+                if chunk_id in sources and entry.get("source") == self._source_hash(sources[chunk_id]):
+                    done[chunk_id] = entry["text"]
+        return done
+
+    def _ends_with_newline(self):
+        if not os.path.isfile(self.path) or os.path.getsize(self.path) == 0:
+            return True
+        with open(self.path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def append(self, chunk_id, source, text):
+        if self._file is None:
+            # Un'interruzione può lasciare l'ultima riga troncata: la nuova voce
+            # deve iniziare su una riga propria per restare leggibile
+            needs_newline = not self._ends_with_newline()
+            self._file = open(self.path, "a", encoding="utf-8")
+            if needs_newline:
+                self._file.write("\n")
+        self._file.write(json.dumps(
+            {"chunk_id": chunk_id, "source": self._source_hash(source), "text": text}, ensure_ascii=False
+        ) + "\n")
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        self.close()
+        if os.path.isfile(self.path):
+            os.remove(self.path)
@@ -2,9 +2,8 @@ import numpy as np
 import spacy
 from typing import List
 from sentence_transformers import SentenceTransformer
-import tiktoken
 from langchain_text_splitters  import RecursiveCharacterTextSplitter
-from sklearn.metrics.pairwise import cosine_distances
+from .token_counter import TokenCounter, get_token_counter
 import config
 
 class TokenAwareSemanticChunker:
@@ -12,15 +11,23 @@ class TokenAwareSemanticChunker:
         self, 
         embedder_model, 
         min_chunk_tokens: int = 150, 
-        max_chunk_tokens: int = 512
+        max_chunk_tokens: int = 512,
+        embedding_cache=None,
+        batch_embedder=None,
+        token_counter=None
     ):
         self.embedder = embedder_model
+        self.embedding_cache = embedding_cache
+        self.batch_embedder = batch_embedder
         self.tokenizer = embedder_model.tokenizer
+        # Di default i chunk si misurano con il tokenizer dell'embedder; step 3 può
+        # passare il contatore del tokenizer del cleaner (config.TOKENIZER_MODEL)
+        self.token_counter = token_counter or TokenCounter(tokenizer=self.tokenizer)
         self.min_tokens = min_chunk_tokens
         self.max_tokens = max_chunk_tokens
 
     def _count_tokens(self, text: str) -> int:
-        return len(self.tokenizer.encode(text))
+        return self.token_counter.count(text)
 
     def _create_contextual_sentences(self, sentences: List[str]) -> List[str]:
         n = len(sentences)
@@ -33,67 +40,123 @@ class TokenAwareSemanticChunker:
             contextualized.append(combined)
         return contextualized
 
-    def split(self, sentences: List[str]) -> List[str]:
-        n = len(sentences)
-        if n == 0: return []
-
-        token_counts = np.array([self._count_tokens(s) for s in sentences])
+    def _embed(self, context_sentences: List[str]) -> np.ndarray:
+        def encode(texts):
+            if self.batch_embedder is not None:
+                return self.batch_embedder.encode(texts, normalize_embeddings=True)
+            return self.embedder.encode(texts, normalize_embeddings=True)
+
+        if self.embedding_cache is None:
+            return encode(context_sentences)
+        return self.embedding_cache.encode(context_sentences, encode)
+
+    @staticmethod
+    def _adjacent_gaps(embeddings) -> np.ndarray:
+        """
+        Distanza coseno tra ogni frase e la successiva.
+
+        Calcolata riga per riga (prodotto scalare delle coppie adiacenti)
+        invece di estrarre la diagonale della matrice (n-1)x(n-1) di
+        cosine_distances: memoria O(n·d) invece di O(n²).
+        """
+        embeddings = np.asarray(embeddings)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        unit = embeddings / norms
+        similarity = np.einsum("ij,ij->i", unit[:-1], unit[1:])
+        return np.clip(1.0 - similarity, 0.0, 2.0)
+
+    def _best_boundaries(self, token_counts: np.ndarray, gaps: np.ndarray) -> np.ndarray:
+        """
+        Programmazione dinamica sui confini dei chunk; restituisce `parent`
+        (indice dell'ultima frase del chunk precedente, -1 se nessuno) o
+        None se non esiste una segmentazione valida.
+
+        Il chunk (j, i] è valido se la sua lunghezza in token è compresa tra
+        min_tokens e max_tokens: con le somme prefisse P le frasi j ammesse
+        formano l'intervallo [lo, hi] trovato con `searchsorted`, quindi per
+        ogni i basta un argmax vettoriale su dp[lo:hi+1] + gaps[lo:hi+1].
+        Una frase singola più lunga di max_tokens forma comunque un chunk
+        (j = i - 1) con penalità 0.1. A parità di punteggio vince il j più
+        grande, come nella scansione all'indietro originale.
+        """
+        n = len(token_counts)
         P = np.cumsum(token_counts)
-        
-        def get_chunk_len(start_idx, end_idx):
-            upper = P[end_idx]
-            lower = P[start_idx - 1] if start_idx > 0 else 0
-            return upper - lower
 
-
-        context_sentences = self._create_contextual_sentences(sentences)
-        embeddings = self.embedder.encode(context_sentences, normalize_embeddings=True)
-        gaps = np.diag(cosine_distances(embeddings[:-1], embeddings[1:]))
-        
+        # Prima frase ammessa: P[i] - P[j] <= max_tokens; ultima: P[i] - P[j] >= min_tokens
+        lo = np.searchsorted(P, P - self.max_tokens, side="left")
+        hi = np.minimum(np.searchsorted(P, P - self.min_tokens, side="right") - 1, np.arange(n) - 1)
 
         dp = np.full(n, -1.0)
         parent = np.full(n, -1, dtype=int)
 
         for i in range(n):
-            len_0_to_i = get_chunk_len(0, i)
-            
-
-            is_valid_start = (self.min_tokens <= len_0_to_i <= self.max_tokens)
-            is_forced_start = (i == 0 and len_0_to_i > self.max_tokens)
-            
-            if is_valid_start or is_forced_start:
+            if (self.min_tokens <= P[i] <= self.max_tokens) or (i == 0 and P[i] > self.max_tokens):
                 dp[i] = 0
-                parent[i] = -1
 
-            for j in range(i - 1, -2, -1):
-                if j == -1: break
+            if i == 0:
+                continue
 
-                current_len = get_chunk_len(j + 1, i)
-                
-                if current_len > self.max_tokens:
+            if token_counts[i] > self.max_tokens:
+                # Frase singola oltre il limite: unico candidato j = i - 1, penalizzato
+                if dp[i - 1] != -1.0:
+                    score = dp[i - 1] + gaps[i - 1] - 0.1
+                    if score > dp[i]:
+                        dp[i] = score
+                        parent[i] = i - 1
+                continue
 
-                    if (j + 1) == i:
-                        pass 
-                    else:
+            if lo[i] > hi[i]:
+                continue
 
-                        break
-                
-                if current_len < self.min_tokens and current_len <= self.max_tokens:
-                    continue
+            window = dp[lo[i]:hi[i] + 1]
+            scores = np.where(window != -1.0, window + gaps[lo[i]:hi[i] + 1], -np.inf)
+            # argmax sull'intervallo rovesciato: a parità di punteggio prende il j più grande
+            best = len(scores) - 1 - int(np.argmax(scores[::-1]))
+            if scores[best] > dp[i]:
+                dp[i] = scores[best]
+                parent[i] = lo[i] + best
 
-                if dp[j] != -1.0:
-                    score = dp[j] + gaps[j]
-                    if current_len > self.max_tokens:
-                        score -= 0.1
-                    
-                    if score > dp[i]:
-                        dp[i] = score
-                        parent[i] = j
+        if dp[n - 1] == -1.0:
+            return None
+        return parent
+
+    def split(self, sentences: List[str]) -> List[str]:
+        if len(sentences) == 0: return []
+
+        context_sentences = self._create_contextual_sentences(sentences)
+        embeddings = self._embed(context_sentences)
+        return self._split_embedded(sentences, embeddings)
+
+    def split_many(self, sentence_lists: List[List[str]]) -> List[List[str]]:
+        """
+        Come split, per più trascrizioni: gli embedding di tutte le frasi
+        vengono calcolati in un'unica passata (batch per lunghezza più pieni).
+        """
+        context_lists = [self._create_contextual_sentences(sentences) for sentences in sentence_lists]
+        flat = [text for contexts in context_lists for text in contexts]
+        embeddings = self._embed(flat) if flat else np.empty((0, 0))
+
+        results = []
+        offset = 0
+        for sentences in sentence_lists:
+            results.append(
+                self._split_embedded(sentences, embeddings[offset:offset + len(sentences)]) if sentences else []
+            )
+            offset += len(sentences)
+        return results
+
+    def _split_embedded(self, sentences: List[str], embeddings: np.ndarray) -> List[str]:
+        n = len(sentences)
+        token_counts = np.array(self.token_counter.count_many(sentences))
+        gaps = self._adjacent_gaps(embeddings)
+
+        parent = self._best_boundaries(token_counts, gaps)
 
         chunks = []
         curr_idx = n - 1
         
-        if dp[curr_idx] == -1.0:
+        if parent is None:
             print("Warning: DP failed optimization. Returning full text.")
             return [" ".join(sentences)]
 
@@ -138,20 +201,14 @@ def chunk_text_by_tokens(
         Una lista di stringhe, dove ogni stringa è un chunk di testo.
 
     """
-    try:
-        encoding = tiktoken.encoding_for_model(model_name)
-    except KeyError:
-        print(f"Attenzione: Modello '{model_name}' non trovato. Uso 'cl100k_base'.")
-        encoding = tiktoken.get_encoding("cl100k_base")
-        
-    def count_tokens(text_to_count: str) -> int:
-        return len(encoding.encode(text_to_count))
+    # Encoder condiviso e memoizzato: lo splitter riconta spesso gli stessi pezzi
+    token_counter = get_token_counter(model_name, backend="tiktoken")
 
     # 2. Creiamo lo splitter
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=chunk_overlap,
-        length_function=count_tokens,
+        length_function=token_counter.count,
         separators=["\n\n", "\n", " ", ""]
     )
 
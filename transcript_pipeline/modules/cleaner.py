@@ -1,26 +1,148 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import dspy
 from tqdm import trange, tqdm
 import pandas as pd
 import numpy as np
 from ..dspy_signatures import RiformulaStileNozionistico
+from .chunk_journal import ChunkJournal
+from .request_packer import PackedRequest, PackedResults
 
 tqdm.pandas()
 
 class Cleaner:
-    def __init__(self, config):
+    def __init__(self, config, cache=None, pool=None, packer=None):
 
         self.reformulate_cleaner = dspy.Predict(RiformulaStileNozionistico)
+        self.cache = cache
+        self.pool = pool
+        self.packer = packer
+        # Con un EndpointPool la concorrenza è per endpoint: il throughput cresce con i backend
+        self.concurrency = max(1, config.CLEANER_CONCURRENCY) * (len(pool) if pool is not None else 1)
+        self.max_retries = config.CLEANER_MAX_RETRIES
+        self.retry_backoff = config.CLEANER_RETRY_BACKOFF_S
 
-    def riformula_chunk(self, chunk):
+    def _cache_key(self, lm, chunk):
+        return self.cache.key_for(
+            lm.model, self.reformulate_cleaner.signature, chunk,
+            lm.kwargs.get("temperature"), lm.kwargs.get("max_tokens")
+        )
+
+    def _predict(self, chunk):
+        risultato = self.reformulate_cleaner(testo_colloquiale=chunk)
+        testo = risultato.testo_nozionistico.strip()
+        if not testo and chunk.strip():
+            # Un output vuoto non va salvato (né nel journal né in cache) come chunk pulito
+            raise ValueError("output vuoto per un chunk non vuoto")
+        return testo
+
+    def riformula_chunk(self, chunk, validate=None):
         """
-        Helper per progress_apply: esegue la pulizia moderata su un chunk.
+        Esegue la pulizia moderata su un chunk.
+
+        In caso di errore (timeout, server non raggiungibile, output non
+        parsabile o vuoto) ritenta fino a CLEANER_MAX_RETRIES volte con backoff
+        esponenziale; se tutti i tentativi falliscono solleva l'ultima eccezione.
+        Se è configurata una cache delle risposte viene consultata per prima;
+        con `validate(testo)` finiscono in cache (e vengono riusate) solo le
+        risposte che la superano, le altre vengono restituite senza salvarle.
         """
-        try:
-            risultato = self.reformulate_cleaner(testo_colloquiale=chunk)
-            return risultato.testo_nozionistico.strip()
-        except Exception as e:
-            print(f"Errore pulizia chunk: {e}")
-            return chunk # Mantieni l'originale in caso di errore
+        if self.cache is not None:
+            lms = [endpoint.lm for endpoint in self.pool.endpoints] if self.pool is not None else [dspy.settings.lm]
+            cached = self.cache.get_any([self._cache_key(lm, chunk) for lm in lms])
+            if cached and (validate is None or validate(cached)):
+                return cached
+
+        last_endpoint = None
+        for attempt in range(self.max_retries + 1):
+            try:
+                if self.pool is None:
+                    lm = dspy.settings.lm
+                    testo = self._predict(chunk)
+                else:
+                    # Dopo un errore il chunk torna in coda su un endpoint diverso, se disponibile
+                    with self.pool.lease(exclude=last_endpoint) as endpoint:
+                        last_endpoint = endpoint
+                        testo = self._predict(chunk)
+                    lm = endpoint.lm
+                if self.cache is not None and (validate is None or validate(testo)):
+                    self.cache.put(self._cache_key(lm, chunk), testo)
+                return testo
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                if self.pool is not None and len(self.pool) > 1:
+                    # Con più endpoint si riprova subito altrove: il backoff lo fa il cooldown
+                    wait = 0.0
+                else:
+                    wait = self.retry_backoff * 2 ** attempt
+                print(f"Errore pulizia chunk (tentativo {attempt + 1}/{self.max_retries + 1}): {e}. Riprovo tra {wait:.1f} s")
+                time.sleep(wait)
+
+    def clean_chunks(self, chunk_ids, texts, on_result=None):
+        """
+        Pulisce i chunk tenendo in volo al massimo CLEANER_CONCURRENCY
+        richieste per endpoint. Tutti i thread condividono gli stessi dspy.LM,
+        quindi le connessioni HTTP del client vengono riusate.
+
+        `on_result(chunk_id, testo_pulito)` viene chiamata dal thread
+        principale appena ogni chunk termina (es. per il journal).
+        Se l'output di una richiesta unita non si può ridividere (marcatori
+        persi o chunk vuoti) i suoi chunk vengono rimessi in coda uno alla volta.
+        Restituisce il dizionario chunk_id -> testo pulito dei chunk riusciti
+        e la lista ordinata dei chunk_id falliti.
+        """
+        # Con un RequestPacker i chunk piccoli viaggiano insieme e quelli troppo
+        # lunghi vengono spezzati; gli output tornano comunque per chunk_id
+        if self.packer is not None:
+            requests = self.packer.pack(chunk_ids, texts)
+            print(f"   {len(chunk_ids)} chunk impacchettati in {len(requests)} richieste")
+            results = PackedResults(self.packer)
+        else:
+            requests = [PackedRequest([chunk_id], text) for chunk_id, text in zip(chunk_ids, texts)]
+            results = None
+
+        cleaned = {}
+        failed = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor, tqdm(total=len(requests)) as progress:
+            futures = {}
+
+            def submit(request):
+                # Una risposta unita va in cache solo se i marcatori permettono di ridividerla
+                validate = None
+                if len(request.chunk_ids) > 1:
+                    validate = lambda output: self.packer.unpack(request, output) is not None
+                futures[executor.submit(self.riformula_chunk, request.text, validate)] = request
+
+            for request in requests:
+                submit(request)
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    request = futures.pop(future)
+                    progress.update(1)
+                    try:
+                        output = future.result()
+                    except Exception as e:
+                        print(f"Chunk {request.chunk_ids} non pulito dopo {self.max_retries + 1} tentativi: {e}")
+                        failed.update(request.chunk_ids)
+                        continue
+                    completed = results.add(request, output) if results is not None else [(request.chunk_ids[0], output)]
+                    if completed is None:
+                        print(f"Attenzione: marcatori persi nella risposta per i chunk {request.chunk_ids}, li ripulisco uno alla volta")
+                        for chunk_id, text in zip(request.chunk_ids, request.texts):
+                            submit(PackedRequest([chunk_id], text))
+                        progress.total += len(request.chunk_ids)
+                        continue
+                    for chunk_id, text in completed:
+                        if chunk_id in failed:
+                            continue
+                        cleaned[chunk_id] = text
+                        if on_result is not None:
+                            on_result(chunk_id, text)
+        return cleaned, sorted(failed)
+
     def clean_transcript(self, input_from_raw, output_file_riformulato_csv, **kwargs):
         """
         Esegue entrambe le pulizie (moderata e aggressiva) 
@@ -29,19 +151,53 @@ class Cleaner:
         
         try:
             df_riformulato = pd.read_csv(input_from_raw)
-        
-            if "text" not in df_riformulato.columns:
-                print("Errore: Il CSV deve contenere una colonna 'text'.")
-                return
-
-            # Applica la pulizia riformulata
-            df_riformulato["text"] = df_riformulato["text"].progress_apply(self.riformula_chunk)
-            
-            # Post-processing
-            df_riformulato["text"] = df_riformulato["text"].str.replace("\n", " ", regex=False)
-            df_riformulato = df_riformulato[df_riformulato["text"].str.strip() != ""] 
-            df_riformulato.to_csv(output_file_riformulato_csv, index=False, encoding='utf-8')
-            print(f"Pulizia aggressiva salvata in {output_file_riformulato_csv}")
         except Exception as e:
             print(f"Errore lettura CSV {input_from_raw}: {e}")
-            return
\ No newline at end of file
+            return
+        
+        if "text" not in df_riformulato.columns:
+            print("Errore: Il CSV deve contenere una colonna 'text'.")
+            return
+
+        if "chunk_id" not in df_riformulato.columns:
+            df_riformulato["chunk_id"] = range(1, len(df_riformulato) + 1)
+        df_riformulato = df_riformulato.sort_values("chunk_id", kind="stable").reset_index(drop=True)
+
+        # Journal accanto all'output: ogni chunk pulito viene salvato subito,
+        # un rerun salta i chunk_id già presenti (con lo stesso testo in input)
+        sources = dict(zip(df_riformulato["chunk_id"].tolist(), df_riformulato["text"].tolist()))
+        journal = ChunkJournal(output_file_riformulato_csv + ".journal.jsonl")
+        done = journal.load(sources)
+        if done:
+            print(f"Ripresa dal journal: {len(done)} chunk già puliti, {len(sources) - len(done)} da pulire")
+        pending = [chunk_id for chunk_id in sources if chunk_id not in done]
+
+        # Applica la pulizia riformulata (in parallelo, risultati riallineati per chunk_id)
+        try:
+            cleaned, failed = self.clean_chunks(
+                pending, [sources[chunk_id] for chunk_id in pending],
+                on_result=lambda chunk_id, text: journal.append(chunk_id, sources[chunk_id], text)
+            )
+        finally:
+            journal.close()
+        cleaned.update(done)
+
+        # Merge ordinato per chunk_id di journal e nuovi risultati
+        df_riformulato["text"] = [
+            cleaned.get(chunk_id, text)
+            for chunk_id, text in zip(df_riformulato["chunk_id"], df_riformulato["text"])
+        ]
+        if failed:
+            print(f"Attenzione: {len(failed)} chunk non puliti, mantenuto il testo originale (chunk_id: {failed})")
+        
+        # Post-processing
+        df_riformulato["text"] = df_riformulato["text"].str.replace("\n", " ", regex=False)
+        df_riformulato = df_riformulato[df_riformulato["text"].str.strip() != ""] 
+        tmp_output = output_file_riformulato_csv + ".tmp"
+        df_riformulato.to_csv(tmp_output, index=False, encoding='utf-8')
+        os.replace(tmp_output, output_file_riformulato_csv)
+        print(f"Pulizia aggressiva salvata in {output_file_riformulato_csv}")
+
+        # Il journal serve solo finché restano chunk da (ri)pulire
+        if not failed:
+            journal.remove()
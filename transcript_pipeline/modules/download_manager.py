@@ -0,0 +1,112 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .vimeo_downloader import VimeoDownloader
+
+
+def read_manifest(manifest_path):
+    """Legge un manifest di URL: uno per riga, righe vuote e commenti (#) ignorati."""
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        lines = (line.strip() for line in f)
+        return [line for line in lines if line and not line.startswith("#")]
+
+
+class DownloadManager:
+    """
+    Scarica un elenco di URL con al massimo DOWNLOAD_CONCURRENCY download
+    contemporanei.
+
+    Ogni thread del pool crea un solo VimeoDownloader e lo riusa per tutti
+    i suoi URL (yt_dlp.YoutubeDL non è thread-safe). Con un manifest i file
+    sono nominati con DOWNLOAD_MANIFEST_OUTTMPL (`outtmpl`), che include l'id
+    del video: due lezioni con lo stesso titolo non condividono file .part né
+    cartella. A download completato nella cartella della lezione viene
+    scritto un marker con l'id del video: gli id già presenti vengono
+    saltati, mentre i download interrotti ripartono dai file .part grazie a
+    `continuedl`. Gli URL che puntano a un video già preso da un altro URL
+    dello stesso elenco finiscono in `duplicates` (URL -> id).
+    """
+
+    def __init__(self, config, base_folder=".", outtmpl=None):
+        self.config = config
+        self.base_folder = base_folder
+        self.concurrency = max(1, config.DOWNLOAD_CONCURRENCY)
+        self.audio_only = config.DOWNLOAD_AUDIO_ONLY
+        self.marker_file = config.DOWNLOAD_MARKER_FILE
+        self.outtmpl = outtmpl
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._claimed = set()
+        self.duplicates = {}
+        self.completed = self._scan_completed()
+
+    def _scan_completed(self):
+        # id del video -> percorso del file già scaricato
+        completed = {}
+        for name in os.listdir(self.base_folder):
+            marker = os.path.join(self.base_folder, name, self.marker_file)
+            if not os.path.isfile(marker):
+                continue
+            try:
+                with open(marker, "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            if os.path.isfile(entry.get("file", "")):
+                completed[entry["id"]] = entry["file"]
+        return completed
+
+    @property
+    def downloader(self):
+        if getattr(self._local, "downloader", None) is None:
+            self._local.downloader = VimeoDownloader(self.config, outtmpl=self.outtmpl)
+        return self._local.downloader
+
+    def _write_marker(self, file_path, video_id, url):
+        marker = os.path.join(os.path.dirname(file_path), self.marker_file)
+        tmp_marker = marker + ".tmp"
+        with open(tmp_marker, "w", encoding="utf-8") as f:
+            json.dump({"id": video_id, "url": url, "file": file_path}, f, ensure_ascii=False)
+        os.replace(tmp_marker, marker)
+
+    def download_one(self, url):
+        """
+        Scarica un URL e restituisce il percorso del file: None in caso di
+        errore o se l'URL è un duplicato (registrato in `duplicates`).
+        """
+        try:
+            info_dict = self.downloader.fetch_info(url, audio_only=self.audio_only)
+            video_id = str(info_dict.get("id"))
+
+            with self._lock:
+                if video_id in self._claimed:
+                    print(f"   [Download] {url}: id {video_id} già presente nell'elenco, salto il duplicato")
+                    self.duplicates[url] = video_id
+                    return None
+                self._claimed.add(video_id)
+                if video_id in self.completed:
+                    print(f"   [Download] {url}: id {video_id} già scaricato, salto")
+                    return self.completed[video_id]
+
+            try:
+                file_path = self.downloader.download(info_dict, audio_only=self.audio_only)
+                self._write_marker(file_path, video_id, url)
+            except Exception:
+                # Un download fallito non blocca gli altri URL dello stesso video
+                with self._lock:
+                    self._claimed.discard(video_id)
+                raise
+            with self._lock:
+                self.completed[video_id] = file_path
+
+            print(f"   [Download] Completato: {file_path}")
+            return file_path
+        except Exception as e:
+            print(f"   [Download] Errore durante il download di {url}: {e}")
+            return None
+
+    def download_all(self, urls):
+        """Scarica tutti gli URL; il risultato rispetta l'ordine di `urls`."""
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return list(executor.map(self.download_one, urls))
@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import re
+import numpy as np
+
+
+class EmbeddingCache:
+    """
+    Cache persistente degli embedding delle frasi contestuali dello step 3.
+
+    Una cartella per modello contiene un file di vettori float16 in sola
+    aggiunta (letto con np.memmap) e un indice testuale "hash riga" con
+    l'hash blake2b della stringa esatta passata all'embedder. Gli embedding
+    calcolati vengono restituiti dopo il passaggio in float16, così la
+    prima esecuzione e quelle successive producono gli stessi chunk.
+    """
+
+    VECTORS_FILE = "vectors.f16"
+    INDEX_FILE = "index.txt"
+    META_FILE = "meta.json"
+
+    def __init__(self, config):
+        self.model_name = config.EMBEDDING_MODEL
+        self.folder = os.path.join(
+            config.EMBEDDING_CACHE_DIR, re.sub(r"[^A-Za-z0-9_.-]+", "-", self.model_name)
+        )
+        os.makedirs(self.folder, exist_ok=True)
+        self.dim = self._read_meta()
+        self._rows = {}
+        self._num_vectors = 0
+        self._vectors = None
+        if self.dim is not None:
+            self._load_index()
+
+    def _path(self, file_name):
+        return os.path.join(self.folder, file_name)
+
+    def _read_meta(self):
+        try:
+            with open(self._path(self.META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)["dim"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _load_index(self):
+        row_bytes = self.dim * 2
+        vectors_path = self._path(self.VECTORS_FILE)
+        size = os.path.getsize(vectors_path) if os.path.isfile(vectors_path) else 0
+        self._num_vectors = size // row_bytes
+
+        if os.path.isfile(self._path(self.INDEX_FILE)):
+            with open(self._path(self.INDEX_FILE), "r", encoding="utf-8") as f:
+                for line in f:
+                    parts = line.split()
+                    # Le righe dell'indice vengono scritte dopo i vettori: un'interruzione
+                    # può lasciare solo vettori orfani, mai righe che puntano oltre il file
+                    if len(parts) == 2 and parts[1].isdigit() and int(parts[1]) < self._num_vectors:
+                        self._rows[parts[0]] = int(parts[1])
+
+    def _open_vectors(self):
+        if self._vectors is None and self._num_vectors:
+            self._vectors = np.memmap(
+                self._path(self.VECTORS_FILE), dtype=np.float16, mode="r",
+                shape=(self._num_vectors, self.dim)
+            )
+        return self._vectors
+
+    @staticmethod
+    def _key(text):
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _append(self, keys, vectors):
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            with open(self._path(self.META_FILE), "w", encoding="utf-8") as f:
+                json.dump({"model": self.model_name, "dim": self.dim}, f)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding di dimensione {vectors.shape[1]}, la cache contiene {self.dim}.")
+
+        # Eventuali vettori orfani di un'esecuzione interrotta vengono sovrascritti
+        with open(self._path(self.VECTORS_FILE), "ab") as f:
+            f.truncate(self._num_vectors * self.dim * 2)
+            f.write(vectors.astype(np.float16).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        with open(self._path(self.INDEX_FILE), "a", encoding="utf-8") as f:
+            for offset, key in enumerate(keys):
+                f.write(f"{key} {self._num_vectors + offset}\n")
+                self._rows[key] = self._num_vectors + offset
+
+        self._num_vectors += len(keys)
+        self._vectors = None
+
+    def encode(self, texts, encode_fn):
+        """
+        Restituisce gli embedding (float32) di `texts` chiamando `encode_fn`
+        solo sulle stringhe non ancora in cache (una volta per stringa).
+        """
+        if not texts:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+        keys = [self._key(text) for text in texts]
+
+        hits = sum(key in self._rows for key in keys)
+        missing = {}
+        for text, key in zip(texts, keys):
+            if key not in self._rows and key not in missing:
+                missing[key] = text
+
+        if missing:
+            new_vectors = np.asarray(encode_fn(list(missing.values())), dtype=np.float32)
+            self._append(list(missing), new_vectors)
+
+        print(f"   [EmbeddingCache] {hits}/{len(texts)} frasi in cache, {len(missing)} da calcolare")
+        vectors = self._open_vectors()
+        rows = np.fromiter((self._rows[key] for key in keys), dtype=np.int64, count=len(keys))
+        return np.asarray(vectors[rows], dtype=np.float32)
@@ -0,0 +1,145 @@
+import threading
+import time
+from contextlib import contextmanager
+import dspy
+import litellm
+
+try:
+    # dspy recenti incapsulano gli errori di litellm nelle proprie eccezioni
+    from dspy.utils.exceptions import LMServerError, LMTimeoutError, LMTransportError
+    _DSPY_ENDPOINT_ERRORS = (LMTransportError, LMTimeoutError, LMServerError)
+except ImportError:
+    _DSPY_ENDPOINT_ERRORS = ()
+
+# Errori di trasporto, timeout e server non disponibile: solo questi tolgono un endpoint
+# dalla rotazione (un output non parsabile è un problema del chunk, non del backend)
+ENDPOINT_ERRORS = (
+    ConnectionError, TimeoutError,
+    litellm.APIConnectionError, litellm.Timeout, litellm.ServiceUnavailableError,
+    litellm.InternalServerError, litellm.BadGatewayError,
+) + _DSPY_ENDPOINT_ERRORS
+
+
+class Endpoint:
+    """Un backend LLM (api_base + modello) con le sue statistiche di servizio."""
+
+    def __init__(self, lm, name):
+        self.lm = lm
+        self.name = name
+        self.in_flight = 0
+        self.latency = None
+        self.failures = 0
+        self.cooldown_until = 0.0
+        self.completed = 0
+
+
+class EndpointPool:
+    """
+    Distribuisce le richieste del cleaner su più endpoint (es. istanze
+    Ollama su host o porte diverse, anche con modelli diversi).
+
+    Ogni richiesta va all'endpoint disponibile con il minor tempo di attesa
+    stimato, (richieste in volo + 1) x latenza media (EWMA). Dopo
+    CLEANER_ENDPOINT_MAX_FAILURES errori consecutivi un endpoint esce dalla
+    rotazione per CLEANER_ENDPOINT_COOLDOWN_S secondi; il chunk fallito viene
+    ritentato su un altro endpoint. Contano come errori solo quelli in
+    ENDPOINT_ERRORS: se l'endpoint ha risposto, anche con un output non
+    parsabile, resta in rotazione.
+    """
+
+    LATENCY_SMOOTHING = 0.3
+
+    def __init__(self, config):
+        endpoints = config.CLEANER_ENDPOINTS or [{"api_base": config.OLLAMA_API_BASE}]
+        self.max_failures = config.CLEANER_ENDPOINT_MAX_FAILURES
+        self.cooldown_s = config.CLEANER_ENDPOINT_COOLDOWN_S
+        self.endpoints = []
+        for endpoint in endpoints:
+            model = endpoint.get("model", config.CLEANER_MODEL_OLLAMA)
+            lm = dspy.LM(
+                model=model,
+                api_base=endpoint["api_base"],
+                api_key=endpoint.get("api_key", config.API_KEY),
+                max_tokens=config.MAX_TOKENS_CLEANER,
+                temperature=config.TEMPERATURE_CLEANER,
+                # Timeout per richiesta; i tentativi successivi li gestisce Cleaner con backoff
+                timeout=config.CLEANER_TIMEOUT_S,
+                num_retries=0,
+                # Niente cache di dspy: un retry deve arrivare al server (la cache è LLMResponseCache)
+                cache=False
+            )
+            self.endpoints.append(Endpoint(lm, f"{model}@{endpoint['api_base']}"))
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    @property
+    def models(self):
+        return list(dict.fromkeys(endpoint.lm.model for endpoint in self.endpoints))
+
+    def _score(self, endpoint):
+        known = [e.latency for e in self.endpoints if e.latency is not None]
+        # Endpoint mai usato: latenza media degli altri, così viene provato presto
+        latency = endpoint.latency if endpoint.latency is not None else (sum(known) / len(known) if known else 1.0)
+        return (endpoint.in_flight + 1) * latency
+
+    def acquire(self, exclude=None):
+        """
+        Sceglie un endpoint e ne incrementa le richieste in volo. `exclude`
+        viene evitato se esiste un'alternativa disponibile (re-queue dopo un errore).
+        Se tutti gli endpoint sono in cooldown attende il primo che rientra.
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                available = [e for e in self.endpoints if e.cooldown_until <= now]
+                if len(available) > 1 and exclude in available:
+                    available.remove(exclude)
+                if available:
+                    endpoint = min(available, key=self._score)
+                    endpoint.in_flight += 1
+                    return endpoint
+                wait = min(e.cooldown_until for e in self.endpoints) - now
+                self._condition.wait(timeout=max(wait, 0.01))
+
+    def release(self, endpoint, elapsed, ok):
+        with self._condition:
+            endpoint.in_flight -= 1
+            if ok:
+                endpoint.failures = 0
+                endpoint.completed += 1
+                endpoint.latency = elapsed if endpoint.latency is None else (
+                    self.LATENCY_SMOOTHING * elapsed + (1 - self.LATENCY_SMOOTHING) * endpoint.latency
+                )
+            else:
+                endpoint.failures += 1
+                if endpoint.failures >= self.max_failures:
+                    endpoint.cooldown_until = time.monotonic() + self.cooldown_s
+                    endpoint.failures = 0
+                    print(f"   [Endpoint] {endpoint.name} fuori rotazione per {self.cooldown_s:.0f} s")
+            self._condition.notify_all()
+
+    @contextmanager
+    def lease(self, exclude=None):
+        """Esegue il blocco con l'LM dell'endpoint scelto (dspy.context è locale al thread)."""
+        endpoint = self.acquire(exclude)
+        start = time.perf_counter()
+        ok = False
+        try:
+            with dspy.context(lm=endpoint.lm):
+                yield endpoint
+            ok = True
+        except ENDPOINT_ERRORS:
+            raise
+        except Exception:
+            # L'endpoint ha risposto: l'errore è nella risposta, non nel backend
+            ok = True
+            raise
+        finally:
+            self.release(endpoint, time.perf_counter() - start, ok)
+
+    def report(self):
+        for endpoint in self.endpoints:
+            latency = f"{endpoint.latency:.1f} s" if endpoint.latency is not None else "n/d"
+            print(f"   [Endpoint] {endpoint.name}: {endpoint.completed} chunk, latenza media {latency}")
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class LLMResponseCache:
+    """
+    Cache su disco (SQLite) delle risposte del cleaner.
+
+    La chiave è l'hash di modello, signature (nome e istruzioni), chunk in
+    input, temperatura e max_tokens: cambiando prompt o parametri le voci
+    precedenti non vengono più usate e finiscono per essere rimosse. Le voci
+    più vecchie di LLM_CACHE_MAX_AGE_DAYS vengono eliminate e, oltre
+    LLM_CACHE_MAX_MB, si rimuovono quelle usate meno di recente.
+    """
+
+    def __init__(self, config):
+        self.path = config.LLM_CACHE_PATH
+        self.max_bytes = int(config.LLM_CACHE_MAX_MB * 1024 * 1024)
+        self.max_age_s = config.LLM_CACHE_MAX_AGE_DAYS * 24 * 3600
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Una sola connessione condivisa dai thread del cleaner, serializzata dal lock
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, "
+                "created REAL NOT NULL, last_used REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+
+    @staticmethod
+    def key_for(model, signature, chunk, temperature, max_tokens):
+        payload = json.dumps({
+            "model": model,
+            "signature": signature.__name__,
+            "instructions": signature.instructions,
+            "chunk": chunk,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        """Risposta in cache per la chiave o None."""
+        return self.get_any([key])
+
+    def get_any(self, keys):
+        """
+        Prima risposta in cache tra più chiavi (es. una per modello degli
+        endpoint); conta un solo hit o miss.
+        """
+        with self._lock, self._conn:
+            now = time.time()
+            for key in keys:
+                row = self._conn.execute(
+                    "SELECT response, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and now - row[1] <= self.max_age_s:
+                    self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+                    self.hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, key, response):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, last_used, size) VALUES (?, ?, ?, ?, ?)",
+                (key, response, now, now, len(response.encode("utf-8")) + len(key))
+            )
+
+    def evict(self):
+        """Rimuove le voci scadute e, se serve, le meno usate fino a rientrare nel limite."""
+        with self._lock, self._conn:
+            expired = self._conn.execute(
+                "DELETE FROM responses WHERE created < ?", (time.time() - self.max_age_s,)
+            ).rowcount
+
+            total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            removed = 0
+            if total > self.max_bytes:
+                for key, size in self._conn.execute(
+                    "SELECT key, size FROM responses ORDER BY last_used"
+                ).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    total -= size
+                    removed += 1
+
+        if expired or removed:
+            print(f"   [LLMCache] Rimosse {expired} risposte scadute e {removed} per limite di spazio")
+
+    def report(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        print(f"   [LLMCache] hit: {self.hits}, miss: {self.misses} ({rate:.0%} dalla cache)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,182 @@
+import math
+import re
+import dspy
+from ..utils.text_utils import sentences_divider
+
+
+def prompt_overhead_tokens(signature, token_counter):
+    """
+    Token del prompt che dspy aggiunge a ogni chunk (istruzioni, descrizione
+    dei campi, formato), misurati formattando la signature con input vuoto.
+    """
+    try:
+        messages = dspy.ChatAdapter().format(signature, demos=[], inputs={
+            name: "" for name in signature.input_fields
+        })
+        prompt = "\n".join(str(message["content"]) for message in messages)
+    except Exception:
+        # Formato dell'adapter non disponibile (versioni di dspy diverse): stima dalle istruzioni
+        fields = list(signature.input_fields.values()) + list(signature.output_fields.values())
+        prompt = signature.instructions + "\n" + "\n".join(
+            str(field.json_schema_extra.get("desc", "")) for field in fields
+        )
+    return token_counter.count(prompt)
+
+
+class PackedRequest:
+    """
+    Una richiesta al cleaner: uno o più chunk uniti (separati da marcatori)
+    oppure la parte `part` di `num_parts` di un chunk troppo lungo.
+    `texts` sono i testi originali dei chunk uniti, per ripulirli uno alla
+    volta se l'output non si può ridividere.
+    """
+
+    def __init__(self, chunk_ids, text, part=0, num_parts=1, texts=None):
+        self.chunk_ids = chunk_ids
+        self.text = text
+        self.part = part
+        self.num_parts = num_parts
+        self.texts = texts if texts is not None else [text]
+
+
+class RequestPacker:
+    """
+    Adatta i chunk dello step 3 al budget di token del cleaner.
+
+    Il budget è MAX_TOKENS_CLEANER meno i token del prompt della signature,
+    misurati con il tokenizer del LLM. I chunk sotto `min_tokens` vengono
+    uniti ai vicini (fino al budget) con un marcatore "[[CHUNK id]]" davanti a
+    ciascuno, così l'output può essere ridiviso; i chunk oltre il budget
+    vengono spezzati ai confini di frase e gli output delle parti riuniti.
+    """
+
+    MARKER = "[[CHUNK {}]]"
+    MARKER_PATTERN = re.compile(r"\[\[CHUNK (\d+)\]\]")
+
+    def __init__(self, token_counter, max_tokens, prompt_tokens=0, min_tokens=512):
+        self.token_counter = token_counter
+        self.budget = max(1, max_tokens - prompt_tokens)
+        self.min_tokens = min_tokens
+
+    def _tokens(self, text):
+        return self.token_counter.count(text)
+
+    def _merged_text(self, chunk_ids, texts):
+        return "\n".join(f"{self.MARKER.format(chunk_id)}\n{text}" for chunk_id, text in zip(chunk_ids, texts))
+
+    def _split_words(self, sentence):
+        # Frase singola oltre il budget: parti di parole di pari lunghezza
+        words = sentence.split()
+        num_parts = math.ceil(self._tokens(sentence) / self.budget)
+        while True:
+            size = math.ceil(len(words) / num_parts)
+            pieces = [" ".join(words[i:i + size]) for i in range(0, len(words), size)]
+            if size <= 1 or all(self._tokens(piece) <= self.budget for piece in pieces):
+                return pieces
+            num_parts += 1
+
+    def _split(self, text):
+        parts = []
+        current = []
+        for sentence in sentences_divider(text):
+            if self._tokens(sentence) > self.budget:
+                if current:
+                    parts.append(" ".join(current))
+                    current = []
+                parts.extend(self._split_words(sentence))
+                continue
+            if current and self._tokens(" ".join(current + [sentence])) > self.budget:
+                parts.append(" ".join(current))
+                current = []
+            current.append(sentence)
+        if current:
+            parts.append(" ".join(current))
+        return parts
+
+    def pack(self, chunk_ids, texts):
+        """Trasforma i chunk (in ordine di chunk_id) nella lista di richieste."""
+        requests = []
+        group_ids, group_texts = [], []
+
+        def flush():
+            if len(group_ids) == 1:
+                requests.append(PackedRequest(list(group_ids), group_texts[0]))
+            elif group_ids:
+                requests.append(PackedRequest(
+                    list(group_ids), self._merged_text(group_ids, group_texts), texts=list(group_texts)
+                ))
+            group_ids.clear()
+            group_texts.clear()
+
+        for chunk_id, text in zip(chunk_ids, texts):
+            tokens = self._tokens(text)
+            if tokens > self.budget:
+                flush()
+                parts = self._split(text)
+                for part, part_text in enumerate(parts):
+                    requests.append(PackedRequest([chunk_id], part_text, part, len(parts)))
+                continue
+
+            if group_ids:
+                group_small = self._tokens(self._merged_text(group_ids, group_texts)) < self.min_tokens
+                candidate = self._merged_text(group_ids + [chunk_id], group_texts + [text])
+                # Si uniscono solo chunk piccoli (il gruppo corrente o il nuovo chunk)
+                if (group_small or tokens < self.min_tokens) and self._tokens(candidate) <= self.budget:
+                    group_ids.append(chunk_id)
+                    group_texts.append(text)
+                    continue
+                flush()
+            group_ids.append(chunk_id)
+            group_texts.append(text)
+        flush()
+        return requests
+
+    def unpack(self, request, output):
+        """
+        Ridivide l'output di una richiesta unita per chunk_id. Se il modello
+        ha perso o alterato i marcatori, o ha lasciato vuoto un chunk,
+        restituisce None: quei chunk vanno ripuliti uno alla volta.
+        """
+        if len(request.chunk_ids) == 1:
+            return {request.chunk_ids[0]: output.strip()}
+
+        pieces = self.MARKER_PATTERN.split(output)
+        # split con un gruppo: [prima, id1, testo1, id2, testo2, ...]
+        found_ids = [int(chunk_id) for chunk_id in pieces[1::2]]
+        if found_ids == [int(chunk_id) for chunk_id in request.chunk_ids]:
+            results = {
+                chunk_id: text.strip()
+                for chunk_id, text in zip(request.chunk_ids, pieces[2::2])
+            }
+            # Eventuale testo prima del primo marcatore resta con il primo chunk
+            if pieces[0].strip():
+                first = request.chunk_ids[0]
+                results[first] = f"{pieces[0].strip()} {results[first]}".strip()
+            if all(results.values()):
+                return results
+        return None
+
+
+class PackedResults:
+    """Raccoglie gli output delle richieste e restituisce i chunk completati."""
+
+    def __init__(self, packer):
+        self.packer = packer
+        self._parts = {}
+
+    def add(self, request, output):
+        """
+        Restituisce le coppie (chunk_id, testo) completate da questa risposta,
+        oppure None se l'output di una richiesta unita non si può ridividere.
+        """
+        if request.num_parts == 1:
+            results = self.packer.unpack(request, output)
+            return list(results.items()) if results is not None else None
+
+        chunk_id = request.chunk_ids[0]
+        parts = self._parts.setdefault(chunk_id, {})
+        parts[request.part] = output.strip()
+        if len(parts) < request.num_parts:
+            return []
+        del self._parts[chunk_id]
+        return [(chunk_id, " ".join(parts[i] for i in range(request.num_parts)))]
@@ -1,17 +1,103 @@
-from pyannote.audio import Pipeline
+from pyannote.audio import Pipeline, Model, Inference
+import warnings
 import torch
+import numpy as np
+from ..utils.audio_utils import pcm_to_float
 
 class SpeakerDetector:
 
     def __init__(self,config):
         self.model_id = config.DIARIZATION_MODEL
+        self.embedding_model_id = config.SPEAKER_EMBEDDING_MODEL
         self.hf_token = config.HF_TOKEN
         self.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
         self.torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
 
-        self.pipeline = Pipeline.from_pretrained(self.model_id, use_auth_token=self.hf_token)
-        self.pipeline.to(self.device)
+        self.num_samples = config.SINGLE_SPEAKER_SAMPLES
+        self.window_s = config.SINGLE_SPEAKER_WINDOW_S
+        self.max_distance = config.SINGLE_SPEAKER_MAX_DISTANCE
+        self.single_label = config.SINGLE_SPEAKER_LABEL
 
-    def detect_speakers(self, audio_path):
-        diarization = self.pipeline(audio_path)
-        return diarization
\ No newline at end of file
+        # I modelli vengono caricati solo al primo utilizzo: se il fast path
+        # rileva un solo speaker la pipeline completa non viene mai costruita
+        self._pipeline = None
+        self._embedding = None
+
+    @property
+    def pipeline(self):
+        if self._pipeline is None:
+            self._pipeline = Pipeline.from_pretrained(self.model_id, use_auth_token=self.hf_token)
+            self._pipeline.to(self.device)
+        return self._pipeline
+
+    @property
+    def embedding(self):
+        if self._embedding is None:
+            model = Model.from_pretrained(self.embedding_model_id, use_auth_token=self.hf_token)
+            self._embedding = Inference(model, window="whole", device=self.device)
+        return self._embedding
+
+    @staticmethod
+    def _as_tensor(audio):
+        with warnings.catch_warnings():
+            # Il buffer condiviso è in sola lettura: torch lo segnala ma non lo modifica
+            warnings.filterwarnings("ignore", message="The given NumPy array is not writable")
+            return torch.from_numpy(audio).unsqueeze(0)
+
+    def detect_speakers(self, audio, sample_rate=None):
+        """
+        Esegue la diarizzazione su un percorso audio oppure su una forma
+        d'onda mono già decodificata (np.ndarray float32 + sample_rate).
+        """
+        if isinstance(audio, str):
+            return self.pipeline(audio)
+
+        diarization = self.pipeline({"waveform": self._as_tensor(audio), "sample_rate": sample_rate})
+        return diarization
+
+    def _sample_windows(self, samples, sample_rate):
+        """
+        Sceglie `num_samples` finestre distribuite su tutta la registrazione,
+        preferendo le più energetiche (parlato) tra 3x candidati equispaziati.
+        """
+        window = int(self.window_s * sample_rate)
+        if len(samples) < window:
+            return []
+
+        positions = np.linspace(0, len(samples) - window, 3 * self.num_samples).astype(np.int64)
+        windows = []
+        for start in positions:
+            chunk = samples[start:start + window]
+            if chunk.dtype == np.int16:
+                chunk = pcm_to_float(chunk)
+            windows.append((float(np.mean(np.square(chunk))), chunk))
+
+        windows.sort(key=lambda w: w[0], reverse=True)
+        return [chunk for energy, chunk in windows[:self.num_samples] if energy > 0]
+
+    def is_single_speaker(self, samples, sample_rate):
+        """
+        Stima rapida del numero di speaker: calcola l'embedding di alcune
+        finestre campionate sulla registrazione e considera la lezione a
+        speaker singolo se il 90° percentile delle distanze coseno tra gli
+        embedding resta sotto SINGLE_SPEAKER_MAX_DISTANCE.
+
+        Returns:
+            tuple[bool, float]: Esito e distanza misurata.
+        """
+        windows = self._sample_windows(samples, sample_rate)
+        if len(windows) < 2:
+            return False, float("nan")
+
+        embeddings = np.stack([
+            np.asarray(self.embedding({"waveform": self._as_tensor(chunk), "sample_rate": sample_rate})).reshape(-1)
+            for chunk in windows
+        ])
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-12
+        distances = 1.0 - embeddings @ embeddings.T
+        spread = float(np.percentile(distances[np.triu_indices(len(windows), k=1)], 90))
+        return spread < self.max_distance, spread
+
+    def single_speaker_segments(self, duration):
+        """Segmenti (start, end, speaker) che attribuiscono tutto a un unico speaker."""
+        return [(0.0, duration, self.single_label)]
@@ -0,0 +1,87 @@
+import threading
+import tiktoken
+
+
+class TokenCounter:
+    """
+    Conteggio dei token con memoizzazione per testo.
+
+    Avvolge un tokenizer Hugging Face (fast) oppure un encoding tiktoken:
+    `count_many` codifica in un'unica chiamata batch solo i testi mai visti
+    e memorizza il risultato, quindi frasi ricontate da step diversi (o da
+    rerun con parametri diversi) non vengono ricodificate.
+    """
+
+    def __init__(self, tokenizer=None, encoding=None, add_special_tokens=True, max_entries=1_000_000):
+        if (tokenizer is None) == (encoding is None):
+            raise ValueError("Serve esattamente uno tra tokenizer (Hugging Face) ed encoding (tiktoken).")
+        self.tokenizer = tokenizer
+        self.encoding = encoding
+        self.add_special_tokens = add_special_tokens
+        self.max_entries = max_entries
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_pretrained(cls, model_name, hf_token=None, **kwargs):
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True, token=hf_token)
+        return cls(tokenizer=tokenizer, **kwargs)
+
+    @classmethod
+    def from_tiktoken(cls, model_name="gpt-3.5-turbo", **kwargs):
+        try:
+            encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            print(f"Attenzione: Modello '{model_name}' non trovato. Uso 'cl100k_base'.")
+            encoding = tiktoken.get_encoding("cl100k_base")
+        return cls(encoding=encoding, **kwargs)
+
+    def _encode_batch(self, texts):
+        if self.encoding is not None:
+            return [len(ids) for ids in self.encoding.encode_batch(texts, disallowed_special=())]
+        encoded = self.tokenizer(
+            texts, add_special_tokens=self.add_special_tokens, truncation=False
+        )["input_ids"]
+        return [len(ids) for ids in encoded]
+
+    def count_many(self, texts):
+        """Numero di token di ogni testo, nello stesso ordine."""
+        texts = list(texts)
+        with self._lock:
+            counts = [self._counts.get(t) for t in texts]
+
+        missing = list(dict.fromkeys(t for t, c in zip(texts, counts) if c is None))
+        if not missing:
+            return counts
+
+        new_counts = dict(zip(missing, self._encode_batch(missing)))
+        with self._lock:
+            if len(self._counts) + len(new_counts) > self.max_entries:
+                self._counts.clear()
+            self._counts.update(new_counts)
+        return [new_counts[t] if c is None else c for t, c in zip(texts, counts)]
+
+    def count(self, text):
+        return self.count_many([text])[0]
+
+
+_SHARED_COUNTERS = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def get_token_counter(model_name, backend="hf", hf_token=None):
+    """
+    Restituisce il TokenCounter condiviso per (backend, modello), così la
+    memoizzazione vale per tutta la pipeline. backend: "hf" o "tiktoken".
+    """
+    key = (backend, model_name)
+    with _SHARED_LOCK:
+        if key not in _SHARED_COUNTERS:
+            if backend == "tiktoken":
+                _SHARED_COUNTERS[key] = TokenCounter.from_tiktoken(model_name)
+            elif backend == "hf":
+                _SHARED_COUNTERS[key] = TokenCounter.from_pretrained(model_name, hf_token=hf_token)
+            else:
+                raise ValueError(f"Backend di tokenizzazione sconosciuto: {backend}")
+        return _SHARED_COUNTERS[key]
@@ -1,19 +1,190 @@
-from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
+from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, StoppingCriteria, StoppingCriteriaList, pipeline
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import importlib
+import os
+import re
+import shutil
 import torch
+import numpy as np
+from ..utils.audio_utils import (
+    iter_audio_windows, pcm_to_float, detect_speech_regions, remove_silence, restore_timestamp,
+    open_wav_pcm
+)
+
+# Transcriber del processo worker, creato una sola volta da _init_shard_worker
+_WORKER_TRANSCRIBER = None
+
+
+def _init_shard_worker(num_threads, overrides):
+    global _WORKER_TRANSCRIBER
+    torch.set_num_threads(num_threads)
+    config = importlib.import_module("config")
+    for name, value in (overrides or {}).items():
+        setattr(config, name, value)
+    _WORKER_TRANSCRIBER = Transcriber(config)
+
+
+def _transcribe_shard(audio_file, start, end):
+    pcm, sample_rate = open_wav_pcm(audio_file)
+    loops_before = _WORKER_TRANSCRIBER.repetition_loops
+    chunks = _WORKER_TRANSCRIBER.transcribe_window(pcm[start:end], sample_rate, start)
+    return chunks, _WORKER_TRANSCRIBER.repetition_loops - loops_before
+
+
+def _import_ort_model():
+    try:
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+    except ImportError as e:
+        raise ImportError(
+            "Il backend 'onnx' richiede optimum: pip install optimum[onnxruntime]"
+        ) from e
+    return ORTModelForSpeechSeq2Seq
+
+
+def export_onnx_model(model_id, export_root):
+    """
+    Esporta il modello in ONNX una sola volta in `export_root` e restituisce
+    la cartella dell'export. La cartella finale compare solo a export
+    completato (rinomina atomica), quindi un export interrotto viene rifatto.
+    """
+    export_dir = os.path.join(export_root, re.sub(r"[^A-Za-z0-9_.-]+", "-", model_id))
+    if os.path.isfile(os.path.join(export_dir, "config.json")):
+        return export_dir
+
+    ORTModelForSpeechSeq2Seq = _import_ort_model()
+    print(f"Esportazione ONNX di {model_id} in {export_dir} (solo al primo utilizzo)...")
+    tmp_dir = f"{export_dir}.tmp{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    ORTModelForSpeechSeq2Seq.from_pretrained(model_id, export=True).save_pretrained(tmp_dir)
+    try:
+        os.replace(tmp_dir, export_dir)
+    except OSError:
+        # Un altro processo ha completato lo stesso export nel frattempo
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return export_dir
+
+
+def transcribe_parallel(audio_file, windows, num_workers, threads_per_worker, checkpoint=None, overrides=None):
+    """
+    Trascrive le finestre [(start, end), ...] del WAV in un pool di processi.
+
+    Ogni worker carica il proprio modello con `threads_per_worker` thread
+    torch e mappa il WAV in memoria per conto suo, quindi l'audio non viene
+    mai copiato tra processi. Generatore: restituisce i chunk di ogni
+    finestra (timestamp assoluti) nell'ordine delle finestre, pronti per
+    align_transcription_with_diarization. `overrides` permette di cambiare
+    attributi di config nei worker (es. il modello nei benchmark).
+    """
+    windows = list(windows)
+    repetition_loops = 0
+    cached = [checkpoint.load_window(start, end) if checkpoint else None for start, end in windows]
+    if all(chunks is not None for chunks in cached):
+        yield from cached
+        return
+
+    config = importlib.import_module("config")
+    settings = {
+        name: (overrides or {}).get(name, getattr(config, name))
+        for name in ("TRANSCRIBER_BACKEND", "TRANSCRIBER_MODEL", "ONNX_EXPORT_DIR")
+    }
+    if settings["TRANSCRIBER_BACKEND"] == "onnx":
+        # Export nel processo principale: i worker caricano tutti la stessa copia su disco
+        export_onnx_model(settings["TRANSCRIBER_MODEL"], settings["ONNX_EXPORT_DIR"])
+
+    # "spawn": fork dopo l'inizializzazione di torch può bloccare i pool di thread
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=context,
+        initializer=_init_shard_worker,
+        initargs=(threads_per_worker, overrides)
+    ) as executor:
+        futures = [
+            None if chunks is not None else executor.submit(_transcribe_shard, audio_file, start, end)
+            for (start, end), chunks in zip(windows, cached)
+        ]
+        for (start, end), chunks, future in zip(windows, cached, futures):
+            if future is not None:
+                chunks, loops = future.result()
+                repetition_loops += loops
+                if checkpoint is not None:
+                    checkpoint.save_window(start, end, chunks)
+            yield chunks
+
+    print(f"Loop di ripetizione interrotti durante la decodifica: {repetition_loops}")
+
+
+class RepetitionLoopGuard(StoppingCriteria):
+    """
+    Criterio di arresto per i loop di ripetizione di Whisper.
+
+    A ogni passo di decodifica controlla la coda di ciascuna sequenza: se lo
+    stesso n-gramma (fino a `max_ngram` token) si ripete consecutivamente
+    almeno `min_repeats` volte e copre almeno `min_span_tokens` token, la
+    generazione di quella sequenza viene interrotta. I token di timestamp
+    vengono ignorati, così un loop spezzato in più segmenti viene comunque
+    riconosciuto. `fired` conta quante volte il guard è intervenuto.
+    """
+
+    def __init__(self, eos_token_id, timestamp_begin=None, max_ngram=6, min_repeats=4, min_span_tokens=16):
+        self.eos_token_id = eos_token_id
+        self.timestamp_begin = timestamp_begin
+        self.max_ngram = max_ngram
+        self.min_repeats = min_repeats
+        self.min_span_tokens = min_span_tokens
+        self.fired = 0
+        # Coda massima da esaminare, con margine per i token di timestamp intercalati
+        self._tail = 2 * max(n * self._repeats_for(n) for n in range(1, max_ngram + 1))
+
+    def _repeats_for(self, n):
+        return max(self.min_repeats, -(-self.min_span_tokens // n))
+
+    def _is_looping(self, ids):
+        for n in range(1, self.max_ngram + 1):
+            span = n * self._repeats_for(n)
+            if len(ids) < span:
+                break
+            tail = ids[-span:]
+            pattern = tail[-n:]
+            if all(tail[i] == pattern[i % n] for i in range(span - n)):
+                return True
+        return False
+
+    def __call__(self, input_ids, scores, **kwargs):
+        is_done = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        for row, ids in enumerate(input_ids[:, -self._tail:].tolist()):
+            # Le sequenze già concluse vengono riempite con EOS: non sono loop
+            if ids[-1] == self.eos_token_id:
+                continue
+            if self.timestamp_begin is not None:
+                ids = [token for token in ids if token < self.timestamp_begin]
+            if self._is_looping(ids):
+                is_done[row] = True
+                self.fired += 1
+        return is_done
+
 
 class Transcriber:
     def __init__(self, config):
         
         self.model_id = config.TRANSCRIBER_MODEL
         self.lang = config.FORCED_LANGUAGE
-        self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
-        self.torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
-
-        self.model = AutoModelForSpeechSeq2Seq.from_pretrained(
-            self.model_id, dtype=self.torch_dtype, low_cpu_mem_usage=True, use_safetensors=True
-        )
+        self.return_timestamps = config.TRANSCRIBER_TIMESTAMPS
+        self.vad_enabled = config.VAD_ENABLED
+        self.vad_params = {
+            "threshold_db": config.VAD_THRESHOLD_DB,
+            "speech_margin_db": config.VAD_SPEECH_MARGIN_DB,
+            "min_silence_s": config.VAD_MIN_SILENCE_S,
+            "padding_s": config.VAD_PADDING_S,
+        }
+        self.backend = config.TRANSCRIBER_BACKEND
+        self.onnx_export_dir = config.ONNX_EXPORT_DIR
+        use_cuda = torch.cuda.is_available() and self.backend == "torch"
+        self.device = "cuda:0" if use_cuda else "cpu"
+        self.torch_dtype = torch.float16 if use_cuda else torch.float32
 
-        self.model.to(self.device)
+        self.model = self._load_model()
 
         self.processor = AutoProcessor.from_pretrained(self.model_id)
 
@@ -21,14 +192,156 @@ class Transcriber:
             "automatic-speech-recognition",
             model=self.model,
             tokenizer=self.processor.tokenizer,
-            return_timestamps=True,
+            return_timestamps=self.return_timestamps,
             feature_extractor=self.processor.feature_extractor,
             batch_size = 4,
             dtype=self.torch_dtype,
             device=self.device,
-            generate_kwargs={"language": self.lang}
+            generate_kwargs=self._generate_kwargs(config)
+        )
+
+    def _generate_kwargs(self, config):
+        """
+        Parametri di generazione: lingua forzata, guard contro i loop di
+        ripetizione e, se configurato, fallback di temperatura di Whisper
+        (la finestra viene ridecodificata quando il rapporto di compressione
+        del testo supera la soglia, come accade dopo un loop interrotto).
+        """
+        generate_kwargs = {"language": self.lang}
+
+        self.repetition_guard = None
+        if config.REPETITION_GUARD_ENABLED:
+            no_timestamps_id = getattr(self.model.generation_config, "no_timestamps_token_id", None)
+            self.repetition_guard = RepetitionLoopGuard(
+                eos_token_id=self.processor.tokenizer.eos_token_id,
+                timestamp_begin=no_timestamps_id + 1 if no_timestamps_id is not None else None,
+                max_ngram=config.REPETITION_MAX_NGRAM,
+                min_repeats=config.REPETITION_MIN_REPEATS,
+                min_span_tokens=config.REPETITION_MIN_SPAN_TOKENS
+            )
+            generate_kwargs["stopping_criteria"] = StoppingCriteriaList([self.repetition_guard])
+
+        if config.REPETITION_FALLBACK_TEMPERATURES:
+            generate_kwargs["temperature"] = tuple(config.REPETITION_FALLBACK_TEMPERATURES)
+            generate_kwargs["compression_ratio_threshold"] = config.REPETITION_COMPRESSION_RATIO
+
+        return generate_kwargs
+
+    @property
+    def repetition_loops(self):
+        """Numero di loop di ripetizione interrotti finora da questo Transcriber."""
+        return self.repetition_guard.fired if self.repetition_guard else 0
+
+    def _load_model(self):
+        """
+        Carica il modello secondo TRANSCRIBER_BACKEND:
+        "torch" (float32/float16), "int8" (quantizzazione dinamica dei layer
+        lineari, solo CPU) oppure "onnx" (ONNX Runtime tramite optimum,
+        caricato dall'export salvato in ONNX_EXPORT_DIR).
+        """
+        if self.backend == "onnx":
+            export_dir = export_onnx_model(self.model_id, self.onnx_export_dir)
+            return _import_ort_model().from_pretrained(export_dir)
+
+        if self.backend not in ("torch", "int8"):
+            raise ValueError(f"TRANSCRIBER_BACKEND non supportato: {self.backend}. Usa 'torch', 'int8' o 'onnx'.")
+
+        model = AutoModelForSpeechSeq2Seq.from_pretrained(
+            self.model_id, dtype=self.torch_dtype, low_cpu_mem_usage=True, use_safetensors=True
+        )
+        model.to(self.device)
+
+        if self.backend == "int8":
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    def transcribe(self, audio, sample_rate=None):
+        """
+        Trascrive un percorso audio oppure una forma d'onda mono già
+        decodificata (np.ndarray float32 + sample_rate).
+        """
+        if isinstance(audio, str):
+            return self.pipeline(audio)
+
+        if not self.vad_enabled:
+            # La pipeline consuma il dizionario di input: ne serve uno nuovo a ogni chiamata
+            return self.pipeline({"raw": audio, "sampling_rate": sample_rate})
+
+        return self._transcribe_speech_only(audio, sample_rate)
+
+    def _transcribe_speech_only(self, audio, sample_rate):
+        """
+        Pre-passaggio VAD: trascrive solo le regioni di parlato e riporta i
+        timestamp dei chunk sulla timeline dell'audio originale.
+        """
+        regions = detect_speech_regions(audio, sample_rate, **self.vad_params)
+        if len(regions) == 0:
+            return {"text": "", "chunks": []}
+
+        compact, offset_map = remove_silence(audio, sample_rate, regions)
+        result = self.pipeline({"raw": compact, "sampling_rate": sample_rate})
+
+        for chunk in result.get("chunks", []):
+            start, end = chunk["timestamp"]
+            chunk["timestamp"] = (
+                restore_timestamp(start, offset_map),
+                restore_timestamp(end, offset_map, is_end=True),
+            )
+        return result
+
+    def transcribe_window(self, window, sample_rate, start):
+        """
+        Trascrive una finestra di campioni che inizia al campione `start`
+        e restituisce i chunk con timestamp assoluti, limitati alla fine
+        della finestra.
+        """
+        if window.dtype == np.int16:
+            window = pcm_to_float(window)
+
+        offset = start / sample_rate
+        window_end = (start + len(window)) / sample_rate
+        result = self.transcribe(window, sample_rate)
+
+        chunks = []
+        for chunk in result.get("chunks", []):
+            chunk_start, chunk_end = chunk["timestamp"]
+            chunk_start = offset + (chunk_start or 0.0)
+            chunk_end = window_end if chunk_end is None else min(offset + chunk_end, window_end)
+            chunks.append({"text": chunk["text"], "timestamp": (chunk_start, chunk_end)})
+        return chunks
+
+    def transcribe_stream(self, pcm, sample_rate, window_s=300.0, search_s=10.0, checkpoint=None):
+        """
+        Trascrive l'audio a finestre limitate invece che in un'unica chiamata.
+
+        Generatore: per ogni finestra restituisce la lista dei chunk con
+        timestamp assoluti (riferiti all'inizio dell'audio). Accetta sia
+        campioni int16 mappati in memoria sia float32; la conversione avviene
+        solo sulla finestra corrente, quindi la memoria resta costante.
+        Con un CheckpointStore le finestre già trascritte vengono riutilizzate
+        e quelle nuove salvate appena completate.
+        """
+        windows = (
+            (start, pcm[start:end])
+            for start, end in iter_audio_windows(pcm, sample_rate, window_s=window_s, search_s=search_s)
         )
+        yield from self.transcribe_windows(windows, sample_rate, checkpoint=checkpoint)
+
+    def transcribe_windows(self, windows, sample_rate, checkpoint=None):
+        """
+        Come transcribe_stream, ma su un iterabile di (start, campioni) già
+        pronto, ad esempio le finestre lette dallo stdout di ffmpeg.
+        """
+        for start, window in windows:
+            end = start + len(window)
+            if checkpoint is not None:
+                cached = checkpoint.load_window(start, end)
+                if cached is not None:
+                    yield cached
+                    continue
+
+            chunks = self.transcribe_window(window, sample_rate, start)
 
-    def transcribe(self, audio_path):
-        result = self.pipeline(audio_path)
-        return result
\ No newline at end of file
+            if checkpoint is not None:
+                checkpoint.save_window(start, end, chunks)
+            yield chunks
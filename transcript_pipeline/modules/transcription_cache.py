@@ -0,0 +1,118 @@
+import hashlib
+import os
+import shutil
+import numpy as np
+
+# Parametri di config che cambiano l'output dello step 2, divisi per fase:
+# sia la cache sia i checkpoint costruiscono le proprie chiavi da qui
+TRANSCRIPTION_SETTINGS = (
+    "TRANSCRIBER_MODEL", "TRANSCRIBER_BACKEND", "FORCED_LANGUAGE", "TRANSCRIBER_TIMESTAMPS",
+    "VAD_ENABLED", "VAD_THRESHOLD_DB", "VAD_SPEECH_MARGIN_DB", "VAD_MIN_SILENCE_S", "VAD_PADDING_S",
+    "REPETITION_GUARD_ENABLED", "REPETITION_MAX_NGRAM", "REPETITION_MIN_REPEATS",
+    "REPETITION_MIN_SPAN_TOKENS", "REPETITION_FALLBACK_TEMPERATURES", "REPETITION_COMPRESSION_RATIO",
+)
+DIARIZATION_SETTINGS = ("DIARIZATION_MODEL",)
+SPEAKER_COUNT_SETTINGS = (
+    "SPEAKER_COUNT_MODE", "SPEAKER_EMBEDDING_MODEL", "SINGLE_SPEAKER_SAMPLES",
+    "SINGLE_SPEAKER_WINDOW_S", "SINGLE_SPEAKER_MAX_DISTANCE", "SINGLE_SPEAKER_LABEL",
+)
+ALIGNMENT_SETTINGS = ("WORD_MERGE_MAX_GAP_S",)
+# I tagli dell'audio dipendono dalla modalità: finestre (streaming/checkpoint) o shard del percorso batch
+WINDOWED_SETTINGS = ("STREAM_WINDOW_S", "STREAM_SPLIT_SEARCH_S")
+BATCH_SETTINGS = ("TRANSCRIBER_NUM_SHARDS", "STREAM_SPLIT_SEARCH_S")
+
+
+def step2_settings(config, names):
+    """Coppie (nome, valore) dei parametri indicati, in forma stabile per l'hash."""
+    return tuple((name, repr(getattr(config, name))) for name in names)
+
+
+def settings_digest(settings):
+    return hashlib.blake2b(repr(settings).encode("utf-8"), digest_size=8).hexdigest()
+
+
+class TranscriptionCache:
+    """
+    Cache su disco dei risultati dello step 2 indicizzata per contenuto.
+
+    La chiave è l'hash del PCM decodificato più tutti i parametri che
+    influenzano l'output (modelli, VAD, guard di ripetizione, stima degli
+    speaker, allineamento) e la modalità, a finestre o batch, quindi una stessa registrazione scaricata
+    in un'altra cartella o ricaricata con un altro nome viene riconosciuta.
+    Quando la dimensione totale supera il limite configurato vengono rimosse
+    le voci usate meno di recente (LRU basata sul mtime).
+    """
+
+    RESULT_FILE = "raw_aligned.csv"
+
+    def __init__(self, config):
+        self.folder = config.TRANSCRIPTION_CACHE_DIR
+        self.max_bytes = int(config.TRANSCRIPTION_CACHE_MAX_MB * 1024 * 1024)
+        common = TRANSCRIPTION_SETTINGS + DIARIZATION_SETTINGS + SPEAKER_COUNT_SETTINGS + ALIGNMENT_SETTINGS
+        self.settings = {
+            windowed: step2_settings(config, common + (WINDOWED_SETTINGS if windowed else BATCH_SETTINGS))
+            + (("windowed", str(windowed)),)
+            for windowed in (False, True)
+        }
+        os.makedirs(self.folder, exist_ok=True)
+
+    def key_for(self, pcm, windowed=False, block_size=16000 * 60):
+        """
+        Calcola la chiave a partire dai campioni PCM (anche mappati in memoria);
+        `windowed` indica se l'output viene dal percorso a finestre.
+        """
+        blocks = (pcm[start:start + block_size] for start in range(0, len(pcm), block_size))
+        return self.key_for_blocks(blocks, windowed=windowed)
+
+    def key_for_blocks(self, blocks, windowed=False):
+        """Come key_for, ma su un iterabile di blocchi int16 (es. lo stdout di ffmpeg)."""
+        digest = hashlib.blake2b(digest_size=20)
+        for block in blocks:
+            digest.update(memoryview(np.ascontiguousarray(block)).cast("B"))
+        digest.update(repr(self.settings[windowed]).encode("utf-8"))
+        return digest.hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.folder, key)
+
+    def restore(self, key, output_path):
+        """Copia il risultato in cache su output_path. Restituisce True se trovato."""
+        cached_file = os.path.join(self._entry(key), self.RESULT_FILE)
+        if not os.path.isfile(cached_file):
+            return False
+        shutil.copyfile(cached_file, output_path)
+        # Aggiorna il mtime della voce: è l'ordine usato per l'eviction LRU
+        os.utime(self._entry(key))
+        return True
+
+    def store(self, key, result_path):
+        """Salva in cache il CSV prodotto dallo step 2 e applica il limite di spazio."""
+        entry = self._entry(key)
+        tmp_entry = entry + ".tmp"
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+        os.makedirs(tmp_entry)
+        shutil.copyfile(result_path, os.path.join(tmp_entry, self.RESULT_FILE))
+        shutil.rmtree(entry, ignore_errors=True)
+        os.replace(tmp_entry, entry)
+        self._evict(keep=key)
+
+    def _evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if not os.path.isdir(path) or name.endswith(".tmp"):
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)
+            )
+            entries.append((os.path.getmtime(path), size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(os.path.join(self.folder, name), ignore_errors=True)
+            total -= size
+            print(f"   [Cache] Rimossa trascrizione in cache {name} (LRU)")
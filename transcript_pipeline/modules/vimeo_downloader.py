@@ -5,7 +5,8 @@ import shutil
 import re
 
 class VimeoDownloader:
-    def __init__(self, config):
+    def __init__(self, config, outtmpl=None):
+        """`outtmpl` sostituisce il template dei nomi di file di YDL_OPT e YDL_OPT_AUDIO."""
         self.cookies_path = config.COOKIES_FILE    
         if config.YDL_OPT is None:
             self.ydl_opt = {
@@ -14,11 +15,51 @@ class VimeoDownloader:
                 }
         else:
             self.ydl_opt = config.YDL_OPT
+        if outtmpl is not None:
+            self.ydl_opt = {**self.ydl_opt, "outtmpl": outtmpl}
         self.ydl = yt_dlp.YoutubeDL(self.ydl_opt) 
+        if config.YDL_OPT_AUDIO is None:
+            self.ydl_opt_audio = {
+                key: value for key, value in self.ydl_opt.items() if key != "merge_output_format"
+                }
+            self.ydl_opt_audio["format"] = "bestaudio/best"
+        else:
+            self.ydl_opt_audio = config.YDL_OPT_AUDIO
+        if outtmpl is not None:
+            self.ydl_opt_audio = {**self.ydl_opt_audio, "outtmpl": outtmpl}
+        self._ydl_audio = None
+
+    @property
+    def ydl_audio(self):
+        # Istanza separata (e creata solo se serve) per non toccare il formato del download video
+        if self._ydl_audio is None:
+            self._ydl_audio = yt_dlp.YoutubeDL(self.ydl_opt_audio)
+        return self._ydl_audio
 
     def download_video(self, url):
-        info_dict = self.ydl.extract_info(url, download=True)
-        file_path = self.ydl.prepare_filename(info_dict)
+        return self.download(self.fetch_info(url))
+
+    def download_audio(self, url):
+        """
+        Scarica solo la migliore traccia audio disponibile (es. .m4a/.webm),
+        senza lo stream video. Il file viene spostato nella stessa cartella
+        per lezione creata da download_video.
+        """
+        return self.download(self.fetch_info(url, audio_only=True), audio_only=True)
+
+    def fetch_info(self, url, audio_only=False):
+        """Metadati del video (id, titolo, formati) senza scaricare nulla."""
+        ydl = self.ydl_audio if audio_only else self.ydl
+        return ydl.extract_info(url, download=False)
+
+    def download(self, info_dict, audio_only=False):
+        """Scarica il video descritto da info_dict e lo sposta nella sua cartella."""
+        ydl = self.ydl_audio if audio_only else self.ydl
+        info_dict = ydl.process_ie_result(info_dict, download=True)
+        file_path = ydl.prepare_filename(info_dict)
+        return self._move_to_folder(file_path)
+
+    def _move_to_folder(self, file_path):
         base_name = os.path.splitext(file_path)[0]
         folder_name_decoded = unidecode(base_name)
         folder_name = re.sub(r'[<>:"/\\|?*]', '', folder_name_decoded)
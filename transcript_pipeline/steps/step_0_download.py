@@ -1,15 +1,34 @@
-from ..modules.vimeo_downloader import VimeoDownloader
+from ..modules.download_manager import DownloadManager
 import config
 
 def run(url: str):
     """
-    Scarica da Vimeo il video indicato dall url e lo salva come file .mp4.
+    Scarica da Vimeo il video indicato dall url e lo salva come file .mp4
+    (o solo la traccia audio se DOWNLOAD_AUDIO_ONLY è attivo).
     Crea la cartella dove verranno salvati tutti i file generati.
-    Restituisce il percorso del file video.
+    Come con il manifest, un video già scaricato (marker nella cartella)
+    non viene riscaricato.
+    Restituisce il percorso del file scaricato.
     """
     print("-> Inizializzazione VimeoDownloader")
-    downloader = VimeoDownloader(config)
-    print("-> Donwload del video")
-    video_file = downloader.download_video(url)
+    manager = DownloadManager(config)
+    if config.DOWNLOAD_AUDIO_ONLY:
+        print("-> Donwload della sola traccia audio")
+    else:
+        print("-> Donwload del video")
+    video_file = manager.download_one(url)
+    if video_file is None:
+        raise RuntimeError(f"Download non riuscito: {url}")
 
-    return video_file
\ No newline at end of file
+    return video_file
+
+def run_many(urls):
+    """
+    Scarica più URL in parallelo (al massimo DOWNLOAD_CONCURRENCY alla volta),
+    saltando i video già scaricati. Restituisce i percorsi dei file nello
+    stesso ordine degli URL (None per i download falliti o duplicati) e il
+    dizionario URL -> id dei duplicati.
+    """
+    print(f"-> Download di {len(urls)} URL ({config.DOWNLOAD_CONCURRENCY} in parallelo)")
+    manager = DownloadManager(config, outtmpl=config.DOWNLOAD_MANIFEST_OUTTMPL)
+    return manager.download_all(urls), manager.duplicates
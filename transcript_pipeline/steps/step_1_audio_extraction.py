@@ -1,8 +1,19 @@
-from ..utils.audio_utils import build_cmd, extract_audio_from_video
+from ..utils.audio_utils import build_cmd, extract_audio_from_video, extract_audio_parallel
 import os
 import config
 
 def run(video_file: str):
+    if config.AUDIO_STREAMING:
+        print("-> AUDIO_STREAMING attivo: l'audio verrà letto da ffmpeg direttamente nello step 2")
+        return None
+
+    # video_file può essere anche la sola traccia audio scaricata con DOWNLOAD_AUDIO_ONLY:
+    # ffmpeg la decodifica e ricampiona allo stesso modo
     print("-> Extrazione traccia audio dal video")
-    audio_file = extract_audio_from_video(video_file, os.path.dirname(video_file), 'wav')
+    if config.AUDIO_EXTRACTION_WORKERS > 1:
+        audio_file = extract_audio_parallel(
+            video_file, os.path.dirname(video_file), config.AUDIO_EXTRACTION_WORKERS, config.AUDIO_SAMPLE_RATE
+        )
+    else:
+        audio_file = extract_audio_from_video(video_file, os.path.dirname(video_file), 'wav')
     return audio_file
\ No newline at end of file
@@ -1,85 +1,393 @@
-from ..modules.transcriber import Transcriber
+from ..modules.transcriber import Transcriber, transcribe_parallel
 from ..modules.speaker_detector import SpeakerDetector
+from ..modules.aligner import SpeakerAligner
+from ..modules.checkpoint_store import CheckpointStore
+from ..modules.transcription_cache import TranscriptionCache
+from ..utils.audio_utils import (
+    load_wav_waveform, open_wav_pcm, iter_audio_windows, split_at_silence,
+    stream_audio_from_video, iter_stream_windows, pcm_to_float, FlacSamples
+)
 from ..utils.file_utils import make_output_filename, remove_hallucination_whispers
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+import multiprocessing
 from tqdm import tqdm
+import torch
+import numpy as np
 import csv
 import os
 import config
 
 
+def _align_chunks(aligner, transcription_chunks):
+    return aligner.align(
+        transcription_chunks,
+        merge_words=config.TRANSCRIBER_TIMESTAMPS == "word",
+        max_word_gap=config.WORD_MERGE_MAX_GAP_S
+    )
+
+
 def align_transcription_with_diarization(diarization_segments, transcription_chunks):
     """
     Allinea i chunk di trascrizione di Whisper con i segmenti di diarizzazione.
 
     Assegna uno speaker a ciascun chunk di testo in base alla
-    sovrapposizione temporale massima.
+    sovrapposizione temporale massima. Usa un indice a intervalli
+    (SpeakerAligner) invece di confrontare ogni chunk con ogni turno.
+    Con timestamp a livello di parola le parole consecutive dello
+    stesso speaker vengono riunite in un'unica riga.
     """
-    aligned_results = []
-
-    # diarization_segments è una lista di (turn, _, speaker)
+    # diarization_segments è una lista di (start, end, speaker)
     # transcription_chunks è una lista di {"text": "...", "timestamp": (start, end)}
+    aligner = SpeakerAligner(diarization_segments)
+    return _align_chunks(aligner, transcription_chunks)
 
-    for chunk in tqdm(transcription_chunks, desc="Allineamento Speaker/Testo"):
-        chunk_start, chunk_end = chunk["timestamp"]
-        chunk_text = chunk["text"].strip()
 
-        if not chunk_text:
-            continue
+def _torch_thread_split():
+    """
+    Restituisce il numero di thread CPU (diarizzazione, trascrizione).
+    I valori None in config vengono ricavati dividendo i core disponibili.
+    """
+    total = os.cpu_count() or 2
+    diarization_threads = config.DIARIZATION_NUM_THREADS or max(1, total // 2)
+    transcription_threads = config.TRANSCRIPTION_NUM_THREADS or max(1, total - diarization_threads)
+    return diarization_threads, transcription_threads
 
-        overlaps = {}
 
-        for turn, _, speaker in diarization_segments:
-            turn_start = turn.start
-            turn_end = turn.end
+@contextmanager
+def _torch_threads(num_threads):
+    """
+    Imposta il pool intra-op di torch per la durata del blocco e ripristina
+    poi il valore precedente (l'impostazione è globale per il processo).
+    """
+    previous = torch.get_num_threads()
+    torch.set_num_threads(num_threads)
+    try:
+        yield
+    finally:
+        torch.set_num_threads(previous)
 
-            overlap_start = max(chunk_start, turn_start)
-            overlap_end = min(chunk_end, turn_end)
-            overlap_duration = overlap_end - overlap_start
 
-            if overlap_duration > 0:
-                if speaker not in overlaps:
-                    overlaps[speaker] = 0
-                overlaps[speaker] += overlap_duration
+def _init_diarization_worker(num_threads):
+    torch.set_num_threads(num_threads)
+
+
+def _diarize_file(audio_file, checkpoint=None):
+    # Eseguita nel processo di diarizzazione: il WAV viene mappato in memoria
+    # anche qui, quindi l'audio non passa tra i processi
+    pcm, sample_rate = open_wav_pcm(audio_file)
+    return _diarize(audio_file, sample_rate, pcm, checkpoint=checkpoint)
 
-        if overlaps:
-            best_speaker = max(overlaps, key=overlaps.get)
-        else:
-            best_speaker = "UNKNOWN" 
 
-        aligned_results.append({
-            "speaker": best_speaker,
-            "start_time": round(chunk_start, 1),
-            "end_time": round(chunk_end, 1),
-            "text": chunk_text
-        })
+def _start_diarization_process(audio_file, num_threads, checkpoint=None):
+    """
+    Avvia la diarizzazione in un processo separato con `num_threads` thread
+    torch. set_num_threads vale per l'intero processo, quindi la ripartizione
+    dei core tra diarizzazione e trascrizione richiede due processi.
+    Restituisce (executor, future).
+    """
+    # "spawn": fork dopo l'inizializzazione di torch può bloccare i pool di thread
+    executor = ProcessPoolExecutor(
+        max_workers=1,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_diarization_worker,
+        initargs=(num_threads,)
+    )
+    return executor, executor.submit(_diarize_file, audio_file, checkpoint)
 
-    return aligned_results
 
+def _diarize(audio, sample_rate, samples, checkpoint=None):
+    """
+    Esegue la diarizzazione e restituisce i segmenti come (start, end, speaker).
 
-def run(audio_file):
-    
+    `audio` è ciò che riceve pyannote (percorso o forma d'onda), `samples`
+    i campioni usati per il fast path a speaker singolo. Secondo
+    SPEAKER_COUNT_MODE la diarizzazione completa può essere saltata; il
+    modo viene valutato prima dei checkpoint, così "single" forza sempre il
+    fast path. Se è fornito un CheckpointStore, la diarizzazione completa
+    già salvata viene riusata.
+    """
     speaker_detector = SpeakerDetector(config)
+    duration = len(samples) / sample_rate
+
+    if config.SPEAKER_COUNT_MODE == "single":
+        print("SPEAKER_COUNT_MODE='single': diarizzazione completa saltata.")
+        return speaker_detector.single_speaker_segments(duration)
+
+    if config.SPEAKER_COUNT_MODE == "auto":
+        single, spread = speaker_detector.is_single_speaker(samples, sample_rate)
+        if single:
+            print(f"Rilevato un solo speaker (distanza embedding {spread:.3f}): diarizzazione completa saltata.")
+            return speaker_detector.single_speaker_segments(duration)
+        print(f"Più speaker probabili (distanza embedding {spread:.3f}): avvio diarizzazione completa.")
+
+    if checkpoint is not None:
+        diarization_segments = checkpoint.load_diarization(len(samples))
+        if diarization_segments is not None:
+            print("Diarizzazione recuperata dai checkpoint.")
+            return diarization_segments
+
+    diarization = speaker_detector.detect_speakers(audio, sample_rate)
+    diarization_segments = [
+        (turn.start, turn.end, speaker) for turn, _, speaker in diarization.itertracks(yield_label=True)
+    ]
+
+    if checkpoint is not None:
+        checkpoint.save_diarization(len(samples), diarization_segments)
+    return diarization_segments
+
+
+def _shard_threads(available_threads):
+    """Thread torch per ciascun processo worker in modalità a shard."""
+    return config.TRANSCRIBER_SHARD_THREADS or max(1, available_threads // config.TRANSCRIBER_NUM_SHARDS)
+
+
+def _transcribe(waveform, sample_rate, audio_file=None):
+    if config.TRANSCRIBER_NUM_SHARDS > 1:
+        shards = split_at_silence(waveform, sample_rate, config.TRANSCRIBER_NUM_SHARDS, config.STREAM_SPLIT_SEARCH_S)
+        threads = _shard_threads(torch.get_num_threads())
+        print(f"Trascrizione in {len(shards)} shard paralleli ({threads} thread ciascuno)...")
+        results = transcribe_parallel(audio_file, shards, config.TRANSCRIBER_NUM_SHARDS, threads)
+        return [chunk for shard_chunks in results for chunk in shard_chunks]
+
     transcriber = Transcriber(config)
+    transcription_result = transcriber.transcribe(waveform, sample_rate)
+    print(f"Loop di ripetizione interrotti durante la decodifica: {transcriber.repetition_loops}")
+    return transcription_result.get("chunks", [])
 
-    print("Fase 1: Avvio diarizzazione (SpeakerDetector)...")
-    diarization = speaker_detector.detect_speakers(audio_file)
 
-    diarization_segments = list(diarization.itertracks(yield_label=True))
-    print(f"Diarizzazione completata. Trovati {len(diarization_segments)} segmenti di parlato.")
+def _report_repetition_loops(transcriber, windows):
+    """Inoltra le finestre e, a trascrizione finita, stampa i loop interrotti."""
+    yield from windows
+    print(f"Loop di ripetizione interrotti durante la decodifica: {transcriber.repetition_loops}")
 
 
-    print("\nFase 2: Avvio trascrizione (Pipeline Transformers)...")
-    print("La pipeline elaborerà l'intero file audio (potrebbe richiedere tempo)...")
-    
-    transcription_result = transcriber.transcribe(audio_file)
+def _write_rows_incrementally(csv_file_path, windows, get_aligner):
+    """
+    Allinea e aggiunge al CSV le righe di ogni finestra appena trascritta,
+    con un flush dopo ogni finestra così il file può essere seguito.
+
+    get_aligner(wait) restituisce lo SpeakerAligner, oppure None se la
+    diarizzazione non è ancora pronta e wait è False: in quel caso il testo
+    viene accumulato e scritto appena l'allineamento è possibile.
+    """
+    aligner = None
+    pending_chunks = []
+    num_rows = 0
+
+    with open(csv_file_path, "w", newline='', encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["speaker", "start_time", "end_time", "text"])
+        writer.writeheader()
+        f.flush()
+
+        for chunks in tqdm(windows, desc="Finestre trascritte"):
+            pending_chunks.extend(chunks)
+
+            aligner = aligner or get_aligner(False)
+            if aligner is None:
+                continue
+
+            rows = _align_chunks(aligner, pending_chunks)
+            writer.writerows(rows)
+            f.flush()
+            num_rows += len(rows)
+            pending_chunks = []
+
+        aligner = aligner or get_aligner(True)
+        if pending_chunks:
+            rows = _align_chunks(aligner, pending_chunks)
+            writer.writerows(rows)
+            num_rows += len(rows)
+
+    if num_rows == 0:
+        print("Attenzione: La trascrizione non ha prodotto alcun chunk.")
+    print(f"Trascrizione allineata (non unita) salvata in: {csv_file_path} ({num_rows} righe)")
+    return num_rows
+
+
+def _run_streaming(audio_file, csv_file_path):
+    """
+    Variante a finestre dello step 2: la trascrizione procede per finestre
+    di STREAM_WINDOW_S secondi e le righe allineate vengono aggiunte al CSV
+    man mano, così il file può essere seguito mentre lo step è in corso.
+    """
+    pcm, sample_rate = open_wav_pcm(audio_file)
+    print(f"Audio mappato in memoria: {len(pcm) / sample_rate:.0f} s a {sample_rate} Hz.")
+
+    checkpoint = CheckpointStore(audio_file, config) if config.STEP2_CHECKPOINTS else None
+    if checkpoint is not None:
+        print(f"Checkpoint attivi in: {checkpoint.folder}")
+
+    executor = None
+    diarization_future = None
+    aligner = None
+    threads = nullcontext()
+
+    if config.STEP2_CONCURRENT:
+        diarization_threads, transcription_threads = _torch_thread_split()
+        print(
+            "Fase 1: Diarizzazione in un processo separato "
+            f"({diarization_threads} + {transcription_threads} thread CPU)..."
+        )
+        # pyannote legge il file a blocchi: non serve decodificarlo tutto in memoria
+        executor, diarization_future = _start_diarization_process(audio_file, diarization_threads, checkpoint)
+        threads = _torch_threads(transcription_threads)
+    else:
+        print("Fase 1: Avvio diarizzazione (SpeakerDetector)...")
+        diarization_segments = _diarize(audio_file, sample_rate, pcm, checkpoint=checkpoint)
+        print(f"Diarizzazione completata. Trovati {len(diarization_segments)} segmenti di parlato.")
+        aligner = SpeakerAligner(diarization_segments)
+
+    def get_aligner(wait):
+        if aligner is not None:
+            return aligner
+        if not wait and not diarization_future.done():
+            # Finché la diarizzazione non termina si accumula solo il testo
+            return None
+        diarization_segments = diarization_future.result()
+        print(f"Diarizzazione completata. Trovati {len(diarization_segments)} segmenti di parlato.")
+        return SpeakerAligner(diarization_segments)
+
+    print("\nFase 2-3: Trascrizione a finestre e allineamento incrementale...")
+    try:
+        with threads:
+            if config.TRANSCRIBER_NUM_SHARDS > 1:
+                # Le finestre vengono distribuite su più processi e restituite in ordine
+                audio_windows = iter_audio_windows(
+                    pcm, sample_rate, window_s=config.STREAM_WINDOW_S, search_s=config.STREAM_SPLIT_SEARCH_S
+                )
+                windows = transcribe_parallel(
+                    audio_file, audio_windows, config.TRANSCRIBER_NUM_SHARDS,
+                    _shard_threads(torch.get_num_threads()), checkpoint=checkpoint
+                )
+            else:
+                transcriber = Transcriber(config)
+                windows = _report_repetition_loops(transcriber, transcriber.transcribe_stream(
+                    pcm, sample_rate, window_s=config.STREAM_WINDOW_S, search_s=config.STREAM_SPLIT_SEARCH_S,
+                    checkpoint=checkpoint
+                ))
+            _write_rows_incrementally(csv_file_path, windows, get_aligner)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    return csv_file_path
+
+
+def run_from_video(video_file):
+    """
+    Step 2 senza WAV intermedio: il PCM a 16 kHz viene letto direttamente
+    dallo stdout di ffmpeg e trascritto a finestre man mano che arriva.
+
+    Con AUDIO_STREAM_FLAC_COPY attivo la stessa decodifica scrive una copia
+    FLAC: pyannote, la stima del numero di speaker e la chiave della cache
+    leggono da lì, quindi in memoria resta solo la finestra corrente. Senza
+    copia FLAC la diarizzazione richiede l'intera registrazione, che viene
+    accumulata durante la lettura.
+
+    Con la cache attiva la chiave si calcola prima di trascrivere, con una
+    passata di sola decodifica (dal FLAC se già presente, altrimenti dal
+    video, scrivendo intanto la copia FLAC).
+    """
+    folder = os.path.dirname(video_file)
+    csv_file_path = make_output_filename(video_file, 2, tag="raw_aligned", ext="csv")
+    flac_path = os.path.join(folder, "extracted_audio.flac") if config.AUDIO_STREAM_FLAC_COPY else None
+    sample_rate = config.AUDIO_SAMPLE_RATE
+
+    def decode():
+        # Dal FLAC completo di un'esecuzione precedente, altrimenti dal video scrivendo la copia
+        if flac_path and os.path.isfile(flac_path):
+            return stream_audio_from_video(flac_path, sample_rate)
+        return stream_audio_from_video(video_file, sample_rate, flac_path=flac_path)
+
+    cache = TranscriptionCache(config) if config.TRANSCRIPTION_CACHE_ENABLED else None
+    if cache is not None:
+        cache_key = cache.key_for_blocks(decode(), windowed=True)
+        if cache.restore(cache_key, csv_file_path):
+            print(f"Trascrizione recuperata dalla cache ({cache_key[:12]}): {csv_file_path}")
+            return csv_file_path
+
+    checkpoint = CheckpointStore(video_file, config) if config.STEP2_CHECKPOINTS else None
+    received_blocks = []
+
+    def blocks():
+        for block in decode():
+            if flac_path is None:
+                received_blocks.append(block)
+            yield block
+
+    def get_aligner(wait):
+        if not wait:
+            return None
+        # Lo stream è terminato: la copia FLAC (se richiesta) è completa
+        if flac_path:
+            audio = flac_path
+            samples = FlacSamples(flac_path)
+        else:
+            pcm = np.concatenate(received_blocks) if received_blocks else np.empty(0, dtype="<i2")
+            received_blocks.clear()
+            audio = samples = pcm_to_float(pcm)
+            del pcm
+        print(f"\nFase 3: Diarizzazione su {len(samples) / sample_rate:.0f} s di audio...")
+        diarization_segments = _diarize(audio, sample_rate, samples, checkpoint=checkpoint)
+        print(f"Diarizzazione completata. Trovati {len(diarization_segments)} segmenti di parlato.")
+        return SpeakerAligner(diarization_segments)
+
+    print("Fase 1-2: Decodifica con ffmpeg e trascrizione a finestre...")
+    if config.TRANSCRIBER_NUM_SHARDS > 1:
+        print("Attenzione: la modalità a shard richiede un WAV su disco, uso un solo processo.")
+    transcriber = Transcriber(config)
+    stream_windows = iter_stream_windows(
+        blocks(), sample_rate, window_s=config.STREAM_WINDOW_S, search_s=config.STREAM_SPLIT_SEARCH_S
+    )
+    windows = _report_repetition_loops(
+        transcriber, transcriber.transcribe_windows(stream_windows, sample_rate, checkpoint=checkpoint)
+    )
+    _write_rows_incrementally(csv_file_path, windows, get_aligner)
+
+    if cache is not None:
+        cache.store(cache_key, csv_file_path)
+    return csv_file_path
+
+
+def _run_batch(audio_file, csv_file_path):
+    """
+    Variante classica dello step 2: l'intero audio viene decodificato una
+    volta in memoria e passato in un'unica chiamata ai due modelli.
+    """
+    print("Fase 0: Decodifica audio in memoria...")
+    waveform, sample_rate = load_wav_waveform(audio_file)
+    print(f"Audio caricato: {len(waveform) / sample_rate:.0f} s a {sample_rate} Hz.")
+
+    if config.STEP2_CONCURRENT:
+        diarization_threads, transcription_threads = _torch_thread_split()
+        print(
+            "Fase 1-2: Diarizzazione e trascrizione in parallelo "
+            f"({diarization_threads} + {transcription_threads} thread CPU)..."
+        )
+        # Il processo di diarizzazione mappa il WAV per conto suo: il buffer non viene copiato
+        executor, diarization_future = _start_diarization_process(audio_file, diarization_threads)
+        try:
+            with _torch_threads(transcription_threads):
+                transcription_chunks = _transcribe(waveform, sample_rate, audio_file)
+            diarization_segments = diarization_future.result()
+            print(f"Diarizzazione completata. Trovati {len(diarization_segments)} segmenti di parlato.")
+        finally:
+            executor.shutdown(wait=True)
+    else:
+        print("Fase 1: Avvio diarizzazione (SpeakerDetector)...")
+        diarization_segments = _diarize(waveform, sample_rate, waveform)
+        print(f"Diarizzazione completata. Trovati {len(diarization_segments)} segmenti di parlato.")
+
+        print("\nFase 2: Avvio trascrizione (Pipeline Transformers)...")
+        print("La pipeline elaborerà l'intero file audio (potrebbe richiedere tempo)...")
+        transcription_chunks = _transcribe(waveform, sample_rate, audio_file)
 
-    transcription_chunks = transcription_result.get("chunks", [])
-    
     if not transcription_chunks:
         print("Errore: La trascrizione non ha restituito 'chunks'.")
-        print("Assicurati che 'return_timestamps=True' sia nella pipeline.")
-        return None, None
-        
+        print("Assicurati che 'TRANSCRIBER_TIMESTAMPS' sia True o \"word\" in config.py.")
+        return None
+
     print("Trascrizione completata.")
 
     print("\nFase 3: Allineamento Trascrizione e Diarizzazione...")
@@ -92,11 +400,36 @@ def run(audio_file):
 
     print("\nFase 4: Elaborazione e salvataggio dei risultati...")
 
-    csv_file_path = make_output_filename(audio_file, 2, tag="raw_aligned", ext="csv")
     with open(csv_file_path, "w", newline='', encoding="utf-8") as f:
         writer = csv.DictWriter(f, fieldnames=["speaker", "start_time", "end_time", "text"])
         writer.writeheader()
         writer.writerows(unmerged_results)
     print(f"Trascrizione allineata (non unita) salvata in: {csv_file_path}")
 
-    return csv_file_path
\ No newline at end of file
+    return csv_file_path
+
+
+def run(audio_file):
+
+    csv_file_path = make_output_filename(audio_file, 2, tag="raw_aligned", ext="csv")
+
+    # I checkpoint sono per finestra: richiedono la modalità a finestre
+    windowed = config.TRANSCRIPTION_STREAMING or config.STEP2_CHECKPOINTS
+
+    cache = TranscriptionCache(config) if config.TRANSCRIPTION_CACHE_ENABLED else None
+    if cache is not None:
+        pcm, _ = open_wav_pcm(audio_file)
+        cache_key = cache.key_for(pcm, windowed=windowed)
+        del pcm
+        if cache.restore(cache_key, csv_file_path):
+            print(f"Trascrizione recuperata dalla cache ({cache_key[:12]}): {csv_file_path}")
+            return csv_file_path
+
+    if windowed:
+        result = _run_streaming(audio_file, csv_file_path)
+    else:
+        result = _run_batch(audio_file, csv_file_path)
+
+    if cache is not None and result:
+        cache.store(cache_key, result)
+    return result
@@ -1,28 +1,60 @@
-from ..utils.file_utils import make_output_filename, load_text
-from ..utils.text_utils import clean_transcript_stage1, group_short_sentences
+from ..utils.file_utils import make_output_filename, load_text, iter_text_blocks
+from ..utils.text_utils import clean_transcript_stage1, group_short_sentences, load_sentence_segmenter, iter_sentences
 from ..modules.chunkers import TokenAwareSemanticChunker, chunk_text_by_tokens
+from ..modules.embedding_cache import EmbeddingCache
+from ..modules.batch_embedder import BatchEmbedder
+from ..modules.token_counter import get_token_counter
 from sentence_transformers import SentenceTransformer
 import pandas as pd
 import numpy as np
 import config
 import spacy
 
-def run(raw_transcription_csv):
-
-    text = load_text(raw_transcription_csv)
+def _cleaner_token_counter():
+    return get_token_counter(config.TOKENIZER_MODEL, hf_token=config.HF_TOKEN)
 
-    nlp = spacy.load(config.SPACY_MODEL) 
+def _build_chunker():
     embed_model = SentenceTransformer(config.EMBEDDING_MODEL)
-    simple_chunker = TokenAwareSemanticChunker(
+    token_counter = _cleaner_token_counter() if config.CHUNK_TOKENIZER == "cleaner" else None
+    return TokenAwareSemanticChunker(
     embedder_model=embed_model, 
     min_chunk_tokens=config.MIN_CHUNK_SIZE, 
-    max_chunk_tokens=config.MAX_CHUNK_SIZE
+    max_chunk_tokens=config.MAX_CHUNK_SIZE,
+    embedding_cache=EmbeddingCache(config) if config.EMBEDDING_CACHE_ENABLED else None,
+    batch_embedder=BatchEmbedder(embed_model, config.EMBEDDING_TOKEN_BUDGET, config.EMBEDDING_MAX_BATCH_SIZE),
+    token_counter=token_counter
     )
 
+def _check_cleaner_budget(chunks):
+    # Con il tokenizer del cleaner i conteggi sono esatti: segnala i chunk che
+    # non entrerebbero nel limite di token della risposta del LLM
+    if config.CHUNK_TOKENIZER != "cleaner":
+        return
+    counts = _cleaner_token_counter().count_many(chunks)
+    too_long = sum(count > config.MAX_TOKENS_CLEANER for count in counts)
+    if too_long:
+        print(f"Attenzione: {too_long} chunk superano MAX_TOKENS_CLEANER ({config.MAX_TOKENS_CLEANER} token)")
+
+def _load_nlp():
+    if config.SPACY_SEGMENTATION_ONLY:
+        return load_sentence_segmenter(config.SPACY_MODEL)
+    return spacy.load(config.SPACY_MODEL)
+
+def _load_sentences(raw_transcription_csv, nlp):
+    if config.SPACY_SEGMENTATION_ONLY:
+        # Le frasi arrivano una alla volta da nlp.pipe: nessun Doc unico da tutta la trascrizione
+        sentences = iter_sentences(
+            nlp, iter_text_blocks(raw_transcription_csv),
+            batch_size=config.SPACY_BATCH_SIZE, n_process=config.SPACY_N_PROCESS
+        )
+        return group_short_sentences(sentences)
+
+    text = load_text(raw_transcription_csv)
     doc = nlp(text)
-    sentences = group_short_sentences(doc)
+    return group_short_sentences(doc)
 
-    original_chunks = simple_chunker.split(sentences)
+def _write_chunks(raw_transcription_csv, original_chunks):
+    _check_cleaner_budget(original_chunks)
     data_pre_regex = {
     'chunk_id': range(1, len(original_chunks) + 1),  
     'text': original_chunks                       
@@ -44,4 +76,31 @@ def run(raw_transcription_csv):
     output_filename = make_output_filename(raw_transcription_csv, step = 3, tag = "chunked", ext = "csv")
     df_chunks.to_csv(output_filename, index=False, encoding='utf-8-sig')
 
-    return output_filename
\ No newline at end of file
+    return output_filename
+
+def run(raw_transcription_csv):
+
+    nlp = _load_nlp()
+    simple_chunker = _build_chunker()
+
+    sentences = _load_sentences(raw_transcription_csv, nlp)
+    original_chunks = simple_chunker.split(sentences)
+
+    return _write_chunks(raw_transcription_csv, original_chunks)
+
+def run_many(raw_transcription_csvs):
+    """
+    Step 3 su più lezioni: modelli caricati una sola volta e embedding di
+    tutte le frasi calcolati in un'unica passata a batch per lunghezza.
+    Restituisce i CSV chunked nello stesso ordine dell'input.
+    """
+    nlp = _load_nlp()
+    simple_chunker = _build_chunker()
+
+    sentence_lists = [_load_sentences(csv_file, nlp) for csv_file in raw_transcription_csvs]
+    chunk_lists = simple_chunker.split_many(sentence_lists)
+
+    return [
+        _write_chunks(csv_file, original_chunks)
+        for csv_file, original_chunks in zip(raw_transcription_csvs, chunk_lists)
+    ]
@@ -1,5 +1,10 @@
 import dspy
 from transcript_pipeline.modules.cleaner import Cleaner
+from transcript_pipeline.modules.llm_cache import LLMResponseCache
+from transcript_pipeline.modules.endpoint_pool import EndpointPool
+from transcript_pipeline.modules.request_packer import RequestPacker, prompt_overhead_tokens
+from transcript_pipeline.modules.token_counter import get_token_counter
+from transcript_pipeline.dspy_signatures import RiformulaStileNozionistico
 from transcript_pipeline.utils.file_utils import make_output_filename
 import config
 
@@ -9,19 +14,28 @@ def run(chunked_transcript_file: str):
     Restituisce il percorso del file di trascrizione pulito.
     """
     print("-> Configurazione del client DSPy per Ollama...")
-    lm_cleaner = dspy.LM(
-        model = config.CLEANER_MODEL_OLLAMA, 
-        api_base=config.OLLAMA_API_BASE, 
-        api_key=config.API_KEY, 
-        max_tokens=config.MAX_TOKENS_CLEANER,
-        temperature=config.TEMPERATURE_CLEANER
-    )
-    dspy.configure(lm=lm_cleaner)
+    # Un dspy.LM per endpoint (CLEANER_ENDPOINTS, oppure solo OLLAMA_API_BASE)
+    pool = EndpointPool(config)
+    print(f"   Endpoint del cleaner: {', '.join(endpoint.name for endpoint in pool.endpoints)}")
+    dspy.configure(lm=pool.endpoints[0].lm)
 
-    cleaner = Cleaner(config)
+    cache = LLMResponseCache(config) if config.LLM_CACHE_ENABLED else None
+    packer = None
+    if config.CLEANER_PACKING:
+        # Budget misurato con il tokenizer del LLM: MAX_TOKENS_CLEANER meno il prompt della signature
+        token_counter = get_token_counter(config.TOKENIZER_MODEL, hf_token=config.HF_TOKEN)
+        prompt_tokens = prompt_overhead_tokens(RiformulaStileNozionistico, token_counter)
+        packer = RequestPacker(token_counter, config.MAX_TOKENS_CLEANER, prompt_tokens, config.CLEANER_PACK_MIN_TOKENS)
+        print(f"   Budget per richiesta: {packer.budget} token (prompt: {prompt_tokens})")
+    cleaner = Cleaner(config, cache=cache, pool=pool, packer=packer)
 
     output_file_riformulato_csv = make_output_filename(chunked_transcript_file, 5, "cleaned_riformulato", ext = "csv")
     print(f"Avvio pulizia con LLM su: {chunked_transcript_file}")
     cleaner.clean_transcript(input_from_raw = chunked_transcript_file, output_file_riformulato_csv = output_file_riformulato_csv)
+    pool.report()
+    if cache is not None:
+        cache.report()
+        cache.evict()
+        cache.close()
     
     return output_file_riformulato_csv
\ No newline at end of file
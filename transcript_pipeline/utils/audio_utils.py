@@ -1,13 +1,31 @@
 import subprocess
+import struct
 import os
+import tempfile
+import wave
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+def _to_seconds(value):
+    """Secondi da un numero o da un timestamp ffmpeg "[HH:]MM:SS[.ms]"."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    seconds = 0.0
+    for part in str(value).strip().split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
 
 def build_cmd(template):
-    if template['start_time'] and template['end_time']:
+    if template['start_time'] is not None and template['end_time'] is not None:
+        # -ss prima di -i: ffmpeg salta direttamente al punto richiesto invece
+        # di decodificare tutto il file dall'inizio; i timestamp in uscita
+        # ripartono da zero, quindi la fine si esprime come durata (-t)
+        duration = _to_seconds(template['end_time']) - _to_seconds(template['start_time'])
         cmd = [
-            'ffmpeg', '-i', template['video_path'], 
+            'ffmpeg', '-ss', str(template['start_time']),
+            '-i', template['video_path'], 
             '-vn', 
-            '-ss', str(template['start_time']), 
-            '-to', str(template['end_time']),
+            '-t', f"{duration:.3f}",
             '-acodec', 'pcm_s16le', 
             '-ar', '16000', 
             '-ac', '1', 
@@ -49,4 +67,399 @@ def extract_audio_from_video(video_path, output_path = "audio_output", output_fo
         return output_file
     except subprocess.CalledProcessError as e:
         print(f"Error extracting audio: {e}")
-        return None
\ No newline at end of file
+        return None
+
+def probe_duration(media_path):
+    """Durata in secondi del file secondo ffprobe."""
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        media_path
+    ]
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    return float(result.stdout.strip())
+
+
+def _extract_segment(video_path, raw_path, sample_rate, start, num_samples):
+    # Ricerca lato input (-ss prima di -i) e durata espressa in campioni;
+    # num_samples=None lascia decodificare fino alla fine del file
+    cmd = ['ffmpeg', '-nostdin', '-y', '-ss', f"{start / sample_rate:.6f}", '-i', video_path, '-vn']
+    if num_samples is not None:
+        cmd += ['-t', f"{num_samples / sample_rate:.6f}"]
+    cmd += ['-f', 's16le', '-acodec', 'pcm_s16le', '-ar', str(sample_rate), '-ac', '1', raw_path]
+    subprocess.run(cmd, check=True, capture_output=True)
+
+
+def extract_audio_parallel(video_path, output_path="audio_output", num_workers=4, sample_rate=16000,
+                           block_s=60.0):
+    """
+    Estrae la traccia audio in WAV PCM 16 bit mono lanciando `num_workers`
+    processi ffmpeg su intervalli di tempo disgiunti.
+
+    I confini degli intervalli sono fissati in campioni: ogni segmento
+    (tranne l'ultimo) viene troncato o completato con silenzio esattamente
+    fino al confine successivo, così la concatenazione ha la stessa
+    lunghezza e gli stessi offset dell'estrazione in un unico processo.
+    """
+    if not os.path.isfile(video_path):
+        raise FileNotFoundError(f"The video file {video_path} does not exist.")
+
+    output_file = os.path.join(output_path, "extracted_audio.wav")
+    total = int(round(probe_duration(video_path) * sample_rate))
+    num_workers = max(1, min(num_workers, total // sample_rate or 1))
+    bounds = [total * k // num_workers for k in range(num_workers + 1)]
+
+    with tempfile.TemporaryDirectory(dir=output_path) as tmp_dir:
+        segments = []
+        for k in range(num_workers):
+            # L'ultimo segmento arriva fino alla fine reale dello stream audio,
+            # che può differire di qualche campione dalla durata del container
+            last = k == num_workers - 1
+            num_samples = None if last else bounds[k + 1] - bounds[k]
+            segments.append((os.path.join(tmp_dir, f"segment_{k}.pcm"), bounds[k], num_samples))
+
+        try:
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                list(executor.map(
+                    lambda segment: _extract_segment(video_path, segment[0], sample_rate, segment[1], segment[2]),
+                    segments
+                ))
+        except subprocess.CalledProcessError as e:
+            print(f"Error extracting audio: {e}")
+            return None
+
+        block_bytes = int(block_s * sample_rate) * 2
+        with wave.open(output_file, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            for raw_path, _, num_samples in segments:
+                remaining = None if num_samples is None else num_samples * 2
+                with open(raw_path, "rb") as f:
+                    while remaining is None or remaining > 0:
+                        data = f.read(block_bytes if remaining is None else min(block_bytes, remaining))
+                        if not data:
+                            break
+                        data = data[:len(data) - len(data) % 2]
+                        wav.writeframes(data)
+                        if remaining is not None:
+                            remaining -= len(data)
+                if remaining:
+                    # Segmento più corto del previsto: silenzio fino al confine
+                    wav.writeframes(bytes(remaining))
+
+    print(f"Audio extracted to {output_file} ({num_workers} ffmpeg workers)")
+    return output_file
+
+
+def open_wav_pcm(audio_path):
+    """
+    Mappa in memoria (sola lettura) i campioni PCM 16 bit mono di un file WAV.
+
+    Legge solo l'header RIFF per trovare il chunk "data"; i campioni non
+    vengono copiati ma letti su richiesta dalla page cache.
+
+    Args:
+        audio_path (str): Percorso del file WAV (come quello scritto da extract_audio_from_video).
+
+    Returns:
+        tuple[np.memmap, int]: Campioni int16 e frequenza di campionamento.
+    """
+    fmt = None
+    with open(audio_path, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise ValueError(f"{audio_path} non è un file WAV valido.")
+
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"Chunk 'data' non trovato in {audio_path}.")
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                f.seek(chunk_size - 16 + (chunk_size & 1), os.SEEK_CUR)
+            elif chunk_id == b"data":
+                data_offset = f.tell()
+                break
+            else:
+                f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+    if fmt is None:
+        raise ValueError(f"Chunk 'fmt ' non trovato in {audio_path}.")
+
+    audio_format, channels, sample_rate, _, _, bits_per_sample = fmt
+    if audio_format not in (1, 0xFFFE) or channels != 1 or bits_per_sample != 16:
+        raise ValueError(
+            f"Formato non supportato in {audio_path}: serve PCM 16 bit mono "
+            f"(trovato formato={audio_format}, canali={channels}, bit={bits_per_sample})."
+        )
+
+    # ffmpeg può lasciare una dimensione errata se interrotto: ci si limita al file
+    data_size = min(chunk_size, os.path.getsize(audio_path) - data_offset)
+    num_samples = data_size // 2
+
+    pcm = np.memmap(audio_path, dtype="<i2", mode="r", offset=data_offset, shape=(num_samples,))
+    return pcm, sample_rate
+
+
+def pcm_to_float(pcm, block_size=16000 * 60):
+    """
+    Converte campioni int16 in float32 normalizzati in [-1, 1).
+
+    La conversione avviene a blocchi direttamente nel buffer di destinazione,
+    così non si creano array temporanei grandi quanto l'intero audio.
+    Il buffer restituito è in sola lettura.
+    """
+    waveform = np.empty(len(pcm), dtype=np.float32)
+    for start in range(0, len(pcm), block_size):
+        end = start + block_size
+        np.multiply(pcm[start:end], 1.0 / 32768.0, out=waveform[start:end], casting="unsafe")
+    waveform.flags.writeable = False
+    return waveform
+
+
+def load_wav_waveform(audio_path):
+    """
+    Decodifica una sola volta il WAV a 16 kHz mono in un buffer float32 condiviso.
+
+    Il buffer può essere passato sia a pyannote sia alla pipeline ASR di
+    transformers senza ulteriori letture da disco o ricampionamenti.
+
+    Returns:
+        tuple[np.ndarray, int]: Forma d'onda float32 (sola lettura) e frequenza di campionamento.
+    """
+    pcm, sample_rate = open_wav_pcm(audio_path)
+    waveform = pcm_to_float(pcm)
+    del pcm
+    return waveform, sample_rate
+
+
+def find_quiet_point(pcm, sample_rate, target, search_s=10.0, frame_ms=100):
+    """
+    Cerca il punto di taglio più silenzioso nei `search_s` secondi che
+    precedono il campione `target`.
+
+    Serve a spezzare l'audio in finestre senza tagliare una parola a metà.
+
+    Returns:
+        int: Indice del campione (centro del frame con energia minima).
+    """
+    frame = max(1, int(sample_rate * frame_ms / 1000))
+    lo = max(0, target - int(search_s * sample_rate))
+    num_frames = (target - lo) // frame
+    if num_frames < 1:
+        return target
+
+    region = np.asarray(pcm[lo:lo + num_frames * frame], dtype=np.float32)
+    energy = np.square(region).reshape(num_frames, frame).mean(axis=1)
+    quietest = int(np.argmin(energy))
+    return lo + quietest * frame + frame // 2
+
+
+def iter_audio_windows(pcm, sample_rate, window_s=300.0, search_s=10.0):
+    """
+    Genera intervalli (start, end) in campioni che coprono tutto l'audio
+    con finestre di al massimo `window_s` secondi, tagliate nei punti
+    di silenzio trovati da find_quiet_point.
+    """
+    total = len(pcm)
+    window = int(window_s * sample_rate)
+    start = 0
+    while start < total:
+        end = start + window
+        if end >= total:
+            end = total
+        else:
+            end = find_quiet_point(pcm, sample_rate, end, search_s=min(search_s, window_s / 2))
+        yield start, end
+        start = end
+
+
+def stream_audio_from_video(video_path, sample_rate=16000, block_s=30.0, flac_path=None):
+    """
+    Decodifica l'audio con ffmpeg leggendo il PCM s16le mono direttamente
+    dallo stdout, senza scrivere un WAV intermedio.
+
+    Generatore di blocchi int16 di al massimo `block_s` secondi. Se
+    `flac_path` è indicato, la stessa invocazione di ffmpeg salva anche una
+    copia FLAC compressa (utile come cache per esecuzioni successive); la
+    copia compare con il nome finale solo se la decodifica termina senza errori.
+    """
+    if not os.path.isfile(video_path):
+        raise FileNotFoundError(f"The video file {video_path} does not exist.")
+
+    cmd = [
+        'ffmpeg', '-nostdin', '-y', '-i', video_path,
+        '-vn', '-f', 's16le', '-acodec', 'pcm_s16le',
+        '-ar', str(sample_rate), '-ac', '1', 'pipe:1'
+    ]
+    tmp_flac_path = flac_path + ".part" if flac_path else None
+    if flac_path:
+        cmd += ['-vn', '-f', 'flac', '-acodec', 'flac', '-ar', str(sample_rate), '-ac', '1', tmp_flac_path]
+
+    block_bytes = int(block_s * sample_rate) * 2
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            # Un eventuale byte dispari finale (stream troncato) viene scartato
+            yield np.frombuffer(data[:len(data) - len(data) % 2], dtype="<i2")
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+    if flac_path:
+        os.replace(tmp_flac_path, flac_path)
+
+
+class FlacSamples:
+    """
+    Campioni int16 di un FLAC mono letti su richiesta (con soundfile), da
+    usare al posto di un array mappato in memoria: supporta len() e lo
+    slicing contiguo, ogni slice decodifica solo il tratto richiesto.
+    """
+
+    def __init__(self, flac_path):
+        import soundfile
+        self._soundfile = soundfile
+        self.path = flac_path
+        info = soundfile.info(flac_path)
+        if info.channels != 1:
+            raise ValueError(f"{flac_path}: serve audio mono (trovati {info.channels} canali).")
+        self.sample_rate = info.samplerate
+        self._num_samples = info.frames
+
+    def __len__(self):
+        return self._num_samples
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            raise TypeError("FlacSamples supporta solo lo slicing contiguo.")
+        start, stop, step = index.indices(self._num_samples)
+        if step != 1:
+            raise ValueError("FlacSamples supporta solo lo slicing contiguo.")
+        with self._soundfile.SoundFile(self.path) as f:
+            f.seek(start)
+            return f.read(max(0, stop - start), dtype="int16")
+
+
+def iter_stream_windows(blocks, sample_rate, window_s=300.0, search_s=10.0):
+    """
+    Raggruppa i blocchi PCM in arrivo in finestre (start, campioni) con gli
+    stessi tagli di iter_audio_windows, tenendo in memoria al massimo una
+    finestra più un blocco.
+    """
+    window = int(window_s * sample_rate)
+    buffer = np.empty(0, dtype="<i2")
+    start = 0
+    for block in blocks:
+        buffer = np.concatenate((buffer, block))
+        while len(buffer) > window:
+            cut = find_quiet_point(buffer, sample_rate, window, search_s=min(search_s, window_s / 2))
+            yield start, buffer[:cut]
+            buffer = buffer[cut:]
+            start += cut
+    if len(buffer):
+        yield start, buffer
+
+
+def split_at_silence(pcm, sample_rate, num_shards, search_s=10.0):
+    """
+    Divide l'audio in `num_shards` intervalli (start, end) di durata simile,
+    spostando ogni confine sul punto più silenzioso nei dintorni.
+    """
+    total = len(pcm)
+    bounds = [0]
+    for k in range(1, num_shards):
+        target = total * k // num_shards
+        cut = find_quiet_point(pcm, sample_rate, target, search_s=search_s)
+        if cut > bounds[-1]:
+            bounds.append(cut)
+    bounds.append(total)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def detect_speech_regions(waveform, sample_rate, frame_ms=30, threshold_db=-40.0, speech_margin_db=30.0,
+                          min_silence_s=2.0, padding_s=0.3):
+    """
+    VAD a energia, leggero e solo CPU: individua le regioni di parlato.
+
+    Un frame è considerato silenzio solo se la sua energia è sia sotto
+    `threshold_db` (dBFS) sia almeno `speech_margin_db` sotto il livello
+    tipico del parlato (90° percentile dei frame), così le registrazioni
+    a basso volume non perdono il parlato più debole. Vengono scartati solo i silenzi più lunghi
+    di `min_silence_s`; ogni regione di parlato è estesa di `padding_s`.
+
+    Returns:
+        np.ndarray: Array (k, 2) di intervalli [start, end) in campioni.
+    """
+    frame = max(1, int(sample_rate * frame_ms / 1000))
+    num_frames = len(waveform) // frame
+    if num_frames == 0:
+        return np.array([[0, len(waveform)]], dtype=np.int64)
+
+    frames = np.asarray(waveform[:num_frames * frame], dtype=np.float32).reshape(num_frames, frame)
+    energy_db = 10.0 * np.log10(np.square(frames).mean(axis=1) + 1e-10)
+    speech_level = np.percentile(energy_db, 90)
+    silence_db = min(threshold_db, speech_level - speech_margin_db)
+    speech = energy_db > silence_db
+
+    # Inizio/fine delle sequenze di frame di parlato
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1) * frame
+    ends = np.flatnonzero(edges == -1) * frame
+    if len(starts) == 0:
+        return np.empty((0, 2), dtype=np.int64)
+    ends[-1] = len(waveform) if ends[-1] == num_frames * frame else ends[-1]
+
+    padding = int(padding_s * sample_rate)
+    starts = np.maximum(starts - padding, 0)
+    ends = np.minimum(ends + padding, len(waveform))
+
+    # Unisce le regioni separate da silenzi troppo brevi
+    min_silence = int(min_silence_s * sample_rate)
+    regions = [[starts[0], ends[0]]]
+    for start, end in zip(starts[1:], ends[1:]):
+        if start - regions[-1][1] < min_silence:
+            regions[-1][1] = max(regions[-1][1], end)
+        else:
+            regions.append([start, end])
+    return np.asarray(regions, dtype=np.int64)
+
+
+def remove_silence(waveform, sample_rate, regions):
+    """
+    Concatena le sole regioni di parlato e restituisce la mappa degli offset.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Audio compattato e mappa (k, 3) con
+        inizio nell'audio compattato, inizio nell'audio originale e durata,
+        tutti in secondi.
+    """
+    compact = np.concatenate([waveform[start:end] for start, end in regions])
+    durations = (regions[:, 1] - regions[:, 0]) / sample_rate
+    compact_starts = np.concatenate(([0.0], np.cumsum(durations)[:-1]))
+    offset_map = np.column_stack((compact_starts, regions[:, 0] / sample_rate, durations))
+    return compact, offset_map
+
+
+def restore_timestamp(t, offset_map, is_end=False):
+    """
+    Riporta un istante dell'audio compattato sulla timeline originale.
+
+    Un istante che cade esattamente sul confine tra due regioni viene
+    assegnato alla regione precedente se è la fine di un chunk.
+    """
+    if t is None:
+        return None
+    side = "left" if is_end else "right"
+    k = max(0, int(np.searchsorted(offset_map[:, 0], t, side=side)) - 1)
+    compact_start, original_start, duration = offset_map[k]
+    return float(original_start + min(max(t - compact_start, 0.0), duration))
@@ -3,6 +3,7 @@ import os
 import re
 import pandas as pd
 import subprocess
+from ..modules.token_counter import TokenCounter
 
 
 def load_text(input_file, column_name= "text", separator=' '):
@@ -46,6 +47,69 @@ def load_text(input_file, column_name= "text", separator=' '):
         return f"An unexpected error occurred: {e}" 
 
 
+def _split_long_text(text, max_chars):
+    # Taglia una riga più lunga di max_chars all'ultimo spazio disponibile
+    while len(text) > max_chars:
+        cut = text.rfind(' ', 0, max_chars + 1)
+        if cut <= 0:
+            cut = max_chars
+        yield text[:cut]
+        text = text[cut:].lstrip()
+    if text:
+        yield text
+
+
+def iter_text_blocks(input_file, column_name="text", separator=' ', block_chars=2000, rows_per_read=1000,
+                     max_chars=100_000):
+    """Legge il testo di una colonna CSV a blocchi, senza caricarlo tutto in memoria.
+
+    Le righe consecutive vengono unite con `separator` finché il blocco non
+    supera `block_chars` caratteri e termina con una punteggiatura di fine
+    frase, così le frasi spezzate tra due righe (chunk di Whisper) restano
+    nello stesso blocco. Se la punteggiatura manca il blocco viene comunque
+    chiuso a `max_chars` caratteri, così nessun blocco supera il limite di
+    spaCy (nlp.max_length) anche su trascrizioni senza punteggiatura.
+
+    Parameters
+    ----------
+    input_file : str
+        Il percorso del file CSV da leggere.
+    column_name : str, optional
+        Il nome della colonna da cui estrarre il testo. Il default è "text".
+    separator : str, optional
+        La stringa usata per unire le righe di un blocco. Il default è ' '.
+    block_chars : int, optional
+        Lunghezza minima indicativa (in caratteri) di un blocco. Il default è 2000.
+    rows_per_read : int, optional
+        Righe lette dal CSV per volta. Il default è 1000.
+    max_chars : int, optional
+        Lunghezza massima di un blocco; le singole righe più lunghe vengono
+        spezzate a uno spazio. Il default è 100000.
+
+    Yields
+    ------
+    str
+        Blocchi di testo consecutivi.
+    """
+    current = []
+    current_len = 0
+    for df in pd.read_csv(input_file, usecols=[column_name], chunksize=rows_per_read):
+        for row in df[column_name].astype(str):
+            for text in _split_long_text(row, max_chars):
+                if current and current_len + len(text) > max_chars:
+                    yield separator.join(current)
+                    current = []
+                    current_len = 0
+                current.append(text)
+                current_len += len(text) + len(separator)
+                if current_len >= block_chars and re.search(r'[.!?]\s*$', text):
+                    yield separator.join(current)
+                    current = []
+                    current_len = 0
+    if current:
+        yield separator.join(current)
+
+
 ###########################################################################################
 ################            Utilities Functions for file naming            ################
 ###########################################################################################
@@ -196,21 +260,31 @@ def sentences_selector(raw_transcript, nlp):
 ###########################################################################################
 
 
+def _as_token_counter(tokenizer):
+    if isinstance(tokenizer, TokenCounter):
+        return tokenizer
+    return TokenCounter(tokenizer=tokenizer)
+
+
 def count_tokens(text: str, tokenizer) -> int:
+    # tokenizer può essere un tokenizer Hugging Face o un TokenCounter (memoizzato)
+    if isinstance(tokenizer, TokenCounter):
+        return tokenizer.count(text)
     return len(tokenizer.encode(text, truncation=False))
 
 
 def chunk_sentences(sentences, max_tokens_chunk, tokenizer):
+    counter = _as_token_counter(tokenizer)
+    sentences = list(sentences)
     chunks = []
     cur = []
     cur_tokens = 0
-    for s in sentences:
-        t = count_tokens(s, tokenizer)
+    # Un'unica codifica batch per tutte le frasi
+    for s, t in zip(sentences, counter.count_many(sentences)):
         if t > max_tokens_chunk:
             half = len(s)//2
             s1, s2 = s[:half], s[half:]
-            for piece in [s1, s2]:
-                pt = count_tokens(piece, tokenizer)
+            for piece, pt in zip([s1, s2], counter.count_many([s1, s2])):
                 if cur_tokens + pt > max_tokens_chunk and cur:
                     chunks.append(" ".join(cur))
                     cur = []
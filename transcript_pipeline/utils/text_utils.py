@@ -1,6 +1,6 @@
-import tiktoken
 import re
 import spacy
+from ..modules.token_counter import get_token_counter
 
 def count_tokens_with_tiktoken(file_path, model_name="gpt-3.5-turbo"):
     """Calcola il numero di token in un file usando tiktoken di OpenAI.
@@ -21,13 +21,14 @@ def count_tokens_with_tiktoken(file_path, model_name="gpt-3.5-turbo"):
     """
     try:
 
-        encoding = tiktoken.encoding_for_model(model_name)
+        # Encoder tiktoken condiviso con il resto della pipeline (costruito una sola volta)
+        encoding = get_token_counter(model_name, backend="tiktoken").encoding
         
         with open(file_path, 'r', encoding='utf-8') as f:
             text = f.read()
             
 
-        tokens = encoding.encode(text)
+        tokens = encoding.encode(text, disallowed_special=())
         
         return len(tokens)  
     except FileNotFoundError:
@@ -156,15 +157,76 @@ def sentences_divider(text):
         
     return sentences
 
-def group_short_sentences(doc: spacy.tokens.Doc, min_words: int = 10) -> list[str]:
+# Componenti non necessari per la sola segmentazione in frasi
+_SEGMENTATION_EXCLUDE = [
+    "tok2vec", "morphologizer", "tagger", "parser", "lemmatizer",
+    "trainable_lemmatizer", "attribute_ruler", "ner", "entity_ruler"
+]
+
+def load_sentence_segmenter(model_name: str):
+    """
+    Carica una pipeline spaCy che esegue solo la segmentazione in frasi.
+
+    Esclude tagger, parser, NER e gli altri componenti (che non vengono
+    nemmeno caricati) e abilita il `senter` statistico del modello; se il
+    modello non lo include, usa il `sentencizer` basato su regole.
+
+    Parameters
+    ----------
+    model_name : str
+        Il nome del modello spaCy (es. "it_core_news_lg").
+
+    Returns
+    -------
+    spacy.language.Language
+        La pipeline di segmentazione.
+    """
+    nlp = spacy.load(model_name, exclude=_SEGMENTATION_EXCLUDE)
+    if "senter" in nlp.component_names:
+        nlp.enable_pipe("senter")
+    else:
+        nlp.add_pipe("sentencizer")
+    return nlp
+
+def iter_sentences(nlp, texts, batch_size: int = 64, n_process: int = 1):
+    """
+    Segmenta in frasi un flusso di testi con `nlp.pipe`, restituendole
+    una alla volta.
+
+    Ogni testo viene elaborato separatamente, quindi il limite
+    `nlp.max_length` vale per il singolo blocco e non per l'intera
+    trascrizione.
+
+    Parameters
+    ----------
+    nlp : spacy.language.Language
+        La pipeline (es. quella di load_sentence_segmenter).
+    texts : Iterable[str]
+        I blocchi di testo (es. da file_utils.iter_text_blocks).
+    batch_size : int, optional
+        Testi per batch di nlp.pipe. Il default è 64.
+    n_process : int, optional
+        Processi usati da nlp.pipe. Il default è 1.
+
+    Yields
+    ------
+    str
+        Le frasi, nell'ordine del testo.
+    """
+    for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process):
+        for sent in doc.sents:
+            yield sent.text
+
+def group_short_sentences(doc, min_words: int = 10) -> list[str]:
     """
     Raggruppa le frasi brevi identificate da spaCy per formare 
     unità di senso compiuto più lunghe.
 
     Parameters
     ----------
-    doc : spacy.tokens.Doc
-        Il documento spaCy processato.
+    doc : spacy.tokens.Doc or Iterable[str]
+        Il documento spaCy processato, oppure un iterabile di frasi
+        (es. quello restituito da iter_sentences), consumato man mano.
     min_words : int, optional
         La lunghezza minima approssimativa (in parole) per un gruppo 
         di frasi. Il default è 10.
@@ -178,8 +240,9 @@ def group_short_sentences(doc: spacy.tokens.Doc, min_words: int = 10) -> list[st
     grouped_sentences = []
     current_group = []
     
-    for sent in doc.sents:
-        sentence_text = sent.text.strip()
+    sentences = doc.sents if isinstance(doc, spacy.tokens.Doc) else doc
+    for sent in sentences:
+        sentence_text = (sent if isinstance(sent, str) else sent.text).strip()
         if not sentence_text:
             continue
             